@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Benchmark of 'global' broadcasts by the engine to 50, 200 and 500 sessions.
+
+The engine writes a broadcast to the pipe of every other session.  The
+cost of one broadcast is reported when pickled again for each recipient,
+as before, and when encoded once by :func:`x84.framing.encode` and the
+same frame written to every pipe by :func:`x84.terminal.send_tty`.
+
+Pipes are drained between broadcasts, outside of the time measured.
+
+Usage::
+
+    python bench/bench_broadcast.py [rounds]
+"""
+# std imports
+import multiprocessing
+import time
+import sys
+import os
+
+# run from a checkout, without installing.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# local
+from x84.framing import encode
+from x84.terminal import send_tty
+
+#: number of sessions of each measurement.
+SESSIONS = (50, 200, 500)
+
+#: (name, data) of each 'global' broadcast measured.
+PAYLOADS = (
+    ('AYT', ('AYT', 'telnet-192.168.1.12:50123')),
+    ('oneliner', ('oneliner', {
+        'oneliner': u'greetings from the other side of the modem! ' * 2,
+        'alias': u'biscuit', 'bbsname': u'x/84', 'timestamp': 1420070400.0,
+    })),
+)
+
+
+class TTY(object):
+
+    """ Engine side of a session's pipes. """
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.master_read, self.master_write = multiprocessing.Pipe(
+            duplex=False)
+
+    def drain(self):
+        """ Receive everything written, as the session would. """
+        while self.master_read.poll():
+            self.master_read.recv_bytes()
+
+    def close(self):
+        """ Close pipes. """
+        self.master_read.close()
+        self.master_write.close()
+
+
+def per_recipient(ttys, data):
+    """ Broadcast ``data``, pickled for each of ``ttys``. """
+    for tty in ttys:
+        tty.master_write.send(('global', data))
+
+
+def encoded_once(ttys, data):
+    """ Broadcast ``data``, encoded once for all of ``ttys``. """
+    frame = encode('global', data)
+    for tty in ttys:
+        send_tty(tty, 'global', frame=frame)
+
+
+def measure(broadcast, ttys, data, rounds):
+    """ Return average seconds of one broadcast to ``ttys``. """
+    elapsed = 0.0
+    for _ in xrange(rounds):
+        start = time.time()
+        broadcast(ttys, data)
+        elapsed += time.time() - start
+        for tty in ttys:
+            tty.drain()
+    return elapsed / rounds
+
+
+def main(rounds=200):
+    """ Report cost of one broadcast of each payload and session count. """
+    print('{0:<10} {1:>8} {2:>16} {3:>14} {4:>8}'.format(
+        'payload', 'sessions', 'per-recipient', 'encoded once', 'speedup'))
+    for num in SESSIONS:
+        ttys = [TTY('telnet-10.0.0.1:{0}'.format(idx))
+                for idx in range(num)]
+        try:
+            for name, data in PAYLOADS:
+                before = measure(per_recipient, ttys, data, rounds)
+                after = measure(encoded_once, ttys, data, rounds)
+                print('{0:<10} {1:>8} {2:>14.0f}us {3:>12.0f}us {4:>7.1f}x'
+                      .format(name, num, before * 1e6, after * 1e6,
+                              before / after))
+        finally:
+            for tty in ttys:
+                tty.close()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
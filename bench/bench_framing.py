@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark of IPC event framing, :mod:`x84.framing`, against pickle.
+
+Each kind of event is sent through a ``multiprocessing.Pipe`` to another
+process, using ``Connection.send()`` as sessions did before, and using
+:func:`x84.framing.send_event`.  Messages and payload bytes received each
+second are reported for both, including the cost of encoding output for
+the client, which framing moves from the engine to the session.
+
+Usage::
+
+    python bench/bench_framing.py [count]
+"""
+# std imports
+import multiprocessing
+import time
+import sys
+import os
+
+# run from a checkout, without installing.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# local
+from x84.framing import send_event, recv_event, encode
+
+#: (name, event, data, payload bytes) of each workload.
+WORKLOADS = (
+    ('keystroke', 'input', b'j', 1),
+    ('paste', 'input', b'x' * 512, 512),
+    ('echo', 'output', (u'\x1b[7;1H─' * 4, 'utf8'), 0),
+    ('redraw', 'output', (u'\x1b[1;1H' + u'░▒▓' * 2730,
+                          'cp437'), 0),
+    ('db', 'db-userbase', ('userbase', '__getitem__', ('sysop',)), 0),
+)
+
+
+def payload_size(event, data, size):
+    """ Return bytes of ``data`` the client or database is sent. """
+    if event == 'output':
+        ucs, encoding = data
+        return len(ucs.encode(encoding, 'replace'))
+    return size or len(encode(event, data))
+
+
+def receiver(conn, done, count, framed):
+    """ Receive ``count`` events from ``conn``, then signal ``done``. """
+    for _ in xrange(count):
+        if framed:
+            recv_event(conn)
+        else:
+            # output pickled is encoded for the client by the engine,
+            # framed output was encoded by the session.
+            event, data = conn.recv()
+            if event == 'output':
+                data[0].encode(data[1], 'replace')
+    done.send(True)
+
+
+def measure(event, data, count, framed):
+    """ Return seconds to send and receive ``count`` events. """
+    reader, writer = multiprocessing.Pipe(duplex=False)
+    wait, done = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=receiver,
+                                   args=(reader, done, count, framed))
+    proc.start()
+    start = time.time()
+    if framed:
+        for _ in xrange(count):
+            send_event(writer, event, data)
+    else:
+        for _ in xrange(count):
+            writer.send((event, data))
+    wait.recv()
+    elapsed = time.time() - start
+    proc.join()
+    return elapsed
+
+
+def main(count=20000):
+    """ Report messages and bytes per second of each workload. """
+    print('{0:<10} {1:<7} {2:>12} {3:>10} {4:>8}'.format(
+        'workload', 'path', 'msgs/sec', 'MB/sec', 'speedup'))
+    for name, event, data, size in WORKLOADS:
+        nbytes = payload_size(event, data, size) * count
+        results = list()
+        for path, framed in (('pickle', False), ('framed', True)):
+            elapsed = measure(event, data, count, framed)
+            results.append(elapsed)
+            print('{0:<10} {1:<7} {2:>12,.0f} {3:>10.2f} {4:>8}'.format(
+                name, path, count / elapsed, nbytes / elapsed / 2 ** 20,
+                '{0:.2f}x'.format(results[0] / elapsed) if framed else ''))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -13,7 +13,7 @@ from x84.bbs.exception import Disconnected, Goto
 from x84.bbs.ini import get_ini
 from x84.bbs.lightbar import Lightbar
 from x84.bbs.modem import send_modem, recv_modem
-from x84.bbs.msgbase import list_msgs, get_msg, list_tags, Msg
+from x84.bbs.msgbase import list_msgs, get_msg, get_msgs, list_tags, Msg
 from x84.bbs.output import (echo, timeago, encode_pipe, decode_pipe,
                             syncterm_setfont, showart, ropen,
                             from_cp437,  # deprecated in v2.0
@@ -25,14 +25,16 @@ from x84.bbs.session import (getsession, getterminal, getnode,
                              goto, disconnect, gosub,
                              getch,      # deprecated in v2.1
                              )
-from x84.bbs.userbase import list_users, get_user, find_user, User, Group
+from x84.bbs.userbase import (list_users, get_user, get_users, find_user,
+                              User, Group)
 
 # the scripting API is generally defined by this __all__ attribute, but
 # the real purpose of __all__ is defining what gets placed into a caller's
 # namespace when using statement `from x84.bbs import *`
-__all__ = ('list_users', 'get_user', 'find_user', 'User', 'Group', 'list_msgs',
-           'get_msg', 'list_tags', 'Msg', 'LineEditor', 'ScrollingEditor',
-           'echo', 'timeago', 'AnsiWindow', 'Selector', 'Disconnected', 'Goto',
+__all__ = ('list_users', 'get_user', 'get_users', 'find_user', 'User', 'Group',
+           'list_msgs', 'get_msg', 'get_msgs', 'list_tags', 'Msg',
+           'LineEditor', 'ScrollingEditor', 'echo', 'timeago', 'AnsiWindow',
+           'Selector', 'Disconnected', 'Goto',
            'Lightbar', 'from_cp437', 'DBProxy', 'Pager', 'Door', 'DOSDoor',
            'goto', 'disconnect', 'getsession', 'getterminal', 'getch', 'gosub',
            'ropen', 'showart', 'Dropfile', 'encode_pipe', 'getnode',
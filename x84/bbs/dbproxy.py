@@ -1,18 +1,175 @@
 """ Database proxy helper for x/84. """
 # std imports
+import collections
+import contextlib
+import threading
+import cPickle
 import logging
+import sqlite3
 
 # local
 from x84.bbs.ini import get_ini
 from x84.db import (
+    BATCH_METHODS,
+    CHANGED_TOPIC,
+    Transaction,
+    add_changes,
+    get_changed_keys,
+    get_connection,
     get_db_filepath,
     get_database,
     get_db_func,
-    get_db_lock,
+    key_of,
     log_db_cmd,
+    notify_changed,
+    release_database,
+    wait_written,
 )
 from x84.bbs.session import getsession
 
+#: transactions open in each thread, see :meth:`DBProxy.transaction`.
+TRANSACTIONS = threading.local()
+
+#: singleton instance of :class:`DBCache`.
+CACHE = None
+
+
+def get_transactions():
+    """
+    Return dictionary of schema to open transaction of the calling thread.
+
+    Each is a list of nesting depth, whether it must be rolled back, and,
+    when not run by the engine for a session, its sqlite connection and
+    dictionary of keys written, see :func:`x84.db.add_changes`.
+    """
+    if not hasattr(TRANSACTIONS, 'schemas'):
+        TRANSACTIONS.schemas = dict()
+    return TRANSACTIONS.schemas
+
+
+class DBCache(object):
+
+    """
+    Records read by :class:`DBProxy` in this session, least recently used
+    first, bounded by number of entries and bytes.
+
+    Records are kept pickled, so that each read returns a copy, as does a
+    request of the engine.  Keys not found are cached as well.  Entries are
+    discarded when written by this session, or on notice of changes
+    committed by others, see :func:`x84.db.notify_changed`.  A record of a
+    key whose notice arrives while it is requested is not cached, as the
+    reply may be of the record before that change.
+    """
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        #: index of (schema, table, key) to pickled record, None if not found.
+        self.entries = collections.OrderedDict()
+        #: total size of pickled records.
+        self.size = 0
+        #: schemas whose notices of changes are subscribed to.
+        self.schemas = set()
+        #: entries requested, see :meth:`request`, to whether a notice of
+        #: changes of it has arrived since.
+        self.pending = dict()
+        self.hits = self.misses = 0
+
+    @property
+    def enabled(self):
+        """ Whether any records may be cached. """
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, schema, table, key):
+        """
+        Returns tuple of whether ``key`` was found and its record, or None
+        if not cached.
+        """
+        entry = (schema, table, key_of(key))
+        if entry not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # most recently used last.
+        data = self.entries.pop(entry)
+        self.entries[entry] = data
+        if data is None:
+            return False, None
+        return True, cPickle.loads(data)
+
+    def request(self, schema, table, keys):
+        """ Note records of ``keys`` are requested, see :meth:`put`. """
+        for key in keys:
+            self.pending[(schema, table, key_of(key))] = False
+
+    def cancel(self, schema, table, keys):
+        """ Forget records of ``keys`` requested, once answered. """
+        for key in keys:
+            self.pending.pop((schema, table, key_of(key)), None)
+
+    def put(self, schema, table, key, found, value=None):
+        """
+        Cache record ``value`` of ``key``, or that it was not found, unless
+        changed since it was requested.
+        """
+        if self.pending.get((schema, table, key_of(key))):
+            return
+        data = None
+        if found:
+            data = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+            if len(data) > self.max_bytes:
+                return
+        entry = (schema, table, key_of(key))
+        self._discard(entry)
+        self.entries[entry] = data
+        self.size += len(data or '')
+        while (len(self.entries) > self.max_entries
+               or self.size > self.max_bytes):
+            _, data = self.entries.popitem(last=False)
+            self.size -= len(data or '')
+
+    def discard(self, schema, changes):
+        """
+        Discard records of dictionary ``changes`` of table name to keys,
+        or None for all of the table.
+        """
+        for table, keys in changes.items():
+            if keys is None:
+                for entry in [entry for entry in self.entries
+                              if entry[:2] == (schema, table)]:
+                    self._discard(entry)
+                for entry in self.pending:
+                    if entry[:2] == (schema, table):
+                        self.pending[entry] = True
+            else:
+                for key in keys:
+                    entry = (schema, table, key_of(key))
+                    self._discard(entry)
+                    if entry in self.pending:
+                        self.pending[entry] = True
+
+    def _discard(self, entry):
+        """ Discard record of ``entry``, if cached. """
+        if entry in self.entries:
+            self.size -= len(self.entries.pop(entry) or '')
+
+
+def get_db_cache():
+    """ Return the :class:`DBCache` of this session, created on first use. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global CACHE
+    if CACHE is None:
+        max_entries = get_ini(section='session', key='db_cache_entries',
+                              getter='getint')
+        max_bytes = get_ini(section='session', key='db_cache_bytes',
+                            getter='getint')
+        # 0 disables the cache, only a missing option is defaulted.
+        CACHE = DBCache(
+            max_entries=1024 if max_entries == u'' else max_entries,
+            max_bytes=1048576 if max_bytes == u'' else max_bytes)
+    return CACHE
+
 
 class DBProxy(object):
 
@@ -20,9 +177,19 @@ class DBProxy(object):
     Provide dictionary-like object interface to shared database.
 
     A database call, such as __len__() or keys() is issued as a command
-    to the main engine when ``use_session`` is True, which spawns a thread
-    to acquire a lock on the database and return the results via IPC pipe
-    transfer.
+    to the main engine when ``use_session`` is True, which runs it in a
+    database worker thread and returns the results via IPC pipe transfer.
+
+    Methods :meth:`get_many`, :meth:`contains_many`, :meth:`set_many` and
+    :meth:`delete_many` operate on many keys in a single call.
+
+    Calls made within :meth:`transaction`, or a ``with`` block of the
+    proxy itself, are made in a single sqlite transaction that excludes
+    writers of all other sessions and processes.  A single call, or those
+    of many keys, such as :meth:`set_many`, need none.
+
+    Outside of a transaction, records read by key by a session, such as by
+    :meth:`get`, are cached by the session, see :class:`DBCache`.
     """
 
     def __init__(self, schema, table='unnamed', use_session=True):
@@ -59,15 +226,32 @@ class DBProxy(object):
 
     def proxy_method_direct(self, method, *args):
         """ Proxy for direct dictionary method calls. """
-        dictdb = get_database(filepath=get_db_filepath(self.schema),
-                              table=self.table)
+        keys = get_changed_keys(method, args)
+        opened = get_transactions().get(self.schema)
+        if opened is not None:
+            trans = Transaction(opened[2].cursor(), self.table)
+            if self._tap_db:
+                log_db_cmd(self.log, self.schema, method, args)
+            result = get_db_func(trans, method)(*args)
+            add_changes(opened[3], self.table, keys)
+            return result
+
+        filepath = get_db_filepath(self.schema)
+        dictdb = get_database(filepath=filepath, table=self.table)
         try:
             func = get_db_func(dictdb, method)
             if self._tap_db:
                 log_db_cmd(self.log, self.schema, method, args)
-            return func(*args)
+            result = func(*args)
+            if keys is None or keys:
+                if method not in BATCH_METHODS:
+                    wait_written(dictdb)
+                changes = dict()
+                add_changes(changes, self.table, keys)
+                notify_changed(None, self.schema, changes)
+            return result
         finally:
-            dictdb.close()
+            release_database(filepath=filepath, table=self.table)
 
     def proxy_iter(self, method, *args):
         """ Proxy for iterable dictionary method calls. """
@@ -86,39 +270,163 @@ class DBProxy(object):
     def proxy_method_session(self, method, *args):
         """ Proxy for dictionary method calls over IPC pipe. """
         event = 'db-{0}'.format(self.schema)
+        keys = get_changed_keys(method, args)
+        if CACHE is not None and (keys is None or keys):
+            changes = dict()
+            add_changes(changes, self.table, keys)
+            CACHE.discard(self.schema, changes)
         self.session.send_event(event, (self.table, method, args))
         return self.session.read_event(event)
 
-    def acquire(self):
-        """ Acquire system-wide lock on database. """
-        lock = get_db_lock(schema=self.schema, table=self.table)
+    def get_cache(self):
+        """
+        Return :class:`DBCache` of the session, or None when records are
+        not cached: not used by a session, disabled, or in a transaction.
+        """
+        if not self.session or self.schema in get_transactions():
+            return None
+        cache = get_db_cache()
+        return cache if cache.enabled else None
+
+    def proxy_read_cached(self, cache, keys):
+        """
+        Returns dictionary of ``keys`` found to their value, requesting
+        only those not cached by ``cache``.
+        """
+        # apply notices of changes that have arrived.
+        self.session.poll_events()
+        found, missing = dict(), list()
+        for key in keys:
+            cached = cache.get(self.schema, self.table, key)
+            if cached is None:
+                missing.append(key)
+            elif cached[0]:
+                found[key] = cached[1]
+        if missing:
+            if self.schema not in cache.schemas:
+                # subscribed before the request, so that no notice of a
+                # change committed after it is answered is missed.
+                self.session.subscribe(CHANGED_TOPIC.format(self.schema))
+                cache.schemas.add(self.schema)
+            cache.request(self.schema, self.table, missing)
+            try:
+                records = self.proxy_method_session('get_many', missing)
+                for key in missing:
+                    cache.put(self.schema, self.table, key,
+                              key in records, records.get(key))
+            finally:
+                cache.cancel(self.schema, self.table, missing)
+            found.update(records)
+        return found
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        Context manager running calls made within it in one transaction.
+
+        The schema is locked for writing, by ``BEGIN IMMEDIATE``, until
+        the block is exited, when changes are committed, or rolled back on
+        error.  Meanwhile, calls of other sessions for this schema that
+        write wait, so that a read-modify-write sequence, such as choosing
+        the next key, is not raced, while those that only read are answered
+        with data last committed.  Keep it brief, with no input or output
+        of the terminal within it: a transaction left idle by a session is
+        rolled back by the engine, see
+        :attr:`x84.db.DBWorkerPool.TRANSACTION_TIMEOUT`.
+
+        Transactions of a schema may be nested, only the outermost commits,
+        and an inner one rolled back rolls back the outermost.
+        """
+        self.begin()
+        try:
+            yield self
+        # pylint: disable=W0702
+        #         No exception type(s) specified
+        except:
+            self.rollback()
+            raise
+        self.commit()
+
+    def begin(self):
+        """ Begin transaction, to be ended by :meth:`commit` or rollback. """
+        opened = get_transactions()
+        if self.schema in opened:
+            opened[self.schema][0] += 1
+            return
+        conn = None
+        if self.session:
+            self.proxy_method_session('begin')
+        else:
+            conn = get_connection(get_db_filepath(self.schema))
+            conn.execute('BEGIN IMMEDIATE')
+        opened[self.schema] = [1, False, conn, dict()]
+        if self._tap_db:
+            self.log.debug('transaction begin schema=%s', self.schema)
+
+    def commit(self):
+        """ Commit transaction of :meth:`begin`. """
+        self._end(rollback=False)
+
+    def rollback(self):
+        """ Roll back transaction of :meth:`begin`. """
+        self._end(rollback=True)
+
+    def _end(self, rollback):
+        """ End transaction, when outermost. """
+        opened = get_transactions()
+        trans = opened[self.schema]
+        trans[0] -= 1
+        trans[1] = trans[1] or rollback
+        if trans[0]:
+            return
+        del opened[self.schema]
+        method = 'rollback' if trans[1] else 'commit'
         if self._tap_db:
-            self.log.debug('lock acquire schema=%s, table=%s',
-                           self.schema, self.table)
-        lock.acquire()
+            self.log.debug('transaction %s schema=%s', method, self.schema)
+        if self.session:
+            self.proxy_method_session(method)
+            return
+        conn = trans[2]
+        try:
+            conn.execute(method.upper())
+        except sqlite3.Error:
+            # a commit that failed leaves the transaction open.
+            conn.rollback()
+            raise
+        if method == 'commit':
+            notify_changed(None, self.schema, trans[3])
+
+    def acquire(self):
+        """ Begin transaction, see :meth:`transaction`. """
+        self.begin()
 
     def release(self):
-        """ Release system-wide lock on database. """
-        lock = get_db_lock(schema=self.schema, table=self.table)
-        if self._tap_db:
-            self.log.debug('lock release schema=%s, table=%s',
-                           self.schema, self.table)
-        lock.release()
+        """ Commit transaction, see :meth:`transaction`. """
+        self.commit()
 
     def __enter__(self):
-        self.acquire()
+        self.begin()
         return self
 
     def __exit__(self, exc_type, exc_value, exc_traceback):
-        self.release()
+        self._end(rollback=exc_type is not None)
 
     # pylint: disable=C0111
     #        Missing docstring
     def __contains__(self, key):
+        cache = self.get_cache()
+        if cache is not None:
+            return key in self.proxy_read_cached(cache, [key])
         return self.proxy_method('__contains__', key)
     __contains__.__doc__ = dict.__contains__.__doc__
 
     def __getitem__(self, key):
+        cache = self.get_cache()
+        if cache is not None:
+            found = self.proxy_read_cached(cache, [key])
+            if key not in found:
+                raise KeyError(key)
+            return found[key]
         return self.proxy_method('__getitem__', key)
     __getitem__.__doc__ = dict.__getitem__.__doc__
 
@@ -131,11 +439,14 @@ class DBProxy(object):
     __delitem__.__doc__ = dict.__delitem__.__doc__
 
     def get(self, key, default=None):
+        cache = self.get_cache()
+        if cache is not None:
+            return self.proxy_read_cached(cache, [key]).get(key, default)
         return self.proxy_method('get', key, default)
     get.__doc__ = dict.get.__doc__
 
     def has_key(self, key):
-        return self.proxy_method('has_key', key)
+        return self.__contains__(key)
     has_key.__doc__ = dict.has_key.__doc__
 
     def setdefault(self, key, value):
@@ -182,6 +493,30 @@ class DBProxy(object):
         return self.proxy_method('popitem')
     popitem.__doc__ = dict.popitem.__doc__
 
+    def get_many(self, keys):
+        """
+        Returns dictionary of ``keys`` found to their value, in one request.
+        """
+        cache = self.get_cache()
+        if cache is not None:
+            return self.proxy_read_cached(cache, list(keys))
+        return self.proxy_method('get_many', list(keys))
+
+    def contains_many(self, keys):
+        """ Returns set of ``keys`` found, in one request. """
+        return self.proxy_method('contains_many', list(keys))
+
+    def set_many(self, mapping):
+        """
+        Set value of each key of dictionary ``mapping`` in one request,
+        and one transaction.
+        """
+        return self.proxy_method('set_many', dict(mapping))
+
+    def delete_many(self, keys):
+        """ Delete ``keys`` in one request, and one transaction. """
+        return self.proxy_method('delete_many', list(keys))
+
     def copy(self):
         # https://github.com/piskvorky/sqlitedict/issues/20
         # @jquast: should sqlitedict have a .copy() method? "no."
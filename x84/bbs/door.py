@@ -41,17 +41,20 @@ class Dropfile(object):
     #: Dropfile type constants
     (DOORSYS, DOOR32, CALLINFOBBS, DORINFO) = range(4)
 
-    def __init__(self, filetype=None):
+    def __init__(self, filetype=None, node=None):
         """
         Class constructor.
 
         :param int filetype: dropfile type. One of ``Dropfile.DOORSYS``,
                              ``Dropfile.DOOR32``, ``Dropfile.CALLINFOBBS``,
                              or ``Dropfile.DORINFO``.
+        :param int node: node number, such as of a door's node pool,
+                         default is the session's node.
         """
         assert filetype in (self.DOORSYS, self.DOOR32,
                             self.CALLINFOBBS, self.DORINFO)
         self.filetype = filetype
+        self._node = node
 
     def save(self, folder):
         """ Save dropfile to destination ``folder`` """
@@ -62,6 +65,8 @@ class Dropfile(object):
     @property
     def node(self):
         """ User's node number. """
+        if self._node is not None:
+            return self._node
         return getsession().node
 
     @property
@@ -782,14 +787,10 @@ def launch(dos=None, cp437=True, drop_type=None,
             assert name is not None, (
                 'name required for door using node pools')
 
-            for node in range(nodes if nodes is not None else dosnodes):
-                event = 'lock-%s/%d' % (name, node)
-                session.send_event(event, ('acquire', None))
-                data = session.read_event(event)
-
-                if data is True:
-                    strnode = str(node + 1)
-                    break
+            node = session.acquire_node(
+                name, count=nodes if nodes is not None else dosnodes, first=0)
+            if node is not None:
+                strnode = str(node + 1)
 
             if strnode is None:
                 logger.warn('No virtual nodes left in pool: %s', name)
@@ -871,7 +872,8 @@ def launch(dos=None, cp437=True, drop_type=None,
                 if not os.path.isabs(drop_folder):
                     drop_folder = os.path.join(dosdropdir, drop_folder)
 
-                Dropfile(getattr(Dropfile, drop_type)).save(drop_folder)
+                Dropfile(getattr(Dropfile, drop_type),
+                         node=int(strnode)).save(drop_folder)
 
             door = None
 
@@ -901,7 +903,5 @@ def launch(dos=None, cp437=True, drop_type=None,
                 term.inkey(timeout=0.25)
 
             if name is not None and drop_type:
-                session.send_event(
-                    event='lock-%s/%d' % (name, int(strnode) - 1),
-                    data=('release', None))
+                session.release_lock('%s/%d' % (name, int(strnode) - 1))
                 logger.info('Released virtual node %s-%s', name, strnode)
@@ -120,6 +120,14 @@ def init_bbs_ini():
     cfg_bbs.set('system', 'datapath', os.path.expanduser(os.path.join(
         os.path.join('~', '.x84', 'data'))))
     cfg_bbs.set('system', 'timeout', '1984')
+    # number of engine processes, see x84/shard.py
+    cfg_bbs.set('system', 'shards', '1')
+    # number of pre-forked session workers, see x84/prefork.py
+    cfg_bbs.set('system', 'prefork', '0')
+    # seconds an unused database connection is kept open, see x84/db.py
+    cfg_bbs.set('system', 'db_idle', '300')
+    # number of threads running database requests of sessions
+    cfg_bbs.set('system', 'db_workers', '4')
 
     try:
         # pylint: disable=W0612
@@ -218,6 +226,12 @@ def init_bbs_ini():
     cfg_bbs.set('session', 'tap_output', 'no')
     cfg_bbs.set('session', 'tap_events', 'no')
     cfg_bbs.set('session', 'tap_db', 'no')
+    cfg_bbs.set('session', 'output_buffer', '4096')
+    cfg_bbs.set('session', 'output_ring', '0')
+    cfg_bbs.set('session', 'log_batch', '64')
+    cfg_bbs.set('session', 'log_ring', '0')
+    cfg_bbs.set('session', 'db_cache_entries', '1024')
+    cfg_bbs.set('session', 'db_cache_bytes', '1048576')
     cfg_bbs.set('session', 'default_encoding', 'utf8')
 
     cfg_bbs.add_section('irc')
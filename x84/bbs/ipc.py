@@ -1,22 +1,35 @@
 """ Session IPC package for x/84. """
 # std imports
+import collections
 import logging
 
 # local
 from x84.bbs.session import getsession
 
 
-def make_root_logger(out_queue):
+def make_root_logger(out_queue, levels=None):
     """
     Remove and re-address the root logging handler.
 
     Any existing handlers of the current process are removed and
     the root logger is re-address to send via an IPC output event
     queue.
+
+    :param dict levels: logger name to level, as returned by
+                        :func:`x84.terminal.get_log_levels`: records
+                        that the engine would discard are not created.
     """
+    from x84.bbs.ini import get_ini
     root = logging.getLogger()
     map(root.removeHandler, root.handlers)
-    root.addHandler(IPCLogHandler(out_queue=out_queue))
+    for name, level in (levels or {}).items():
+        logging.getLogger(name).setLevel(level)
+    root.addHandler(IPCLogHandler(
+        out_queue=out_queue,
+        batch_size=get_ini(section='session', key='log_batch',
+                           getter='getint') or 64,
+        ring_size=get_ini(section='session', key='log_ring',
+                          getter='getint') or 0))
 
 
 class IPCLogHandler(logging.Handler):
@@ -27,12 +40,25 @@ class IPCLogHandler(logging.Handler):
     This is a rather novel solution that seems overlooked in documentation,
     a forked process must have some method to propagate its logging records
     up through the main process, otherwise they are lost.
+
+    Records are sent in batches, as a list, once ``batch_size`` records
+    are buffered, a record of level WARNING or higher is emitted, or
+    :meth:`flush` is called -- the session flushes before waiting for
+    input.
+
+    Given a ``ring_size``, records below level WARNING are not sent at all,
+    only the last ``ring_size`` of them are kept, and sent ahead of the
+    next record of level WARNING or higher, as its context.
     """
 
-    def __init__(self, out_queue):
+    def __init__(self, out_queue, batch_size=0, ring_size=0):
         """ Constructor method, requires multiprocessing.Pipe. """
         logging.Handler.__init__(self)
         self.oqueue = out_queue
+        self.batch_size = batch_size
+        self.ring = (collections.deque(maxlen=ring_size)
+                     if ring_size > 0 else None)
+        self._buffer = list()
 
     def emit(self, record):
         """ Emit log record via IPC output queue. """
@@ -43,16 +69,45 @@ class IPCLogHandler(logging.Handler):
                 # sets record.exc_text
                 dummy = self.format(record)  # NOQA
                 record.exc_info = None
+            # merge arguments, which may not be picklable, or may change
+            # before the record is sent, with message.
+            record.msg = record.getMessage()
+            record.args = None
             record.handle = None
             session = getsession()
             if session:
                 record.handle = session.handle
-            self.oqueue.send(('logger', record))
+            if self.ring is not None and record.levelno < logging.WARNING:
+                self.ring.append(record)
+                return
+            if self.ring:
+                self._buffer.extend(self.ring)
+                self.ring.clear()
+            self._buffer.append(record)
+            if (len(self._buffer) >= self.batch_size or
+                    record.levelno >= logging.WARNING):
+                self.flush()
         except (KeyboardInterrupt, SystemExit):
             raise
         except Exception:
             self.handleError(record)
 
+    def flush(self):
+        """ Send records buffered via IPC output queue. """
+        self.acquire()
+        try:
+            if not self._buffer:
+                return
+            records, self._buffer = self._buffer, list()
+            try:
+                self.oqueue.send(('logger', records))
+            except (KeyboardInterrupt, SystemExit):
+                raise
+            except Exception:
+                self.handleError(records[-1])
+        finally:
+            self.release()
+
 
 class IPCStream(object):
 
@@ -63,25 +118,70 @@ class IPCStream(object):
     is polled for output in x84.engine.  Only the ``write()`` method of
     this "stream" and ``is_a_tty`` attribute is called or evaluated by
     blessed.Terminal.  The attribute ``is_a_tty`` is mocked as ``True``.
+
+    Output is coalesced: consecutive writes of the same encoding are sent
+    as a single 'output' event once ``buffer_size`` characters are
+    buffered, or when :meth:`flush` is called.  The session flushes before
+    waiting for input or sending any other event.
+
+    When given a shared-memory ``ring`` (:class:`x84.ring.OutputRing`),
+    output is written there, encoded, and only a doorbell is sent.
     """
 
-    def __init__(self, writer):
+    def __init__(self, writer, buffer_size=0, ring=None):
         self.writer = writer
         self.is_a_tty = True
+        self.buffer_size = buffer_size
+        self.ring = ring
+        self._buffer = list()
+        self._length = 0
+        self._encoding = None
+
+        # whether output is sent by pipe until the ring is emptied.
+        self._bypass_ring = False
 
     def write(self, ucs, encoding='ascii'):
         """
-        Sends unicode text to Pipe.
+        Buffers unicode text for Pipe.
 
         Default encoding is 'ascii', which is unset only when used
         with blessings, which rarely writes directly to the stream
         (context managers, such as "with term.location(0, 0):" have
         such side effects).
         """
+        if encoding != self._encoding:
+            self.flush()
+            self._encoding = encoding
+
         # wrap 'ucs' with call to 'unicode()', so that special unicode
         # instances such as blessed.formatters.ParameterizingProxyString
         # can be pickled -- as this one in particular contains a local
         # function (lambda) as an attribute -- which would fail:
         # PicklingError: Can't pickle <type 'function'>: attribute
         #                lookup __builtin__.function failed
-        self.writer.send(('output', (unicode(ucs), encoding)))
+        ucs = unicode(ucs)
+        self._buffer.append(ucs)
+        self._length += len(ucs)
+        if self._length >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """ Sends buffered unicode text to Pipe. """
+        if not self._buffer:
+            return
+        from x84.framing import send_event
+        ucs = u''.join(self._buffer)
+        self._buffer = list()
+        self._length = 0
+        if self.ring is not None:
+            if self._bypass_ring and self.ring.empty():
+                self._bypass_ring = False
+            if not self._bypass_ring:
+                data = ucs.encode(self._encoding, 'replace')
+                if self.ring.write(data):
+                    send_event(self.writer, 'output-ring', len(data))
+                    return
+                # no room: send by pipe, and keep doing so until the engine
+                # has answered every doorbell sent, emptying the ring.
+                self._bypass_ring = True
+        send_event(self.writer, 'output', (ucs, self._encoding))
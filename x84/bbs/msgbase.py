@@ -55,13 +55,21 @@ def get_msg(idx=0):
     return DBProxy(MSGDB)['%d' % int(idx)]
 
 
+def get_msgs(indices):
+    """
+    Return dictionary of index to Msg record instance for ``indices``,
+    in one request.  Indices not found are omitted.
+    """
+    msgs = DBProxy(MSGDB).get_many('%d' % int(idx) for idx in indices)
+    return dict((int(key), msg) for key, msg in msgs.items())
+
+
 def list_msgs(tags=None):
     """ Return set of indicies matching ``tags``, or all by default. """
     if tags is not None and 0 != len(tags):
         msgs = set()
-        db_tag = DBProxy(TAGDB)
-        for tag in (_tag for _tag in tags if _tag in db_tag):
-            msgs.update(db_tag[tag])
+        for tagged in DBProxy(TAGDB).get_many(tags).values():
+            msgs.update(tagged)
         return msgs
     return set(int(key) for key in DBProxy(MSGDB).keys())
 
@@ -214,17 +222,15 @@ class Msg(object):
             # server networks offered by this server,
             # message is for a network we host
             if tag in get_ini(section='msg', key='server_tags', split=True):
-                with DBProxy('{0}trans'.format(tag)) as transdb:
-                    self.body = u''.join((self.body, format_origin_line()))
-                    self.save()
-                    transdb[self.idx] = self.idx
+                self.body = u''.join((self.body, format_origin_line()))
+                self.save()
+                DBProxy('{0}trans'.format(tag))[self.idx] = self.idx
                 log.info('[{tag}] Stored for network (msgid {self.idx}).'
                          .format(tag=tag, self=self))
 
             # server networks this server is a member of,
             # message is for a another network, queue for delivery
             elif tag in get_ini(section='msg', key='network_tags', split=True):
-                with DBProxy('{0}queues'.format(tag)) as queuedb:
-                    queuedb[self.idx] = tag
+                DBProxy('{0}queues'.format(tag))[self.idx] = tag
                 log.info('[{tag}] Message (msgid {self.idx}) queued '
                          'for delivery'.format(tag=tag, self=self))
@@ -70,6 +70,28 @@ def gosub(script, *args, **kwargs):
     return getsession().runscript(script)
 
 
+def load_script_module(script_path):
+    """
+    Return package of scripts of folder ``script_path``, such as
+    'default', imported once by each process.
+    """
+    folder_name = os.path.basename(script_path)
+    module = sys.modules.get(folder_name)
+    if (module is not None and
+            getattr(module, '__path__', None) == script_path):
+        return module
+
+    # put it in sys.path for relative imports
+    if script_path not in sys.path:
+        sys.path.insert(0, script_path)
+
+    # discover import path to __init__.py, load as 'default',
+    lookup = imp.find_module('__init__', [script_path])
+    module = imp.load_module(folder_name, *lookup)
+    module.__path__ = script_path
+    return module
+
+
 class Session(object):
 
     """
@@ -162,6 +184,9 @@ class Session(object):
         # create event buffer
         self._buffer = dict()
 
+        # topics subscribed to
+        self._topics = set()
+
     def to_dict(self):
         """
         Returns a dictionary containing information about this session object.
@@ -229,6 +254,7 @@ class Session(object):
                 'xterm' in kind or 'rxvt' in kind
                 or '_xtitle' in self.env))
             self._activity = value
+            self.update_presence(activity=value)
             if set_title:
                 self.write(u''.join((
                     unichr(27), u']2;%s' % (value,), unichr(7))))
@@ -254,6 +280,7 @@ class Session(object):
         #         Missing docstring
         self.log.info("user {!r} -> {!r}".format(self._user, value.handle))
         self._user = value
+        self.update_presence(handle=value.handle)
 
     @property
     def encoding(self):
@@ -272,6 +299,7 @@ class Session(object):
                            .format(self.encoding, value))
             self.env['encoding'] = value
             getterminal().set_keyboard_decoder(value)
+            self.update_presence(encoding=value)
 
     @property
     def pid(self):
@@ -286,13 +314,9 @@ class Session(object):
         Returns numeric constant for session, often required by 'doors'
         """
         if self._node is None:
-            for node in range(1, 64):
-                event = 'lock-%s/%d' % ('node', node)
-                self.send_event(event, ('acquire', None))
-                data = self.read_event(event)
-                if data is True:
-                    self._node = node
-                    break
+            self._node = self.acquire_node('node', count=63)
+            if self._node is not None:
+                self.update_presence(node=self._node)
         return self._node
 
     @property
@@ -341,17 +365,7 @@ class Session(object):
     def script_module(self):
         """ base module location of self.script_path """
         if self._script_module is None:
-            # load default/__init__.py as 'default',
-            folder_name = os.path.basename(self.script_path)
-
-            # put it in sys.path for relative imports
-            if self.script_path not in sys.path:
-                sys.path.insert(0, self.script_path)
-
-            # discover import path to __init__.py, store result
-            lookup = imp.find_module('__init__', [self.script_path])
-            self._script_module = imp.load_module(folder_name, *lookup)
-            self._script_module.__path__ = self.script_path
+            self._script_module = load_script_module(self.script_path)
         return self._script_module
 
     def __error_recovery(self):
@@ -386,6 +400,12 @@ class Session(object):
         Scripts manipulate control flow of scripts using goto and gosub.
         """
         from x84.bbs.exception import Goto, Disconnected
+
+        # make this session known to the engine's who's online registry.
+        attrs = self.info()
+        attrs.pop('idle')
+        self.update_presence(**attrs)
+
         while len(self._script_stack):
             self.log.debug('script_stack is {self._script_stack!r}'
                            .format(self=self))
@@ -443,6 +463,18 @@ class Session(object):
         if self.log.isEnabledFor(logging.DEBUG) and self.tap_output:
             self.log.debug('--> {!r}'.format(ucs))
 
+    def flush(self):
+        """
+        Send any output buffered by :meth:`write` to the client.
+
+        Output is flushed automatically when waiting for input or any other
+        event, a script should only need to call this before sleeping.
+        Log records batched for the engine are sent, too.
+        """
+        self.terminal.stream.flush()
+        for handler in logging.getLogger().handlers:
+            handler.flush()
+
     def flush_event(self, event):
         """
         Flush all return all data buffered for 'event'.
@@ -479,7 +511,7 @@ class Session(object):
         """
         Push data into buffer keyed by event. Handle special events:
         'exception', 'global' AYT (are you there), 'page', 'info-req',
-        'refresh', and 'input'.
+        'refresh', 'input', and 'db-changed-<schema>'.
         """
         # exceptions aren't buffered; they are thrown!
         if event == 'exception':
@@ -490,7 +522,8 @@ class Session(object):
         # these callback-responsive session events should be handled by
         # another method, or by a configurable 'event: callback' registration
         # system.
-        # respond to global 'AYT' requests
+        # respond to global 'AYT' requests, of scripts that do not yet
+        # use get_presence().
         if event == 'global' and data[0] == 'AYT':
             reply_to = data[1]
             self.send_event('route', (
@@ -498,6 +531,13 @@ class Session(object):
                 self.sid, self.user.handle,))
             return True
 
+        # notices of changes committed to databases, discarding records
+        # cached, see x84.bbs.dbproxy.DBCache.
+        if event.startswith('db-changed-'):
+            from x84.bbs.dbproxy import get_db_cache
+            get_db_cache().discard(event[len('db-changed-'):], data)
+            return True
+
         # accept 'gosub' as a literal command to run a new script directly
         # from this buffer_event method.  I'm sure it's fine ...
         if event == 'gosub':
@@ -549,6 +589,8 @@ class Session(object):
             if data[0] == 'resize':
                 # inherit terminal dimensions values
                 (self.terminal.columns, self.terminal.rows) = data[1]
+                self.update_presence(LINES=self.terminal.height,
+                                     COLUMNS=self.terminal.width)
 
         # buffer all else
         self._buffer[event].appendleft(data)
@@ -589,11 +631,128 @@ class Session(object):
                'logger': Data is logging record, used by IPCLogHandler.
                'output': Unicode data to write to client.
                'global': Broadcast event to other sessions.
+               'subscribe', 'unsubscribe': See :meth:`subscribe`.
+               'publish': Send event to subscribers, see :meth:`publish`.
+               'presence': Update session attributes for who's online.
+               'presence-req': Request who's online, see :meth:`get_presence`.
                'db-<schema>': Request sqlite dict method result.
                'db=<schema>': Request sqlite dict method result as iterable.
-               'lock-<name>': Fine-grained global bbs locking.
+               'lock-<name>': Fine-grained global bbs locking, see
+                              :meth:`acquire_lock`.
+
+           Any buffered output is flushed first, so that events are
+           received by the engine in the order they were written.
+        """
+        from x84.framing import send_event
+        if event != 'output':
+            self.flush()
+        send_event(self.writer, event, data)
+
+    def subscribe(self, topic):
+        """
+        Receive events published by other sessions for ``topic``.
+
+        Such events are received as event ``topic``, by :meth:`read_event`
+        and others, until :meth:`unsubscribe` is called.
+        """
+        if topic not in self._topics:
+            self._topics.add(topic)
+            self.send_event('subscribe', topic)
+
+    def unsubscribe(self, topic):
+        """
+        Stop receiving events published for ``topic``, discarding any
+        already received but not yet read.
+        """
+        if topic in self._topics:
+            self._topics.discard(topic)
+            self.send_event('unsubscribe', topic)
+            self._buffer.pop(topic, None)
+
+    def publish(self, topic, data=True):
+        """
+        Send event ``(topic, data)`` to all other sessions subscribed to
+        ``topic``, unlike 'global' events, which are sent to every session.
+        """
+        self.send_event('publish', (topic, data))
+
+    def start_timer(self, event, delay, data=True):
+        """
+        Receive event ``(event, data)`` in ``delay`` seconds, by
+        :meth:`read_event` and others.
+
+        The timer is kept by the engine, replacing any other of the same
+        ``event``, and is cancelled when the session ends.
         """
-        self.writer.send((event, data))
+        self.send_event('timer-start', (event, delay, data))
+
+    def stop_timer(self, event):
+        """
+        Cancel timer started by :meth:`start_timer`, discarding its event
+        if already received but not yet read.
+        """
+        self.send_event('timer-stop', event)
+        self._buffer.pop(event, None)
+
+    def acquire_lock(self, name, timeout=0, stale=None):
+        """
+        Acquire bbs-global lock ``name``, returns True if acquired.
+
+        :param float timeout: when held by another session, seconds to wait
+                              in line for it to be released: 0 does not
+                              wait, None waits indefinitely.
+        :param float stale: acquire anyway when held by another session
+                            for longer than this many seconds.
+        """
+        event = 'lock-{0}'.format(name)
+        self.send_event(event, ('acquire', stale, timeout))
+        return self.read_event(event)
+
+    def release_lock(self, name):
+        """
+        Release bbs-global lock ``name``, acquired by :meth:`acquire_lock`.
+
+        Locks held are also released when the session ends.
+        """
+        self.send_event('lock-{0}'.format(name), ('release', None))
+
+    def acquire_node(self, pool, count, first=1):
+        """
+        Acquire lowest free node number of ``pool`` in one request,
+        returns None if all ``count`` nodes from ``first`` are in use.
+
+        The node is the bbs-global lock ``'<pool>/<node>'``, released by
+        :meth:`release_lock`, or when the session ends.
+        """
+        event = 'lock-{0}'.format(pool)
+        self.send_event(event, ('allocate', first, count))
+        return self.read_event(event)
+
+    def get_node_map(self, pool='node'):
+        """
+        Returns dictionary of node number of ``pool`` to session-id of
+        the session holding it.
+        """
+        event = 'lock-{0}'.format(pool)
+        self.send_event(event, ('map', None))
+        return self.read_event(event)
+
+    def update_presence(self, **attrs):
+        """
+        Update session attributes kept by the engine for who's online.
+
+        Handle, activity, node, script, encoding and terminal size are
+        updated automatically as they change.
+        """
+        self.send_event('presence', attrs)
+
+    def get_presence(self):
+        """
+        Returns dictionary of session-id to attributes of all sessions
+        online, as returned by :meth:`info`.
+        """
+        self.send_event('presence-req', None)
+        return self.read_event('presence')
 
     def poll_event(self, event):
         """
@@ -602,6 +761,14 @@ class Session(object):
         """
         return self.read_event(event, timeout=-1)
 
+    def poll_events(self):
+        """
+        Buffer all events received, without waiting.
+        """
+        from x84.framing import recv_event
+        while self.reader.poll():
+            self.buffer_event(*recv_event(self.reader))
+
     def read_event(self, event, timeout=None):
         """
         S.read_event (event, timeout=None) --> data
@@ -638,6 +805,11 @@ class Session(object):
             timeout if timeout < 0 else
             timeout - (time.time() - cmp_time))
 
+        # send any buffered output before waiting for a reply or input.
+        self.flush()
+
+        from x84.framing import recv_event
+
         # begin scanning for matching `events' up to timeout.
         stime = time.time()
         # XXX poll is needed because of timeout=-1, shit.
@@ -645,7 +817,7 @@ class Session(object):
         while waitfor is None or waitfor > 0:
             # ask engine process for new event data,
             if self.reader.poll(waitfor):
-                event, data = self.reader.recv()
+                event, data = recv_event(self.reader)
                 # it is necessary to always buffer an event, as some
                 # side-effects may occur by doing so.  When buffer_event
                 # returns True, those side-effects caused no data to be
@@ -667,6 +839,7 @@ class Session(object):
 
         self.log.info("runscript {0!r}".format(script.name))
         self._script_stack.append(script)
+        self.update_presence(script=script.name)
 
         # if given a script name such as 'extras.target', adjust the lookup
         # path to be extended by {default_scriptdir}/extras, and adjust
@@ -698,8 +871,10 @@ class Session(object):
         value = module.main(*script.args, **script.kwargs)
 
         # remove the current script from the script stack, since it has
-        # finished executing.
+        # finished executing, and return to the script that called it.
         self._script_stack.pop()
+        if len(self._script_stack):
+            self.update_presence(script=self.current_script.name)
 
         return value
 
@@ -708,6 +883,4 @@ class Session(object):
         Close session.
         """
         if self._node is not None:
-            self.send_event(
-                event='lock-node/%d' % (self._node),
-                data=('release', None))
+            self.release_lock('node/{0}'.format(self._node))
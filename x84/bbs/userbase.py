@@ -24,6 +24,14 @@ def get_user(handle):
     return DBProxy(USERDB)[handle]
 
 
+def get_users(handles):
+    """
+    Returns dictionary of handle to User record for ``handles``, in one
+    request.  Handles not found are omitted.
+    """
+    return DBProxy(USERDB).get_many(handles)
+
+
 def find_user(handle):
     """
     Given handle, discover and return matching database key case insensitively.
@@ -210,15 +218,14 @@ class User(object):
         #        Missing docstring
         from x84.bbs import ini
         log = logging.getLogger(__name__)
-        adb = DBProxy(USERDB, 'attrs')
-
-        if self.handle not in adb:
+        # a single lookup, answered by the session's cache when it may.
+        attrs = DBProxy(USERDB, 'attrs').get(self.handle)
+        if attrs is None:
             if ini.CFG.getboolean('session', 'tap_db'):
                 log.debug('User({!r}).get(key={!r}) returns default={!r}'
                           .format(self.handle, key, default))
             return default
 
-        attrs = adb.get(self.handle, {})
         if key not in attrs:
             if ini.CFG.getboolean('session', 'tap_db'):
                 log.debug('User({!r}.get(key={!r}) returns default={!r}'
@@ -2,11 +2,11 @@
 Base classes for clients and connections.
 """
 
-import array
+import collections
+import itertools
 import errno
 import logging
 import socket
-import threading
 import time
 import warnings
 
@@ -15,6 +15,67 @@ from x84.bbs.exception import Disconnected
 from .terminal import spawn_client_session
 
 
+class SendBuffer(object):
+
+    """
+    Queue of bytestrings buffered for sending to a client.
+
+    Data is never copied to be buffered.  Chunks are queued as given, and
+    a partial send only advances an offset into the first chunk.
+    """
+
+    #: chunks smaller than this are joined into a single send(),
+    #: larger chunks are sent directly from a memoryview.
+    COALESCE = 16384
+
+    def __init__(self):
+        self._chunks = collections.deque()
+        self._offset = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def append(self, data):
+        """ Buffer bytestring ``data``. """
+        if data:
+            self._chunks.append(data)
+            self._length += len(data)
+
+    def view(self):
+        """
+        Return a memoryview of the bytes to send next.
+
+        Several small chunks are joined, so that a screen drawn by many
+        small writes is sent by a single call to send().
+        """
+        head = self._chunks[0]
+        size = len(head) - self._offset
+        if size >= self.COALESCE or len(self._chunks) == 1:
+            return memoryview(head)[self._offset:]
+        parts = [head[self._offset:]]
+        for chunk in itertools.islice(self._chunks, 1, None):
+            if size + len(chunk) > self.COALESCE:
+                break
+            parts.append(chunk)
+            size += len(chunk)
+        return memoryview(b''.join(parts))
+
+    def consume(self, num_bytes):
+        """ Discard ``num_bytes`` sent from the front of the buffer. """
+        self._length -= num_bytes
+        offset = self._offset + num_bytes
+        while self._chunks and offset >= len(self._chunks[0]):
+            offset -= len(self._chunks.popleft())
+        self._offset = offset
+
+    def clear(self):
+        """ Discard all buffered bytes. """
+        self._chunks.clear()
+        self._offset = 0
+        self._length = 0
+
+
 class BaseClient(object):
 
     '''
@@ -26,12 +87,26 @@ class BaseClient(object):
     #: connecting protocol (for example, 'telnet', 'ssh', 'rlogin')
     kind = None
 
-    #: maximum unit of data received for each call to socket_recv()
+    #: minimum unit of data received for each call to socket_recv(),
     BLOCKSIZE_RECV = 64
 
+    #: which grows under sustained input up to this maximum.
+    BLOCKSIZE_RECV_MAX = 65536
+
     #: terminal type identifier when not yet negotiated
     TTYPE_UNDETECTED = 'unknown'
 
+    #: whether fileno() may be polled by the engine for write-readiness
+    #: when output could not be sent in full.
+    POLL_WRITABLE = True
+
+    #: size of send_buffer at which the engine stops reading further
+    #: output from the client's session,
+    SEND_HIGH_WATER = 65536
+
+    #: and the size it must drain to before reading resumes.
+    SEND_LOW_WATER = 16384
+
     def __init__(self, sock, address_pair, on_naws=None):
         self.log = logging.getLogger(self.__class__.__name__)
         self.sock = sock
@@ -43,8 +118,10 @@ class BaseClient(object):
                          ('COLUMNS', 80),
                          ('connection-type', self.kind),
                          ])
-        self.send_buffer = array.array('c')
-        self.recv_buffer = array.array('c')
+        self.send_buffer = SendBuffer()
+        self.recv_buffer = bytearray()
+        self.recv_size = self.BLOCKSIZE_RECV
+        self._recv_into = bytearray(self.BLOCKSIZE_RECV)
         self.bytes_received = 0
         self.connect_time = time.time()
         self.last_input_time = time.time()
@@ -70,27 +147,28 @@ class BaseClient(object):
         """
         Return True if any data is buffered for reading (keyboard input).
         """
-        return bool(self.recv_buffer.__len__())
+        return bool(len(self.recv_buffer))
 
     def recv_ready(self):
         """
-        Subclass and implement: returns True if socket_recv() should be called.
+        Returns True if socket_recv() should be called.
+
+        Readiness is that found by the engine's most recent poll, no
+        system call is made.
         """
-        raise NotImplementedError()
+        from x84.poller import get_poller
+        return self.is_active() and get_poller().is_readable(self.fileno())
 
     def send(self):
         """
         Called by Server.poll() when send data is ready.  Send any data
-        buffered, trim self.send_buffer to bytes sent, and return number of
-        bytes sent.  Throws Disconnected
+        buffered until the socket would block, trim self.send_buffer to
+        bytes sent, and return number of bytes sent.  Throws Disconnected
         """
         if not self.send_ready():
             warnings.warn('send() called on empty buffer', RuntimeWarning, 2)
             return 0
 
-        ready_bytes = bytes(''.join(self.send_buffer))
-        self.send_buffer = array.array('c')
-
         def _send(send_bytes):
             """
             throws x84.bbs.exception.Disconnected on sock.send err
@@ -104,17 +182,22 @@ class BaseClient(object):
                     return 0
                 raise Disconnected('send: {0}'.format(err))
 
-        sent = _send(ready_bytes)
-        if sent < len(ready_bytes):
-            # re-buffer data that could not be pushed to socket;
-            self.send_buffer.fromstring(ready_bytes[sent:])
-        return sent
+        total = 0
+        while self.send_ready():
+            ready_bytes = self.send_buffer.view()
+            sent = _send(ready_bytes)
+            self.send_buffer.consume(sent)
+            total += sent
+            if sent < len(ready_bytes):
+                # socket buffer is full, remaining data stays buffered.
+                break
+        return total
 
     def send_ready(self):
         """
         Return True if any data is buffered for sending (screen output).
         """
-        return bool(self.send_buffer.__len__())
+        return bool(len(self.send_buffer))
 
     def shutdown(self):
         """
@@ -136,21 +219,51 @@ class BaseClient(object):
         Receive data from the client socket and returns num bytes received.
         """
         try:
-            data = self.sock.recv(self.BLOCKSIZE_RECV)
-            recv = len(data)
-            if recv == 0:
-                raise Disconnected('Closed by client (EOF)')
-
+            data = self._recv()
         except socket.error as err:
             if err.errno == errno.EWOULDBLOCK:
                 return 0
             raise Disconnected('socket_recv error: {0}'.format(err))
 
+        recv = len(data)
         self.bytes_received += recv
         self.last_input_time = time.time()
-        self.recv_buffer.fromstring(data)
+        self.recv_buffer.extend(data)
         return recv
 
+    def _recv(self):
+        """
+        Receive from socket into a buffer preallocated for this client.
+
+        Returns a memoryview of bytes received, valid only until the next
+        call.  Throws Disconnected on EOF.
+        """
+        if len(self._recv_into) < self.recv_size:
+            self._recv_into = bytearray(self.recv_size)
+        view = memoryview(self._recv_into)
+        recv = self.sock.recv_into(view, self.recv_size)
+        if recv == 0:
+            raise Disconnected('Closed by client (EOF)')
+        self._adjust_recv_size(recv)
+        return view[:recv]
+
+    def _adjust_recv_size(self, recv):
+        """
+        Adjust size of the next receive by ``recv``, bytes last received.
+
+        The size doubles each time a receive fills it, such as during a
+        file upload or paste, and halves when little is received, such as
+        for keyboard input.
+        """
+        if recv >= self.recv_size:
+            self.recv_size = min(self.recv_size * 2, self.BLOCKSIZE_RECV_MAX)
+        elif recv < self.recv_size // 4:
+            self.recv_size = max(self.recv_size // 2, self.BLOCKSIZE_RECV)
+            if (self.recv_size == self.BLOCKSIZE_RECV and
+                    len(self._recv_into) > self.BLOCKSIZE_RECV):
+                # idle again, release a large buffer.
+                self._recv_into = bytearray(self.BLOCKSIZE_RECV)
+
     # high level I/O
 
     def get_input(self):
@@ -158,23 +271,28 @@ class BaseClient(object):
         Get any input bytes received from the DE. The input_ready method
         returns True when bytes are available.
         """
-        data = self.recv_buffer.tostring()
-        self.recv_buffer = array.array('c')
+        data = bytes(self.recv_buffer)
+        del self.recv_buffer[:]
         return data
 
     def send_str(self, bstr):
         """
         Buffer bytestring for client.
         """
-        self.send_buffer.fromstring(bstr)
+        self.send_buffer.append(bstr)
 
     def send_unicode(self, ucs, encoding='utf8'):
         """
         Buffer unicode string, encoded for client as 'encoding'.
         """
+        self.send_encoded(ucs.encode(encoding, 'replace'))
+
+    def send_encoded(self, bstr):
+        """
+        Buffer bytestring of text already encoded for client.
+        """
         # Must be escaped 255 (IAC + IAC) to avoid IAC intepretation
-        self.send_str(ucs.encode(encoding, 'replace')
-                      .replace(chr(255), 2 * chr(255)))
+        self.send_str(bstr.replace(chr(255), 2 * chr(255)))
 
     # activity
 
@@ -188,9 +306,12 @@ class BaseClient(object):
         """
         Flag client for disconnection.
         """
+        from x84.poller import get_poller
         if self.active:
             self.active = False
             self.log.debug('{self.addrport}: deactivated'.format(self=self))
+            # wake the engine loop, it disposes of inactive clients.
+            get_poller().wakeup()
 
     def idle(self):
         """
@@ -214,48 +335,138 @@ class BaseClient(object):
         return '%s:%d' % (self.address_pair[0], self.address_pair[1])
 
 
-class BaseConnect(threading.Thread):
+class BaseConnect(object):
 
     '''
     Base class for client connect factories.
+
+    On-connect negotiation is a state machine driven by the engine's main
+    loop, so that pending negotiations cost no threads.  :meth:`start` is
+    called once the client is accepted, then :meth:`step` each time the
+    client receives data, when :attr:`deadline` is reached, as scheduled
+    on the engine's timer wheel, or when woken by another thread using
+    :meth:`wake`, until the negotiation is :attr:`stopped`.
     '''
 
     #: for x/y/z-modem transfers? -- unused.
     is_binary = True
 
-    # whether this thread is completed. Set to ``True`` to cause an on-connect
-    # thread to forcefully exit early, such as when the server is shutdown.
+    # whether this negotiation is completed. Set to ``True`` to cause an
+    # on-connect negotiation to forcefully exit early, such as when the
+    # server is shutdown.
     stopped = False
 
+    #: time at which :meth:`step` should be called even without input,
+    #: None to wait for input only.
+    deadline = None
+
+    # timer of the engine's timer wheel calling :meth:`step` at deadline.
+    _timer = None
+
+    #: set by :meth:`wake`, :meth:`step` is called by the engine's next pass.
+    woken = False
+
     def __init__(self, client):
         """
         client is a telnet.TelnetClient instance.
         """
         self.client = client
-        threading.Thread.__init__(self)
+        self.name = '{0}-{1}'.format(self.__class__.__name__,
+                                     client.addrport)
         self.log = logging.getLogger(self.__class__.__name__)
 
+        #: keyword arguments of matrix script, set by :meth:`negotiate`.
+        self.matrix_kwargs = None
+
+        #: time negotiation began.
+        self.start_time = None
+
     def banner(self):
         """
         Negotiate protocol options or advertise protocol banner.
         """
         pass
 
-    def run(self):
+    def begin(self):
+        """
+        Set tcp socket options and send banner.
+        """
+        self._set_socket_opts()
+        self.banner()
+
+    def negotiate(self):
+        """
+        Advance negotiation, return True when completed.
+
+        Subclass and implement: Return False to wait for more input or for
+        :attr:`deadline`, raise an exception to fail negotiation.
+        """
+        return True
+
+    def start(self):
+        """
+        Begin negotiation.
+        """
+        self.start_time = time.time()
+        self._advance(self.begin)
+
+    def step(self):
+        """
+        Continue negotiation, spawning a new session once completed.
+        """
+        self._advance(None)
+
+    def wake(self):
+        """
+        Have the engine's main loop call :meth:`step`, from any thread.
+
+        Used by protocols negotiated in threads of their own, such as
+        those of ssh transports.
+        """
+        from x84.poller import get_poller
+        self.woken = True
+        get_poller().wakeup()
+
+    def _advance(self, func):
         """
-        Negotiate and inquire about terminal type, telnet options, window size,
-        and tcp socket options before spawning a new session.
+        Call ``func``, if any, and :meth:`negotiate`, handling the outcome.
         """
-        from x84.bbs.exception import Disconnected
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self.stopped:
+            return
+        self.deadline = None
+        self.woken = False
         try:
-            self._set_socket_opts()
-            self.banner()
-            if self.client.is_active():
-                return spawn_client_session(client=self.client)
+            if func is not None:
+                func()
+            if not self.client.is_active():
+                raise Disconnected('client deactivated')
+            if self.negotiate():
+                self.stopped = True
+                if self.client.is_active():
+                    spawn_client_session(client=self.client,
+                                         matrix_kwargs=self.matrix_kwargs)
+                    return
+            else:
+                if self.deadline is not None:
+                    from x84.timers import get_timer_wheel
+                    self._timer = get_timer_wheel().schedule_at(
+                        self.deadline, self.step)
+                return
         except (Disconnected, socket.error) as err:
-            self.log.debug('Connection closed: %s', err)
-        finally:
-            self.stopped = True
+            self.log.debug('{client.addrport}: connection closed: {err}'
+                           .format(client=self.client, err=err))
+        except EOFError:
+            self.log.debug('{client.addrport}: EOF from client'
+                           .format(client=self.client))
+        # pylint: disable=W0703
+        #         Catching too general exception
+        except Exception as err:
+            self.log.debug('{client.addrport}: connection closed: {err}'
+                           .format(client=self.client, err=err))
+        self.stopped = True
         self.client.deactivate()
 
     def _set_socket_opts(self):
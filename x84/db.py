@@ -1,9 +1,43 @@
-""" Database engine-request handler for x/84. """
+"""
+Database engine-request handler for x/84.
+
+Databases are kept open by the engine in a pool, see :class:`DatabasePool`,
+rather than opened and closed for every request.  Each is a
+``sqlitedict.SqliteDict`` whose requests are served, in order, by its own
+thread, so that one may be shared by all threads of the engine, see
+:class:`PooledDict`.  Connections wait up to :data:`BUSY_TIMEOUT` seconds
+for the write lock of another.
+
+Requests of sessions are queued by schema, and run by a fixed number of
+worker threads, see :class:`DBWorkerPool`.  Requests of the same schema
+are run one at a time, in the order received.
+
+Operations on many keys, such as ``get_many``, run in a single sqlite
+transaction by their own connection, see :class:`Transaction`.
+
+A session may open a transaction of a schema, see
+:meth:`x84.bbs.dbproxy.DBProxy.transaction`.  Its requests are then run in
+a single sqlite transaction, ``BEGIN IMMEDIATE``, until committed or rolled
+back, see :class:`SessionTransaction`.  Meanwhile, requests of other
+sessions for that schema that write wait in line, while those that only
+read, see :data:`READ_METHODS`, are run against data last committed.
+
+Keys written are published to sessions subscribed to topic
+:data:`CHANGED_TOPIC` of their schema once committed, see
+:func:`notify_changed`, so that sessions may cache records they read, see
+:class:`x84.bbs.dbproxy.DBCache`.
+"""
 # std imports
 import multiprocessing
+import collections
+import contextlib
+import functools
 import threading
+import UserDict
 import logging
+import sqlite3
 import errno
+import time
 import os
 
 # local
@@ -13,22 +47,261 @@ from x84.bbs.ini import get_ini
 import sqlitedict
 
 FILELOCK = multiprocessing.Lock()
-DATALOCK = {}
 
+#: singleton instance of :class:`DatabasePool`.
+POOL = None
 
-def get_database(filepath, table):
+#: singleton instance of :class:`DBWorkerPool`.
+WORKERS = None
+
+#: sqlite connections of each thread, see :func:`get_connection`.
+CONNECTIONS = threading.local()
+
+#: seconds a connection waits for the write lock held by another, such as
+#: by a session's transaction, before failing with "database is locked".
+#: Longer than :attr:`DBWorkerPool.TRANSACTION_TIMEOUT`, so that writers
+#: outlast a transaction left idle.
+BUSY_TIMEOUT = 30
+
+#: changes committed, to be published by the engine, see
+#: :func:`notify_changed`.
+CHANGES = collections.deque()
+
+#: topic of notices of changes committed to a schema.
+CHANGED_TOPIC = 'db-changed-{0}'
+
+#: methods of :class:`Transaction` that may be requested of a database,
+#: and whether they write.
+BATCH_METHODS = {
+    'get_many': False,
+    'contains_many': False,
+    'set_many': True,
+    'delete_many': True,
+}
+
+#: methods of a database that only read, which are not held back by the
+#: transaction of another session, see :class:`DBWorkerPool`.
+READ_METHODS = frozenset((
+    '__contains__', '__getitem__', '__len__', 'get', 'has_key', 'keys',
+    'values', 'items', 'iterkeys', 'itervalues', 'iteritems', 'get_many',
+    'contains_many',
+))
+
+
+class DatabasePool(object):
+
+    """
+    Open databases, keyed by ``(filepath, table)``.
+
+    A database is re-opened when found unhealthy: its thread has exited,
+    or its file has been removed.  Those unused for ``idle_timeout``
+    seconds are closed, or at once when 0.
+    """
+
+    def __init__(self, idle_timeout):
+        self.log = logging.getLogger(__name__)
+        self.idle_timeout = idle_timeout
+        self.lock = threading.Lock()
+        #: index of (filepath, table) to open :class:`PooledDict`.
+        self.databases = dict()
+        #: index of (filepath, table) to number of callers using it.
+        self.in_use = dict()
+        #: index of (filepath, table) to time last released.
+        self.last_used = dict()
+        self._pid = os.getpid()
+        self._next_evict = 0
+
+    def acquire(self, filepath, table):
+        """ Return open database, to be released by :meth:`release`. """
+        key = (filepath, table)
+        with self.lock:
+            if self._pid != os.getpid():
+                # forked: the threads serving databases of the parent
+                # process do not exist in this one.
+                self.databases.clear()
+                self.in_use.clear()
+                self.last_used.clear()
+                self._pid = os.getpid()
+            self.evict()
+            dictdb = self.databases.get(key)
+            if dictdb is not None and not self.is_healthy(filepath, dictdb):
+                self.log.warn('{0}/{1}: re-opening database.'.format(*key))
+                self._close(key)
+                dictdb = None
+            if dictdb is None:
+                dictdb = self.databases[key] = open_database(filepath, table)
+            self.in_use[key] = self.in_use.get(key, 0) + 1
+        return dictdb
+
+    def release(self, filepath, table):
+        """ Release database returned by :meth:`acquire`. """
+        key = (filepath, table)
+        with self.lock:
+            if key not in self.databases:
+                return
+            self.in_use[key] -= 1
+            self.last_used[key] = time.time()
+            if not self.idle_timeout and not self.in_use[key]:
+                self._close(key)
+
+    @staticmethod
+    def is_healthy(filepath, dictdb):
+        """ Whether ``dictdb`` is able to serve requests. """
+        return (dictdb.conn is not None and dictdb.conn.is_alive()
+                and os.path.exists(filepath))
+
+    def evict(self):
+        """ Close databases unused for ``idle_timeout`` seconds. """
+        now = time.time()
+        if now < self._next_evict:
+            return
+        self._next_evict = now + min(self.idle_timeout, 60)
+        for key, last_used in self.last_used.items():
+            if (not self.in_use.get(key) and
+                    now - last_used > self.idle_timeout):
+                self.log.debug('{0}/{1}: closing idle database.'
+                               .format(*key))
+                self._close(key)
+
+    def close(self):
+        """ Close all databases. """
+        with self.lock:
+            for key in self.databases.keys():
+                self._close(key)
+
+    def _close(self, key):
+        """ Close and forget database of ``key``. """
+        dictdb = self.databases.pop(key)
+        self.in_use.pop(key, None)
+        self.last_used.pop(key, None)
+        if dictdb.conn is not None and dictdb.conn.is_alive():
+            dictdb.close()
+
+
+def get_database_pool():
+    """ Return the :class:`DatabasePool`, created on first use. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global POOL
+    if POOL is None:
+        idle_timeout = get_ini(section='system', key='db_idle',
+                               getter='getint')
+        # 0 closes databases at once, only a missing option is defaulted.
+        POOL = DatabasePool(idle_timeout=(300 if idle_timeout == u''
+                                          else idle_timeout))
+    return POOL
+
+
+class SqliteThread(sqlitedict.SqliteMultithread):
+
+    """
+    Thread running the requests of a :class:`PooledDict`, in order.
+
+    The thread of ``sqlitedict`` exits at the first error, and callers
+    waiting for results of it, or of requests queued after it, wait
+    forever.  This one raises the error to the caller of the request
+    failing, or, for writes, whose results are not waited for, to the
+    caller of the next read, such as :func:`wait_written`.
+    """
+
+    def __init__(self, filename):
+        #: error of a write, raised by the next read.
+        self.error = None
+        sqlitedict.SqliteMultithread.__init__(
+            self, filename, autocommit=True, journal_mode='DELETE')
+
+    def run(self):
+        conn = sqlite3.connect(self.filename, isolation_level=None,
+                               check_same_thread=False,
+                               timeout=BUSY_TIMEOUT)
+        conn.execute('PRAGMA journal_mode = {0}'.format(self.journal_mode))
+        conn.text_factory = str
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA synchronous=OFF')
+        while True:
+            req, arg, res = self.reqs.get()
+            if req == '--close--':
+                break
+            elif res is not None and self.error is not None:
+                res.put(self.error)
+                res.put('--no more--')
+                self.error = None
+                continue
+            try:
+                if req == '--commit--':
+                    conn.commit()
+                else:
+                    cursor.execute(req, arg)
+                    if res is not None:
+                        for rec in cursor:
+                            res.put(rec)
+            # pylint: disable=W0703
+            #         Catching too general exception
+            except Exception as err:
+                if res is None:
+                    self.error = err
+                else:
+                    res.put(err)
+            if res is not None:
+                res.put('--no more--')
+        conn.close()
+
+    def select(self, req, arg=None):
+        for rec in sqlitedict.SqliteMultithread.select(self, req, arg):
+            if isinstance(rec, Exception):
+                raise rec
+            yield rec
+
+
+class PooledDict(sqlitedict.SqliteDict):
+
+    """
+    ``sqlitedict.SqliteDict`` of :class:`DatabasePool`, committed after
+    each statement, whose requests are run by a :class:`SqliteThread`.
+    """
+
+    # pylint: disable=W0231
+    #         __init__ method from base class is not called
+    def __init__(self, filename, tablename):
+        # as SqliteDict.__init__ of flag 'c', but for its thread.
+        self.in_temp = False
+        self.filename = filename
+        self.tablename = tablename
+        self.conn = SqliteThread(filename)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS {0} (key TEXT PRIMARY '
+                          'KEY, value BLOB)'.format(tablename))
+        self.conn.commit()
+        # wait for the file to be created, it is otherwise found unhealthy
+        # by DatabasePool.is_healthy() and re-opened; errors are raised
+        # to the caller of open_database().
+        wait_written(self)
+
+
+def open_database(filepath, table):
     global FILELOCK
     with FILELOCK:
         # if the bbs is run as root, file ownerships become read-only
         # and db transactions will throw 'read-only database' errors,
         # exit earlier if we know that file permissions are to blame
         check_db(filepath)
-        dictdb = sqlitedict.SqliteDict(filename=filepath,
-                                       tablename=table,
-                                       autocommit=True)
+        dictdb = PooledDict(filename=filepath, tablename=table)
     return dictdb
 
 
+def get_database(filepath, table):
+    """
+    Return open database of ``table`` in ``filepath`` from the pool.
+
+    It must be returned by :func:`release_database`, not closed.
+    """
+    return get_database_pool().acquire(filepath, table)
+
+
+def release_database(filepath, table):
+    """ Return database of :func:`get_database` to the pool. """
+    get_database_pool().release(filepath, table)
+
+
 def check_db(filepath):
     db_folder = os.path.dirname(filepath)
     if not os.path.exists(db_folder):
@@ -45,16 +318,181 @@ def get_db_filepath(schema):
     return os.path.join(folder, '{0}.sqlite3'.format(schema))
 
 
-def get_db_lock(schema, table):
-    key = (schema, table)
-    global DATALOCK, FILELOCK
-    with FILELOCK:
-        if key not in DATALOCK:
-            DATALOCK[key] = multiprocessing.Lock()
-    return DATALOCK[key]
+def connect(filepath):
+    """
+    Return new sqlite connection to ``filepath``.
+
+    Unlike those of ``sqlitedict``, it is not committed after each
+    statement, see :func:`transaction`.
+    """
+    check_db(filepath)
+    conn = sqlite3.connect(filepath, isolation_level=None,
+                           check_same_thread=False, timeout=BUSY_TIMEOUT)
+    conn.text_factory = str
+    # as sqlitedict does, trade durability on power loss for speed.
+    conn.execute('PRAGMA synchronous=OFF')
+    return conn
+
+
+def get_connection(filepath):
+    """
+    Return sqlite connection to ``filepath`` of the calling thread,
+    see :func:`connect`.
+    """
+    pid = os.getpid()
+    if getattr(CONNECTIONS, 'pid', None) != pid:
+        # none yet in this thread, or forked.
+        CONNECTIONS.pid = pid
+        CONNECTIONS.conns = dict()
+    conn = CONNECTIONS.conns.get(filepath)
+    if conn is None:
+        conn = CONNECTIONS.conns[filepath] = connect(filepath)
+    return conn
+
+
+@contextlib.contextmanager
+def transaction(filepath, table, write=True):
+    """
+    Context manager of a :class:`Transaction` of ``table`` in ``filepath``.
+
+    Changes are committed once the block is exited, or rolled back on
+    error.  When ``write`` is True, the database is locked for writing
+    until then (``BEGIN IMMEDIATE``).
+    """
+    conn = get_connection(filepath)
+    conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+    try:
+        yield Transaction(conn.cursor(), table)
+        conn.execute('COMMIT')
+    # pylint: disable=W0702
+    #         No exception type(s) specified
+    except:
+        # as well as an error of the block, a commit that failed, such as
+        # when busy, leaves the transaction open on the thread's
+        # connection; rollback() is a no-op when none is.
+        conn.rollback()
+        raise
+
+
+class Transaction(UserDict.DictMixin):
+
+    """
+    Dictionary operations on a table, in the transaction of ``cursor``.
+
+    Values are serialized as they are by ``sqlitedict``, and the methods
+    it offers are offered, in addition to those of many keys.
+    """
+
+    #: keys per statement, within the least SQLITE_MAX_VARIABLE_NUMBER.
+    CHUNK = 499
+
+    def __init__(self, cursor, table):
+        self.cursor = cursor
+        self.table = table
+        # as created by sqlitedict.SqliteDict.
+        self.cursor.execute('CREATE TABLE IF NOT EXISTS {0} '
+                            '(key TEXT PRIMARY KEY, value BLOB)'
+                            .format(table))
+
+    @staticmethod
+    def _key(key):
+        """ Return ``key`` as stored, utf-8 encoded. """
+        return key.encode('utf8') if isinstance(key, unicode) else key
+
+    def _select(self, column, keys):
+        """ Yield rows of ``column`` and value of ``keys``. """
+        keys = list(keys)
+        for idx in range(0, len(keys), self.CHUNK):
+            chunk = [self._key(key) for key in keys[idx:idx + self.CHUNK]]
+            self.cursor.execute('SELECT key, {0} FROM {1} WHERE key IN ({2})'
+                                .format(column, self.table,
+                                        ', '.join('?' * len(chunk))),
+                                chunk)
+            for row in self.cursor.fetchall():
+                yield row
+
+    # pylint: disable=C0111
+    #        Missing docstring
+    def __len__(self):
+        self.cursor.execute('SELECT COUNT(*) FROM {0}'.format(self.table))
+        return self.cursor.fetchone()[0]
+
+    def __contains__(self, key):
+        self.cursor.execute('SELECT 1 FROM {0} WHERE key = ?'
+                            .format(self.table), (self._key(key),))
+        return self.cursor.fetchone() is not None
+
+    def __getitem__(self, key):
+        self.cursor.execute('SELECT value FROM {0} WHERE key = ?'
+                            .format(self.table), (self._key(key),))
+        row = self.cursor.fetchone()
+        if row is None:
+            raise KeyError(key)
+        return sqlitedict.decode(row[0])
+
+    def __setitem__(self, key, value):
+        self.set_many({key: value})
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self.delete_many([key])
+
+    def iteritems(self):
+        self.cursor.execute('SELECT key, value FROM {0} ORDER BY rowid'
+                            .format(self.table))
+        for key, value in self.cursor.fetchall():
+            yield key, sqlitedict.decode(value)
+
+    def iterkeys(self):
+        self.cursor.execute('SELECT key FROM {0} ORDER BY rowid'
+                            .format(self.table))
+        for (key,) in self.cursor.fetchall():
+            yield key
+    __iter__ = iterkeys
+
+    def itervalues(self):
+        for _, value in self.iteritems():
+            yield value
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def get_many(self, keys):
+        """ Returns dictionary of ``keys`` found to their value. """
+        values = dict(self._select('value', keys))
+        return dict((key, sqlitedict.decode(values[self._key(key)]))
+                    for key in keys if self._key(key) in values)
+
+    def contains_many(self, keys):
+        """ Returns set of ``keys`` found. """
+        found = set(key for key, _ in self._select('NULL', keys))
+        return set(key for key in keys if self._key(key) in found)
+
+    def set_many(self, mapping):
+        """ Set value of each key of dictionary ``mapping``. """
+        self.cursor.executemany(
+            'REPLACE INTO {0} (key, value) VALUES (?, ?)'.format(self.table),
+            [(self._key(key), sqlitedict.encode(value))
+             for key, value in mapping.items()])
+
+    def delete_many(self, keys):
+        """ Delete ``keys``, those not found are ignored. """
+        self.cursor.executemany(
+            'DELETE FROM {0} WHERE key = ?'.format(self.table),
+            [(self._key(key),) for key in keys])
+
+
+def run_batch(filepath, table, method, *args):
+    """ Call ``method`` of :class:`Transaction` in a new transaction. """
+    with transaction(filepath, table, write=BATCH_METHODS[method]) as trans:
+        return getattr(trans, method)(*args)
 
 
 def get_db_func(dictdb, cmd):
+    if cmd in BATCH_METHODS and not isinstance(dictdb, Transaction):
+        return functools.partial(run_batch, dictdb.filename,
+                                 dictdb.tablename, cmd)
     assert hasattr(dictdb, cmd), (
         "{cmd!r} not a valid method of {db_type!r}"
         .format(cmd=cmd, db_type=type(dictdb)))
@@ -65,6 +503,85 @@ def get_db_func(dictdb, cmd):
     return func
 
 
+def key_of(key):
+    """ Return ``key`` as stored, text utf-8 encoded. """
+    if isinstance(key, unicode):
+        return key.encode('utf8')
+    return key if isinstance(key, str) else str(key)
+
+
+def get_changed_keys(cmd, args):
+    """
+    Returns list of keys written by dictionary method ``cmd`` called with
+    ``args``, an empty list when it does not write, or None when any key
+    may have been written.
+    """
+    if cmd in ('__setitem__', '__delitem__', 'setdefault', 'pop'):
+        return [args[0]] if args else None
+    if cmd in ('update', 'set_many'):
+        if not args:
+            return []
+        if hasattr(args[0], 'keys'):
+            return list(args[0].keys())
+        return [key for key, _ in args[0]]
+    if cmd == 'delete_many':
+        return list(args[0])
+    if cmd in ('popitem', 'clear'):
+        return None
+    return []
+
+
+def add_changes(changes, table, keys):
+    """
+    Record ``keys`` of ``table`` written, see :func:`get_changed_keys`, to
+    dictionary ``changes`` of :func:`notify_changed`.
+    """
+    if keys is None or changes.get(table, ()) is None:
+        changes[table] = None
+    elif keys:
+        changes.setdefault(table, set()).update(key_of(key) for key in keys)
+
+
+def notify_changed(sid, schema, changes):
+    """
+    Queue notice of ``changes`` committed to ``schema`` by session ``sid``.
+
+    ``changes`` is a dictionary of table name to set of keys written, or
+    None when any may have been.  Notices are published by the engine's
+    main loop, or, when sharded, by the coordinator to every shard, see
+    :func:`pop_changes`.  Elsewhere, such as in sessions, where there is
+    nobody to publish to, they are discarded.
+    """
+    from x84.shard import is_relay
+    if not changes or (WORKERS is None and not is_relay()):
+        return
+    CHANGES.append((sid, schema, changes))
+    from x84.poller import get_poller
+    get_poller().wakeup()
+
+
+def pop_changes():
+    """ Yield and remove ``(sid, schema, changes)`` of notices queued. """
+    while CHANGES:
+        yield CHANGES.popleft()
+
+
+def wait_written(dictdb):
+    """
+    Wait for writes queued to the thread of ``dictdb`` to be executed, so
+    that they are seen by other connections.
+    """
+    # its thread runs requests in order: a select is answered only once
+    # those queued before it are done.
+    dictdb.conn.select_one('SELECT 1')
+
+
+def is_busy(err):
+    """ Whether sqlite3.Error ``err`` is of the write lock held by another. """
+    return (isinstance(err, sqlite3.OperationalError) and
+            'locked' in str(err))
+
+
 def parse_dbevent(event):
     assert event[2] in ('-', '='), ('event name must match db[-=]event')
     iterable = event[2] == '='
@@ -85,67 +602,468 @@ def log_db_cmd(log, schema, cmd, args):
                                             args=s_args))
 
 
-class DBHandler(threading.Thread):
+class SessionTransaction(object):
+
+    """
+    Transaction of a session, open across its requests of a schema.
+
+    The database is locked for writing from the time it is begun
+    (``BEGIN IMMEDIATE``) until :meth:`end`.  Beginning waits no longer
+    than ``busy_timeout`` seconds for the write lock held by another.
+    """
+
+    def __init__(self, sid, schema, filepath, busy_timeout=BUSY_TIMEOUT):
+        self.sid, self.schema = sid, schema
+        self.conn = connect(filepath)
+        try:
+            self.conn.execute('PRAGMA busy_timeout = {0:d}'
+                              .format(int(busy_timeout * 1000)))
+            self.conn.execute('BEGIN IMMEDIATE')
+            self.conn.execute('PRAGMA busy_timeout = {0:d}'
+                              .format(int(BUSY_TIMEOUT * 1000)))
+        except sqlite3.Error:
+            self.conn.close()
+            raise
+        #: index of table name to :class:`Transaction`.
+        self.tables = dict()
+        #: time at which it is rolled back, unless requested again.
+        self.deadline = None
+        #: keys written, see :func:`add_changes`.
+        self.changes = dict()
+
+    def table(self, name):
+        """ Return :class:`Transaction` of table ``name``. """
+        if name not in self.tables:
+            self.tables[name] = Transaction(self.conn.cursor(), name)
+        return self.tables[name]
+
+    def end(self, commit):
+        """ Commit, or roll back, and close its connection. """
+        try:
+            self.conn.execute('COMMIT' if commit else 'ROLLBACK')
+        finally:
+            self.conn.close()
+
+
+class DBHandler(object):
 
     """
     This handler receives a "database command", in the form of a dictionary
     method name and its arguments, and the return value is sent to the session
     queue with the same 'event' name.
+
+    It is run by a thread of :class:`DBWorkerPool`.
     """
 
-    def __init__(self, queue, event, data):
+    def __init__(self, queue, event, data, sid=None):
         """ Arguments:
               queue: parent input end of multiprocessing.Queue()
               event: database schema in form of string 'db-schema' or
                   'db=schema'. When '-' is used, the result is returned as a
                   single transfer. When '=', an iterable is yielded and the
                   data is transfered via the IPC Queue as a stream.
+              sid: session-id of caller, whose open transaction of the
+                  schema, if any, it is run in.
         """
         self.log = logging.getLogger(__name__)
-        self.queue, self.event = queue, event
+        self.queue, self.event, self.sid = queue, event, sid
         self.table, self.cmd, self.args = data
 
         self.iterable, self.schema = parse_dbevent(event)
         self.filepath = get_db_filepath(self.schema)
         self._tap_db = get_ini('session', 'tab_db', getter='getboolean')
 
-        threading.Thread.__init__(self)
+        #: time queued, set by :meth:`DBWorkerPool.put`.
+        self.queued = None
 
-    def run(self):
+    def run(self, txn=None):
         """
         Execute database command and return results to session queue.
-        """
-        dictdb = get_database(self.filepath, self.table)
-        func = get_db_func(dictdb, self.cmd)
-        if self._tap_db:
-            log_db_cmd(self.log, self.schema, self.cmd, self.args)
 
+        It is run in :class:`SessionTransaction` ``txn``, if any.
+        """
+        from x84.framing import send_event
+        if txn is None:
+            dictdb = get_database(self.filepath, self.table)
+        else:
+            dictdb = txn.table(self.table)
         try:
+            func = get_db_func(dictdb, self.cmd)
+            if self._tap_db:
+                log_db_cmd(self.log, self.schema, self.cmd, self.args)
+
             # single value result,
             if not self.iterable:
                 result = func(*self.args)
-                self.queue.send((self.event, result))
+                keys = get_changed_keys(self.cmd, self.args)
+                if txn is not None:
+                    add_changes(txn.changes, self.table, keys)
+                elif keys is None or keys:
+                    if self.cmd not in BATCH_METHODS:
+                        wait_written(dictdb)
+                    changes = dict()
+                    add_changes(changes, self.table, keys)
+                    notify_changed(self.sid, self.schema, changes)
+                self.reply(result)
 
             # iterable value result,
             else:
-                self.queue.send((self.event, (None, 'StartIteration'),))
+                send_event(self.queue, self.event, (None, 'StartIteration'))
                 for item in func(*self.args):
-                    self.queue.send((self.event, item,))
+                    send_event(self.queue, self.event, item)
                 self.queue.send((self.event, (None, StopIteration,),))
 
         # pylint: disable=W0703
         #         Catching too general exception
         except Exception as err:
             # Pokemon exception, send to session
-            try:
-                self.queue.send(('exception', err,))
-            except IOError as err:
-                if err.errno == errno.EBADF:
-                    # our pipe/queue has been disconnected (the session
-                    # has disconnected), heck this might be the cause of
-                    # our first exception
-                    return
-                raise
+            self.fail(err)
         finally:
-            dictdb.close()
+            if txn is None:
+                release_database(self.filepath, self.table)
         return
+
+    def reply(self, result):
+        """ Send ``result`` to session queue. """
+        from x84.framing import send_event
+        send_event(self.queue, self.event, result)
+
+    def fail(self, err):
+        """ Send exception ``err`` to session queue, to be raised. """
+        try:
+            self.queue.send(('exception', err,))
+        except IOError as err:
+            if err.errno == errno.EBADF:
+                # our pipe/queue has been disconnected (the session
+                # has disconnected), heck this might be the cause of
+                # our first exception
+                return
+            raise
+
+
+class DBWorkerPool(object):
+
+    """
+    Fixed number of threads running :class:`DBHandler` requests.
+
+    Requests are queued by schema.  A schema is run by no more than one
+    thread at a time, so that its requests run in the order received,
+    while those of other schemas run in other threads.
+
+    A request of method 'begin' holds its schema for a
+    :class:`SessionTransaction` of the session, until requested to
+    'commit' or 'rollback' by it.  The requests of that session for that
+    schema are queued by themselves until then, while those of other
+    sessions that write wait.  Those that only read are queued by
+    themselves, and read data last committed.  No thread is held while
+    the session is busy between requests, nor while the write lock is
+    held by another process: beginning is tried again, in turn.
+    """
+
+    #: seconds a transaction may be left idle by its session before it is
+    #: rolled back, so that a session failing to end it does not hold its
+    #: schema for all others.
+    TRANSACTION_TIMEOUT = 10
+
+    #: seconds a thread waits to begin a transaction while the write lock
+    #: is held by another, before it is tried again,
+    BEGIN_TIMEOUT = 0.05
+
+    #: after this many seconds, until :data:`BUSY_TIMEOUT` seconds since
+    #: the request was queued.
+    BEGIN_RETRY = 0.1
+
+    def __init__(self, size):
+        self.log = logging.getLogger(__name__)
+        self.size = size
+        self.cond = threading.Condition()
+        #: index of schema, or of (sid, schema) of an open transaction, to
+        #: deque of requests waiting.
+        self.queues = dict()
+        #: deque of keys of queues with requests waiting, not being run.
+        self.ready = collections.deque()
+        #: index of (sid, schema) to open :class:`SessionTransaction`.
+        self.transactions = dict()
+        #: index of schema to time its request to begin is tried again.
+        self.retries = dict()
+        #: index of schema to dictionary of statistics, see :meth:`metrics`.
+        self.stats = dict()
+        self.threads = list()
+        self._tap_db = get_ini('session', 'tap_db', getter='getboolean')
+
+    def start(self):
+        """ Start worker threads. """
+        while len(self.threads) < self.size:
+            thread = threading.Thread(target=self._work,
+                                      name='db-{0}'.format(len(self.threads)))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def put(self, handler):
+        """ Queue :class:`DBHandler` ``handler`` to be run. """
+        with self.cond:
+            handler.queued = time.time()
+            key = (handler.sid, handler.schema)
+            if key not in self.transactions:
+                key = handler.schema
+                if (handler.cmd in READ_METHODS and
+                        self._held(handler.schema)):
+                    key = ('read', handler.schema)
+            self._queue(key, handler)
+
+    def _queue(self, key, handler):
+        """ Queue ``handler`` by ``key``, called with :attr:`cond` held. """
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = collections.deque()
+            # schema is not being run by another thread.
+            self.ready.append(key)
+            self.cond.notify()
+        queue.append(handler)
+        stats = self._get_stats(handler.schema)
+        stats['max_depth'] = max(stats['max_depth'], len(queue))
+
+    def _held(self, schema):
+        """
+        Whether ``schema`` is held by a session's transaction, or by its
+        request to begin one, to be tried again.
+        """
+        return schema in self.retries or any(
+            txn.schema == schema for txn in self.transactions.values())
+
+    def abort(self, sid):
+        """ Roll back open transactions of session ``sid``, once idle. """
+        with self.cond:
+            for txn in self.transactions.values():
+                if txn.sid == sid:
+                    txn.deadline = 0
+            self.cond.notify()
+
+    def metrics(self):
+        """
+        Returns dictionary of schema to dictionary of statistics.
+
+        Keys are ``depth``, number of requests waiting or running,
+        ``max_depth``, ``requests``, number run, ``wait``, total seconds
+        requests have waited to be run, and ``max_wait``.
+        """
+        with self.cond:
+            metrics = dict()
+            for schema, stats in self.stats.items():
+                metrics[schema] = stats.copy()
+                metrics[schema]['depth'] = len(self.queues.get(schema, ()))
+            return metrics
+
+    def _get_stats(self, schema):
+        """ Return dictionary of statistics of ``schema``. """
+        if schema not in self.stats:
+            self.stats[schema] = {'max_depth': 0, 'requests': 0,
+                                  'wait': 0.0, 'max_wait': 0.0}
+        return self.stats[schema]
+
+    def _work(self):
+        """ Target of worker threads: run requests until process exit. """
+        while True:
+            with self.cond:
+                timeout, expired = self._expire()
+                while not self.ready and not expired:
+                    self.cond.wait(timeout)
+                    timeout, expired = self._expire()
+                if not expired:
+                    key = self.ready.popleft()
+                    handler = self.queues[key][0]
+                    txn = self.transactions.get(key)
+                    wait = time.time() - handler.queued
+                    stats = self._get_stats(handler.schema)
+                    stats['requests'] += 1
+                    stats['wait'] += wait
+                    stats['max_wait'] = max(stats['max_wait'], wait)
+            if expired:
+                # rolled back without holding the lock.
+                self._roll_back(expired)
+                continue
+            held = False
+            try:
+                if txn is not None:
+                    self._run_in(txn, handler)
+                elif handler.cmd == 'begin':
+                    held = self._begin(handler)
+                elif handler.cmd == 'commit':
+                    handler.fail(sqlite3.OperationalError(
+                        '{0}: no transaction to commit, it may have '
+                        'timed out.'.format(handler.schema)))
+                elif handler.cmd == 'rollback':
+                    handler.reply(None)
+                else:
+                    handler.run()
+            # pylint: disable=W0703
+            #         Catching too general exception
+            except Exception as err:
+                self.log.exception(err)
+            finally:
+                with self.cond:
+                    if not held:
+                        self._next(key)
+                    if txn is not None and key not in self.transactions:
+                        # ended, the schema is run again.
+                        self._next(txn.schema)
+
+    def _next(self, key):
+        """ Remove request run of queue ``key``, making ready the next. """
+        queue = self.queues[key]
+        queue.popleft()
+        if queue:
+            # next request of this queue, in turn with others.
+            self.ready.append(key)
+            self.cond.notify()
+        else:
+            del self.queues[key]
+
+    def _begin(self, handler):
+        """
+        Begin transaction of session for ``handler``, returns True when
+        its schema is held until ended.
+        """
+        try:
+            txn = SessionTransaction(handler.sid, handler.schema,
+                                     handler.filepath,
+                                     busy_timeout=self.BEGIN_TIMEOUT)
+        except sqlite3.Error as err:
+            if (is_busy(err) and
+                    time.time() - handler.queued < BUSY_TIMEOUT):
+                # write lock is held by another process, or by a thread
+                # of this one: rather than wait, the schema is held and
+                # run again once retried.
+                with self.cond:
+                    self.retries[handler.schema] = (
+                        time.time() + self.BEGIN_RETRY)
+                    self._release_reads(handler.schema)
+                    self.cond.notify()
+                return True
+            handler.fail(err)
+            return False
+        with self.cond:
+            txn.deadline = time.time() + self.TRANSACTION_TIMEOUT
+            self.transactions[(txn.sid, txn.schema)] = txn
+            self._release_reads(txn.schema)
+        if self._tap_db:
+            self.log.debug('[{0.sid}] {0.schema} transaction begun.'
+                           .format(txn))
+        handler.reply(True)
+        return True
+
+    def _release_reads(self, schema):
+        """
+        Queue requests waiting for ``schema`` that only read by themselves,
+        once it is held, see :meth:`_held`.  Called with :attr:`cond` held.
+        """
+        queue = self.queues[schema]
+        # the first is the request that began the transaction.
+        head, waiting = queue[0], list(queue)[1:]
+        reads = [handler for handler in waiting
+                 if handler.cmd in READ_METHODS]
+        if reads:
+            queue.clear()
+            queue.append(head)
+            queue.extend(handler for handler in waiting
+                         if handler.cmd not in READ_METHODS)
+            for handler in reads:
+                self._queue(('read', schema), handler)
+
+    def _run_in(self, txn, handler):
+        """ Run ``handler`` in its session's transaction ``txn``. """
+        if handler.cmd in ('commit', 'rollback'):
+            failure = None
+            try:
+                txn.end(commit=handler.cmd == 'commit')
+            except sqlite3.Error as err:
+                failure = err
+            # no longer routed to the transaction once answered.
+            with self.cond:
+                del self.transactions[(txn.sid, txn.schema)]
+            if self._tap_db:
+                self.log.debug('[{0.sid}] {0.schema} transaction {1}.'
+                               .format(txn, handler.cmd))
+            if failure is not None:
+                handler.fail(failure)
+            else:
+                if handler.cmd == 'commit':
+                    notify_changed(txn.sid, txn.schema, txn.changes)
+                handler.reply(True)
+        elif handler.cmd == 'begin':
+            # already begun.
+            handler.reply(True)
+        else:
+            handler.run(txn)
+        txn.deadline = time.time() + self.TRANSACTION_TIMEOUT
+
+    def _expire(self):
+        """
+        Make ready schemas whose request to begin is to be tried again,
+        and remove idle transactions whose deadline has passed.
+
+        Returns seconds until the next deadline, or None, and the list of
+        transactions removed, to be ended by :meth:`_roll_back` once
+        :attr:`cond` is released.  Called with :attr:`cond` held.
+        """
+        now, timeout, expired = time.time(), None, list()
+        deadlines = list()
+        for schema, retry in self.retries.items():
+            if retry <= now:
+                del self.retries[schema]
+                self.ready.append(schema)
+            else:
+                deadlines.append(retry)
+        for key, txn in self.transactions.items():
+            if key in self.queues:
+                # a request of it is waiting or running.
+                continue
+            if txn.deadline > now:
+                deadlines.append(txn.deadline)
+                continue
+            # no longer routed to, its schema is held until ended.
+            del self.transactions[key]
+            expired.append(txn)
+        if deadlines:
+            timeout = min(deadlines) - now
+        return timeout, expired
+
+    def _roll_back(self, expired):
+        """
+        Roll back transactions removed by :meth:`_expire`, making ready
+        the requests of their schema.
+        """
+        for txn in expired:
+            self.log.warn('[{0.sid}] {0.schema} transaction rolled back, '
+                          'idle or session ended.'.format(txn))
+            try:
+                txn.end(commit=False)
+            except sqlite3.Error as err:
+                self.log.exception(err)
+            with self.cond:
+                self._next(txn.schema)
+
+
+def get_db_worker_pool():
+    """ Return the :class:`DBWorkerPool`, started on first use. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global WORKERS
+    if WORKERS is None:
+        size = get_ini(section='system', key='db_workers',
+                       getter='getint')
+        # only a missing option is defaulted, 0 is refused.
+        size = 4 if size == u'' else size
+        if size < 1:
+            raise ValueError('[system] db_workers must be at least 1, '
+                             'not {0}.'.format(size))
+        WORKERS = DBWorkerPool(size=size)
+        WORKERS.start()
+    return WORKERS
+
+
+def abort_transactions(sid):
+    """ Roll back open transactions of session ``sid``, which has ended. """
+    if WORKERS is not None:
+        WORKERS.abort(sid)
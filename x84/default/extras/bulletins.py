@@ -2,7 +2,7 @@
 
 # More to be added as soon as we get a filebase going.
 
-from x84.bbs import getsession, getterminal, echo, list_users, get_user
+from x84.bbs import getsession, getterminal, echo, list_users, get_users
 from x84.bbs import gosub, showart, getch
 import os
 
@@ -43,9 +43,10 @@ def toplist(parameter):
 
     echo(term.red + u' crunching data..')
 
+    users = get_users(user_handles)
     for handle in user_handles:
 
-        user_record = get_user(handle)
+        user_record = users[handle]
 
         if u'sysop' in user_record.groups:
             continue
@@ -59,7 +60,7 @@ def toplist(parameter):
     for name in sorted(database, key=database.get, reverse=True):
         username[counter] = name
 
-        user_record = get_user(name)
+        user_record = users[name.decode('utf8')]
         location[counter] = user_record.location
 
         feature[counter] = str(database[name])
@@ -99,6 +99,7 @@ def main():
         refresh_prompt(prompt_msg)
         return idx
 
+    session.subscribe('automsg')
     idx = refresh_all()
     while True:
         if session.poll_event('refresh'):
@@ -128,11 +129,11 @@ def main():
             if msg is not None and msg.strip():
                 echo(u''.join((u'\r\n\r\n', write_msg,)))
                 autodb = DBProxy('automsg')
-                autodb.acquire()
-                idx = max([int(ixx) for ixx in autodb.keys()] or [-1]) + 1
-                autodb[idx] = (time.time(), handle, msg.strip())
-                autodb.release()
-                session.send_event('global', ('automsg', True,))
+                with autodb.transaction():
+                    idx = max([int(ixx) for ixx in autodb.keys()]
+                              or [-1]) + 1
+                    autodb[idx] = (time.time(), handle, msg.strip())
+                session.publish('automsg')
                 refresh_automsg(idx)
                 echo(u''.join((u'\r\n\r\n', commit_msg,)))
                 getch(0.5)  # for effect, LoL
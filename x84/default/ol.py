@@ -226,16 +226,15 @@ def do_merge_shroo_ms(new_content):
 def maybe_expunge_records():
     """ Check ceiling of database keys; trim-to MAX_HISTORY. """
     udb = DBProxy('oneliner')
-    expunged = 0
-    with udb:
-        if len(udb) > MAX_HISTORY + 10:
-            contents = DBProxy('oneliner').copy()
-            _sorted = sorted(
-                ((value, key) for (key, value) in contents.items()),
-                key=lambda _valkey: keysort_by_datetime(_valkey[0]))
-            for expunged, (value, key) in enumerate(
-                    _sorted[len(udb) - MAX_HISTORY:]):
-                del udb[key]
+    if len(udb) <= MAX_HISTORY + 10:
+        return
+    # read and sorted outside of a transaction, so that other sessions are
+    # not held meanwhile: deleting a key twice is harmless.
+    _sorted = sorted(udb.items(),
+                     key=lambda _keyval: keysort_by_datetime(_keyval[1]))
+    expired = [key for key, _ in _sorted[:len(_sorted) - MAX_HISTORY]]
+    udb.delete_many(expired)
+    expunged = len(expired)
     if expunged:
         log = logging.getLogger(__name__)
         log.info('expunged %d records from database', expunged)
@@ -254,9 +253,9 @@ def add_oneline(session, message):
         }
     maybe_expunge_records()
 
-    # tell everybody a new oneliner was posted, including our
+    # tell everybody viewing oneliners a new one was posted,
     # -- allows it to work something like a chatroom.
-    session.send_event('global', ('oneliner', True))
+    session.publish('oneliner')
 
 
 # -- ui functions
@@ -526,4 +525,8 @@ def main():
         echo(syncterm_setfont(syncterm_font))
         echo(term.move_x(0) + term.clear_eol)
 
-    do_prompt(term, session)
+    session.subscribe('oneliner')
+    try:
+        do_prompt(term, session)
+    finally:
+        session.unsubscribe('oneliner')
@@ -1,17 +1,32 @@
 """ Who's online script for X/84, https://github.com/jquast/x84 """
 import time
-SELF_ID = -1
 POLL_KEY = 0.25  # blocking ;; how often to poll keyboard
-POLL_INF = 2.00  # seconds elapsed until re-ask clients for more details
-POLL_AYT = 4.00  # seconds elapsed until global 'are you there?' is checked,
+POLL_INF = 2.00  # seconds elapsed until who's online is fetched again
 POLL_OUT = 0.50  # seconds elapsed before screen updates
 
 
-def request_info(sid):
-    """ Send info-req event to target session id ``sid``. """
-    from x84.bbs import getsession
-    session = getsession()
-    session.send_event('route', (sid, 'info-req', session.sid,))
+def update_sessions(sessions):
+    """
+    Fetch who's online from the engine into dictionary ``sessions``,
+    returns True if any session has arrived, left, or changed activity.
+    Sessions that have left are marked for deletion.
+    """
+    from x84.bbs import getsession, echo
+    online = getsession().get_presence()
+    changed = False
+    for sid, attrs in sessions.items():
+        if sid not in online and 'delete' not in attrs:
+            attrs['delete'] = 1
+            changed = True
+    for sid, attrs in online.items():
+        if sid not in sessions:
+            echo(u'\a')
+            changed = True
+        elif (sessions[sid].get('activity') != attrs['activity'] or
+              sessions[sid].get('handle') != attrs['handle']):
+            changed = True
+        sessions[sid] = attrs
+    return changed
 
 
 def banner():
@@ -199,21 +214,13 @@ def main():
     #         Too many statements
     from x84.bbs import getsession, getterminal, getch, echo
     session, term = getsession(), getterminal()
-    ayt_lastfresh = 0
-
-    def broadcast_ayt(last_update):
-        """ Globally boradcast 'are-you-there' request. """
-        if time.time() - last_update > POLL_AYT:
-            session.send_event('global', ('AYT', session.sid,))
-            last_update = time.time()
-        return last_update
 
     sessions = dict()
     dirty = time.time()
     cur_row = 0
+    last_update = 0
 
     while True:
-        ayt_lastfresh = broadcast_ayt(ayt_lastfresh)
         inp = getch(POLL_KEY)
         if session.poll_event('refresh') or (
                 inp in (u' ', term.KEY_REFRESH, unichr(12))):
@@ -239,51 +246,11 @@ def main():
                 disconnect(sessions)
                 dirty = time.time()
 
-        # add sessions that respond to AYT
-        data = session.poll_event('ACK')
-        if data is not None:
-            sid, handle = data
-            if sid in sessions:
-                sessions[sid]['handle'] = handle
-            else:
-                sessions[sid] = dict((
-                    ('handle', handle),
-                    ('lastfresh', time.time()),
-                    ('lastasked', time.time()),))
-                dirty = time.time()
-                echo(u'\a')
-
-        # update sessions that respond to info-req
-        data = session.poll_event('info-ack')
-        if data is not None:
-            sid, attrs = data
-            if sessions.get(sid, dict()).get('activity') != attrs['activity']:
-                # and refresh screen if activity changes
-                dirty = time.time()
-            sessions[sid] = attrs
-            sessions[sid]['lastfresh'] = time.time()
-
-        # update our own session
-        sessions[SELF_ID] = session.info()
-        sessions[SELF_ID]['lastfresh'] = time.time()
-
-        # request that all sessions update if more stale than POLL_INF,
-        # or is missing session info (only AYT replied so far!),
-        # or has been displayed as 'Disconnected' (marked for deletion)
-        for sid, attrs in sessions.items():
-            if sid == SELF_ID:
-                continue
-            if attrs.get('idle', -1) == -1 or (
-                    time.time() - attrs.get('lastfresh', 0) > POLL_INF
-                    and time.time() - attrs.get('lastasked', 0) > POLL_INF):
-                request_info(sid)
-                attrs['lastasked'] = time.time()
-
-        # prune users who haven't responded to AYT
-        for sid, attrs in sessions.items():
-            if time.time() - attrs['lastfresh'] > (POLL_AYT * 2):
-                sessions[sid]['delete'] = 1
+        # fetch who's online, refresh screen if any changes
+        if time.time() - last_update > POLL_INF:
+            if update_sessions(sessions):
                 dirty = time.time()
+            last_update = time.time()
 
         if dirty is not None and time.time() - dirty > POLL_OUT:
             session.activity = u"Who's Online"
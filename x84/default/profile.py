@@ -315,6 +315,7 @@ def do_command(term, session, inp, fields, tgt_user, point):
         # escape was pressed
         echo(term.move(*point))
         echo(_color2('Canceled !') + term.clear_eos)
+        session.flush()
         time.sleep(1)
         return True
 
@@ -373,10 +374,12 @@ def delete_user(term, tgt_user, point):
         if tgt_user.handle != 'anonymous':
             tgt_user.delete()
         echo(_color2('Deleted !'))
+        getsession().flush()
         time.sleep(1)
         return True
 
     echo(_color2('Canceled !'))
+    getsession().flush()
     time.sleep(1)
     return False
 
@@ -542,10 +545,12 @@ def main():
                     break
                 else:
                     # otherwise, clean prompt field
+                    session.flush()
                     time.sleep(0.2)
                     echo(u'\b \b')
             elif inp in legal_input_characters:
                 # though legal, not authorized: clean prompt field
+                session.flush()
                 time.sleep(0.2)
                 echo(u'\b \b')
             event = None
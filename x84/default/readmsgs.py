@@ -107,9 +107,10 @@ def msg_filter(msgs):
     #         Too many local variables
     #         Too many branches
     #         Too many statements
-    from x84.bbs import list_msgs, echo, getsession, getterminal, get_msg
+    from x84.bbs import list_msgs, echo, getsession, getterminal, get_msgs
     session, term = getsession(), getterminal()
     public_msgs = list_msgs(('public',))
+    all_msgs = get_msgs(msgs)
     addressed_to = 0
     addressed_grp = 0
     filtered = 0
@@ -124,7 +125,7 @@ def msg_filter(msgs):
             public += 1
         else:
             private += 1
-        msg = get_msg(msg_id)
+        msg = all_msgs[msg_id]
         if msg.recipient == session.user.handle:
             addressed_to += 1
         else:
@@ -28,17 +28,17 @@ def view_leaf_msgnet(server_tag=None, board_id=None):
             view_leaf_msgnet(server_tag=server_tag, board_id=_bid)
         return
 
-    with DBProxy('{0}keys'.format(server_tag)) as key_db:
-        echo(u'\r\n[msgnet_{0}]'.format(server_tag))
-        echo(u'\r\nurl_base = https://{addr}:{port}/'
-             .format(addr=get_ini('web', 'addr'),
-                     port=get_ini('web', 'port')))
-        echo(u'\r\nboard_id = {0}'.format(board_id))
-        echo(u'\r\ntoken = {0}'.format(key_db[board_id]))
-        echo(u'\r\npoll_interval = 300')
-        echo(u'\r\n')
-        echo(u'\r\n[msg]')
-        echo(u'\r\nnetwork_tags = {0}'.format(server_tag))
+    token = DBProxy('{0}keys'.format(server_tag))[board_id]
+    echo(u'\r\n[msgnet_{0}]'.format(server_tag))
+    echo(u'\r\nurl_base = https://{addr}:{port}/'
+         .format(addr=get_ini('web', 'addr'),
+                 port=get_ini('web', 'port')))
+    echo(u'\r\nboard_id = {0}'.format(board_id))
+    echo(u'\r\ntoken = {0}'.format(token))
+    echo(u'\r\npoll_interval = 300')
+    echo(u'\r\n')
+    echo(u'\r\n[msg]')
+    echo(u'\r\nnetwork_tags = {0}'.format(server_tag))
     echo(u'\r\n')
     echo(u'-' * 40)
 
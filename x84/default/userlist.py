@@ -10,7 +10,7 @@ import os
 # local
 from x84.bbs import getsession, getterminal
 from x84.bbs import echo, timeago
-from x84.bbs import get_user, list_users
+from x84.bbs import get_users, list_users
 
 from common import display_banner, prompt_pager
 
@@ -39,11 +39,12 @@ user_record = collections.namedtuple('userlist', [
 
 def iter_userlist():
     handles = sorted(list_users(), key=unicode.lower)
+    users = get_users(handles)
     timenow = time.time()
     return (user_record(handle=user.handle,
                         location=user.location,
                         timeago=timenow - user.lastcall)
-            for user in (get_user(handle) for handle in handles))
+            for user in (users[handle] for handle in handles))
 
 
 def main():
@@ -56,7 +56,19 @@ def main():
                       'some internationalized languages will not be possible.')
 
     # retrieve list of managed servers
-    servers = get_servers(CFG)
+    num_shards = get_ini(section='system', key='shards', getter='getint') or 1
+    servers = get_servers(CFG, reuse_port=num_shards > 1)
+
+    coordinator = None
+    if num_shards > 1:
+        # each shard binds its own listeners; ours were bound only to verify
+        # the configuration and, for ssh, to generate a host key just once.
+        # Shards are started before any other threads are.
+        from x84.shard import Coordinator
+        for server in servers:
+            server.server_socket.close()
+        coordinator = Coordinator(num_shards)
+        coordinator.start()
 
     # begin unmanaged servers
     if (CFG.has_section('web') and
@@ -73,22 +85,42 @@ def main():
         msgpoll.main()
 
     try:
-        # begin main event loop
-        _loop(servers)
+        if coordinator is not None:
+            # relay events between shards
+            coordinator.run()
+        else:
+            # begin main event loop
+            _loop(servers)
     except KeyboardInterrupt:
         # exit on ^C, killing any client sessions.
-        from x84.terminal import kill_session
-        for server in servers:
-            for idx, thread in enumerate(server.threads[:]):
-                if not thread.stopped:
-                    thread.stopped = True
-                server.threads.remove(thread)
-            for key, client in server.clients.items()[:]:
-                kill_session(client, 'server shutdown')
-                del server.clients[key]
+        if coordinator is not None:
+            coordinator.shutdown()
+        else:
+            shutdown(servers)
     return 0
 
 
+def shutdown(servers):
+    """
+    Stop on-connect negotiations, kill all client sessions, and close
+    databases.
+    """
+    from x84.terminal import kill_session
+    from x84.prefork import get_worker_pool
+    from x84.db import get_database_pool
+    pool = get_worker_pool()
+    if pool is not None:
+        pool.close()
+    for server in servers:
+        for connect in server.connects[:]:
+            connect.stopped = True
+            server.connects.remove(connect)
+        for key, client in server.clients.items()[:]:
+            kill_session(client, 'server shutdown')
+            del server.clients[key]
+    get_database_pool().close()
+
+
 def parse_args():
     import getopt
     import sys
@@ -129,10 +161,13 @@ def parse_args():
     return (lookup_bbs, lookup_log)
 
 
-def get_servers(CFG):
+def get_servers(CFG, reuse_port=False):
     """
     Given a configuration file, instantiate and return a list of enabled
     servers.
+
+    When ``reuse_port`` is True, listeners are bound with ``SO_REUSEPORT``
+    so that each engine shard may bind its own, see :mod:`x84.shard`.
     """
     servers = []
 
@@ -141,7 +176,7 @@ def get_servers(CFG):
              or CFG.getboolean('telnet', 'enabled'))):
         # start telnet server instance
         from x84.telnet import TelnetServer
-        servers.append(TelnetServer(config=CFG))
+        servers.append(TelnetServer(config=CFG, reuse_port=reuse_port))
 
     if (CFG.has_section('ssh') and
             not CFG.has_option('ssh', 'enabled')
@@ -154,36 +189,31 @@ def get_servers(CFG):
         # either discover and resolve the root issue, or disable ssh if it
         # cannot be resolved.
         from x84.ssh import SshServer
-        servers.append(SshServer(config=CFG))
+        servers.append(SshServer(config=CFG, reuse_port=reuse_port))
 
     if (CFG.has_section('rlogin') and
             (not CFG.has_option('rlogin', 'enabled')
              or CFG.getboolean('rlogin', 'enabled'))):
         # start rlogin server instance
         from x84.rlogin import RLoginServer
-        servers.append(RLoginServer(config=CFG))
+        servers.append(RLoginServer(config=CFG, reuse_port=reuse_port))
 
     return servers
 
 
-def find_server(servers, fd):
-    for server in servers:
-        if fd == server.server_socket.fileno():
-            return server
-
-
 def accept(log, server, check_ban):
     """
-    Accept new connection from server, spawning an unmanaged thread.
+    Accept new connection from server, beginning on-connect negotiation.
 
     Connecting socket accepted is server.server_socket, instantiate a
     new instance of client_factory, with optional keyword arguments
     defined by server.client_factory_kwargs, registering it with
-    dictionary server.clients, and spawning an unmanaged thread
-    using connect_factory, with optional keyword arguments
-    server.connect_factory_kwargs.
+    dictionary server.clients, and beginning negotiation by an instance
+    of connect_factory, with optional keyword arguments
+    server.connect_factory_kwargs, which is appended to server.connects.
     """
     import socket
+    from x84.terminal import register_client
 
     if None in (server.client_factory, server.connect_factory):
         raise NotImplementedError(
@@ -226,38 +256,78 @@ def accept(log, server, check_ban):
         client = server.client_factory(sock, address_pair,
                                        **client_factory_kwargs)
 
-        # spawn on-connect negotiation thread.  When successful,
-        # a new sub-process is spawned and registered as a session tty.
+        # begin on-connect negotiation.  When successful, a new
+        # sub-process is spawned and registered as a session tty.
         server.clients[client.sock.fileno()] = client
-        thread = server.connect_factory(client, **connect_factory_kwargs)
+        register_client(client)
+        connect = server.connect_factory(client, **connect_factory_kwargs)
         log.info('{client.kind} connection from {client.addrport} '
-                 '(*{thread.name}).'.format(client=client, thread=thread))
-        server.threads.append(thread)
-        thread.start()
+                 '(*{connect.name}).'.format(client=client, connect=connect))
+        server.connects.append(connect)
+        connect.start()
 
     except socket.error as err:
         log.error('accept error {0}:{1}'.format(*err))
 
 
-def get_session_output_fds(servers):
-    from x84.terminal import find_tty
-    session_fds = []
-    for server in servers:
-        for client in server.clients.values():
-            tty = find_tty(client)
-            if tty is not None:
-                session_fds.append(tty.master_read.fileno())
-    return session_fds
+def connect_step(servers, received):
+    """
+    Advance on-connect negotiations of clients that have received data,
+    or that were woken by another thread.
+
+    Negotiations waiting for their deadline are stepped by the engine's
+    timer wheel, see :class:`x84.client.BaseConnect`.
+    """
+    received = set(received)
+    # servers of the same class share their list of connects.
+    connects = set(connect for server in servers
+                   for connect in server.connects)
+    for connect in connects:
+        if not connect.stopped and (connect.client in received or
+                                    connect.woken):
+            connect.step()
+
+
+def throttle(poller, pending, throttled):
+    """
+    Stop polling pipes of sessions whose clients can't keep up.
+
+    A session's pipe is no longer polled once its client's send buffer
+    reaches ``SEND_HIGH_WATER``, and polled again once it drains to
+    ``SEND_LOW_WATER``.  ``pending`` are clients with output remaining,
+    ``throttled`` the set of ttys returned by the previous call.
+
+    Returns set of ttys whose pipes are not polled.
+    """
+    from x84.terminal import find_tty, find_tty_by_sid
+    now_throttled = set()
+    for client in pending:
+        tty = find_tty(client)
+        if tty is None:
+            continue
+        backlog = len(client.send_buffer)
+        if (backlog >= client.SEND_HIGH_WATER or (
+                tty in throttled and backlog > client.SEND_LOW_WATER)):
+            now_throttled.add(tty)
+    for tty in throttled - now_throttled:
+        if find_tty_by_sid(tty.sid) is tty:
+            poller.register(tty.fd)
+    for tty in now_throttled - throttled:
+        poller.unregister(tty.fd)
+    return now_throttled
 
 
 def client_recv(servers, ready_fds, log):
     """
-    Test all clients for recv_ready(). If any data is available, then
+    For clients whose file descriptors are found in ``ready_fds``,
     socket_recv() is called, buffering the data for the session which
     is exhausted in session_send().
+
+    Returns list of clients that received data.
     """
     from x84.bbs.exception import Disconnected
     from x84.terminal import kill_session
+    received = list()
     for server in servers:
         for client in server.clients_ready(ready_fds):
             try:
@@ -266,41 +336,51 @@ def client_recv(servers, ready_fds, log):
                 log.debug('{client.addrport}: disconnect on recv: {err}'
                           .format(client=client, err=err))
                 kill_session(client, 'disconnected: {err}'.format(err=err))
+            else:
+                received.append(client)
+    return received
 
 
-def client_send(terminals, log):
+def client_send(clients, log):
     """
-    Test all clients for send_ready(). If any data is available, then
-    tty.client.send() is called. This is data sent from the session to
-    the tcp client.
+    Test given clients for send_ready(). If any data is available, then
+    client.send() is called. This is data sent from the session to the
+    tcp client.
+
+    Returns list of clients with data remaining that could not be sent.
     """
     from x84.bbs.exception import Disconnected
-    from x84.terminal import kill_session
-    # nothing to send until tty is registered.
-    for sid, tty in terminals:
-        if tty.client.send_ready():
+    from x84.terminal import kill_session, find_tty
+    pending = list()
+    for client in clients:
+        # nothing to send until tty is registered.
+        if find_tty(client) is None:
+            continue
+        if client.send_ready():
             try:
-                tty.client.send()
+                client.send()
             except Disconnected as err:
                 log.debug('{client.addrport}: disconnect on send: {err}'
-                          .format(client=tty.client, err=err))
-                kill_session(tty.client, 'disconnected: {err}'.format(err=err))
+                          .format(client=client, err=err))
+                kill_session(client, 'disconnected: {err}'.format(err=err))
+                continue
+            if client.send_ready():
+                pending.append(client)
+    return pending
 
 
 def session_send(terminals):
     """
-    Test all tty clients for input_ready(), meaning tcp data has been
+    Test given tty clients for input_ready(), meaning tcp data has been
     buffered to be received by the tty session, and sent it to the tty
     input queue (tty.master_write).
-
-    Also, test all sessions for idle timeout, signaling exit to
-    subprocess when reached
     """
     from x84.terminal import kill_session
-    for sid, tty in terminals:
+    from x84.framing import send_event
+    for tty in terminals:
         if tty.client.input_ready():
             try:
-                tty.master_write.send(('input', tty.client.get_input()))
+                send_event(tty.master_write, 'input', tty.client.get_input())
             except IOError:
                 # this may happen if a sub-process crashes, or more often,
                 # because the subprocess has logged off, but the user kept
@@ -308,116 +388,44 @@ def session_send(terminals):
                 # to close their telnet socket.
                 kill_session(tty.client, 'no tty for socket data')
 
-        # poll about and kick off idle users
-        elif tty.timeout and tty.client.idle() > tty.timeout:
-            kill_session(tty.client, 'timeout')
-
-
-def handle_lock(locks, tty, event, data, tap_events, log):
-    """
-    handle locking event of (lock-key, (method, stale))
-    """
-    import time
-    from x84.terminal import get_terminals
-    method, stale = data
-    if method == 'acquire':
-        # this lock is already held,
-        if event in locks:
-            # check if lock held by an active session,
-            holder = locks[event][1]
-            for _sid, _tty in get_terminals():
-                if _sid == holder and _sid != tty.sid:
-                    # acquire the lock from a now-deceased session.
-                    log.debug('[{tty.sid}] {event} not acquired, '
-                              'held by active session: {holder}'
-                              .format(tty=tty, event=event, holder=holder))
-                    break
-                elif _sid == holder and _sid == tty.sid:
-                    # acquire the lock from ourselves!  We'll allow it
-                    # (this is termed, "re-entrant locking").
-                    log.debug('{tty.sid}] {event} is re-acquired!'
-                              .format(tty=tty, event=event))
-            else:
-                # lock is held by a now-defunct session, re-acquired.
-                log.debug('[{tty.sid}] {event} re-acquiring stale lock, '
-                          'previously held by session no longer active: '
-                          '{holder}'
-                          .format(tty=tty, event=event, holder=holder))
-                del locks[event]
-
-        # lock is not held, or release by previous block
-        if event not in locks:
-            # acknowledge its requirement,
-            locks[event] = (time.time(), tty.sid)
-            tty.master_write.send((event, True,))
-            if tap_events:
-                log.debug('[{tty.sid}] {event} granted lock.'
-                          .format(tty=tty, event=event))
-
-        # lock cannot be acquired,
-        else:
-            holder = locks[event][1]
-            elapsed = time.time() - locks[event][0]
-            if (stale is not None and elapsed > stale):
-                # caller has decreed that this lock may be acquired even if
-                # it already held, if it has been held longer than length of
-                # time `stale`.  This is simply to prevent a global freeze
-                # when the programmer knows the holder may fail to release,
-                # though this is not currently used in the demonstration
-                # system.
-                locks[event] = (time.time(), tty.sid)
-                tty.master_write.send((event, True,))
-                log.warn('[{tty.sid}] {event} re-acquiring stale lock, '
-                         'previously held active session {holder} after '
-                         '{elapsed}s elapsed (stale={stale})'
-                         .format(tty=tty, event=event, holder=holder,
-                                 elapsed=elapsed, stale=stale))
-
-            # signal busy with matching event, data=False
-            else:
-                tty.master_write.send((event, False,))
-                log.warn('[{tty.sid}] {event} lock rejected; already held '
-                         'by active session {holder} for {elapsed} seconds '
-                         '(stale={stale})'
-                         .format(tty=tty, event=event, holder=holder,
-                                 elapsed=elapsed, stale=stale))
-
-    elif method == 'release':
-        if event not in locks:
-            log.error('[{tty.sid}] {event} lock failed to release, '
-                      'not acquired.'.format(tty=tty, event=event))
-        else:
-            del locks[event]
-            if tap_events:
-                log.debug('[{tty.sid}] {event} released lock.'
-                          .format(tty=tty, event=event))
-
 
 def session_recv(locks, terminals, log, tap_events):
     """
     receive data waiting for session; all data received from
     subprocess is in form (event, data), and is handled by ipc_recv.
 
-    if stale is not None, the number of seconds elapsed since lock was
-    first held is consider stale after that period of time, and is acquire
-    anyway.
-    """
-    # No actual Lock instances are held or released, just a simple dictionary
-    # state/time tracking system.
-    from x84.terminal import kill_session
-    from x84.db import DBHandler
+    'lock' events are handled by ``locks``, a
+    :class:`x84.locks.LockTable`.
 
-    for sid, tty in terminals:
-        while tty.master_read.poll():
+    Returns list of clients for which output was buffered.
+    """
+    from x84.terminal import kill_session, find_tty_by_sid, get_terminals
+    from x84.terminal import subscribe, unsubscribe, publish, send_tty
+    from x84.presence import update_presence, get_presence
+    from x84.shard import forward
+    from x84.framing import recv_event, encode
+    from x84.db import DBHandler, get_db_worker_pool
+
+    db_workers = get_db_worker_pool()
+    outgoing = list()
+    for tty in terminals:
+        sid = tty.sid
+        if find_tty_by_sid(sid) is not tty:
+            # killed by an event of a session earlier in this pass
+            continue
+        # stop reading when the client can't keep up with session output,
+        # its pipe is read again once the send buffer drains.
+        while (len(tty.client.send_buffer) < tty.client.SEND_HIGH_WATER
+               and tty.master_read.poll()):
             try:
-                event, data = tty.master_read.recv()
+                event, data = recv_event(tty.master_read)
             except (EOFError, IOError) as err:
                 # sub-process unexpectedly closed
                 msg_err = 'master_read pipe: {err}'.format(err=err)
                 log.exception(msg_err)
                 kill_session(tty.client, msg_err)
                 break
-            except TypeError:
+            except (TypeError, ValueError):
                 msg_err = 'unpickling error'
                 log.exception(msg_err)
                 break
@@ -427,84 +435,171 @@ def session_recv(locks, terminals, log, tap_events):
                 kill_session(tty.client, 'client exit')
                 break
 
-            # 'logger' event, prefix log message with handle and IP address
+            # 'logger' event, a batch of log records: prefix log message
+            # with handle and IP address
             elif event == 'logger':
-                data.msg = ('{data.handle}[{tty.sid}] {data.msg}'
-                            .format(data=data, tty=tty))
-                log.handle(data)
+                for record in data:
+                    record.msg = ('{record.handle}[{tty.sid}] {record.msg}'
+                                  .format(record=record, tty=tty))
+                    log.handle(record)
 
             # 'output' event, buffer for tcp socket
             elif event == 'output':
-                tty.client.send_unicode(ucs=data[0], encoding=data[1])
+                text, encoding = data
+                if isinstance(text, unicode):
+                    tty.client.send_unicode(ucs=text, encoding=encoding)
+                else:
+                    # binary frame, encoded by the session.
+                    tty.client.send_encoded(text)
+                if not outgoing or outgoing[-1] is not tty.client:
+                    outgoing.append(tty.client)
+
+            # 'output-ring': output waits in shared memory, encoded; read
+            # only as many bytes as announced, keeping order with 'output'.
+            elif event == 'output-ring':
+                tty.client.send_encoded(tty.ring.read(data))
+                if not outgoing or outgoing[-1] is not tty.client:
+                    outgoing.append(tty.client)
 
             # 'remote-disconnect' event, hunt and destroy
             elif event == 'remote-disconnect':
                 send_to = data[0]
-                reason = 'remote-disconnect by {sid.tty}'.format(sid=sid)
-                for _sid, _tty in terminals:
-                    if send_to == _sid:
-                        kill_session(tty.client, reason)
-                        break
+                reason = 'remote-disconnect by {sid}'.format(sid=sid)
+                _tty = find_tty_by_sid(send_to)
+                if _tty is not None:
+                    kill_session(_tty.client, reason)
+                else:
+                    # session of another shard, if any
+                    forward(event, (send_to, reason))
 
             # 'route': message passing directly from one session to another
             elif event == 'route':
                 if tap_events:
                     log.debug('route {0!r}'.format(data))
                 tgt_sid, send_event, send_val = data[0], data[1], data[2:]
-                for _sid, _tty in terminals:
-                    if tgt_sid == _sid:
-                        _tty.master_write.send((send_event, send_val))
-                        break
+                _tty = find_tty_by_sid(tgt_sid)
+                if _tty is not None:
+                    send_tty(_tty, send_event, send_val)
+                else:
+                    # session of another shard, if any
+                    forward(event, data)
 
             # 'global': message broadcasting to all sessions
             elif event == 'global':
                 if tap_events:
                     log.debug('broadcast: {data!r}'.format(data=data))
-                for _sid, _tty in terminals:
+                # serialized once for all recipients
+                frame = encode(event, data)
+                for _sid, _tty in get_terminals():
                     if sid != _sid:
-                        _tty.master_write.send((event, data,))
+                        send_tty(_tty, event, frame=frame)
+                # and to sessions of all other shards
+                forward(event, (sid, data))
+
+            # 'subscribe', 'unsubscribe': interest in a 'publish' topic.
+            elif event == 'subscribe':
+                subscribe(tty, data)
+
+            elif event == 'unsubscribe':
+                unsubscribe(tty, data)
+
+            # 'publish': event for subscribers of topic only.
+            elif event == 'publish':
+                topic, value = data
+                if tap_events:
+                    log.debug('[{tty.sid}] publish {topic}: {value!r}'
+                              .format(tty=tty, topic=topic, value=value))
+                publish(topic, value, sender=sid)
+                # and to subscribers of all other shards
+                forward(event, (sid, data))
+
+            # 'presence': who's online attributes of session changed.
+            elif event == 'presence':
+                update_presence(sid, data)
+                # and to other shards
+                forward(event, (sid, data))
+
+            elif event == 'presence-req':
+                send_tty(tty, 'presence', get_presence())
 
             # 'set-timeout': set user-preferred timeout
             elif event == 'set-timeout':
                 if tap_events:
                     log.debug('[{tty.sid}] set-timeout {data}'
                               .format(tty=tty, data=data))
-                tty.timeout = data
+                tty.set_timeout(data)
+
+            # 'timer-start': send event to session after delay.
+            elif event == 'timer-start':
+                name, delay, value = data
+                tty.start_timer(name, delay, value)
+
+            elif event == 'timer-stop':
+                tty.stop_timer(data)
 
-            # 'db*': access DBProxy API for shared sqlitedict
+            # 'db*': access DBProxy API for shared sqlitedict, queued for
+            # the pool of database worker threads.
             elif event.startswith('db'):
-                thread = DBHandler(tty.master_write, event, data)
-                thread.start()
+                db_workers.put(DBHandler(tty.master_write, event, data,
+                                         sid=tty.sid))
 
-            # 'lock': access fine-grained bbs-global locking
+            # 'lock': access fine-grained bbs-global locking, decided by
+            # the coordinator when sharded.
             elif event.startswith('lock'):
-                handle_lock(locks, tty, event, data, tap_events, log)
+                if not forward(event, (sid, data)):
+                    locks.handle(tty, event, data)
 
             else:
                 log.error('[{tty.sid}] unhandled event, data: '
                           '({event}, {data})'
                           .format(tty=tty, event=event, data=data))
+    return outgoing
+
+
+def publish_changes(log, tap_events):
+    """
+    Publish notices of changes committed to databases by database worker
+    threads to sessions subscribed, see :func:`x84.db.notify_changed`.
+    """
+    from x84.db import pop_changes, CHANGED_TOPIC
+    from x84.terminal import publish
+    from x84.shard import forward
+    for sid, schema, changes in pop_changes():
+        topic = CHANGED_TOPIC.format(schema)
+        if tap_events:
+            log.debug('[{sid}] publish {topic}: {changes!r}'
+                      .format(sid=sid, topic=topic, changes=changes))
+        publish(topic, changes, sender=sid)
+        # and to subscribers of all other shards
+        forward('publish', (sid, (topic, changes)))
 
 
 def _loop(servers):
     """
-    Main event loop. Never returns.
+    Main event loop. Never returns, unless the coordinator of a sharded
+    engine has exited.
     """
     # pylint: disable=R0912,R0914,R0915
     #         Too many local variables (24/15)
-    import select
     import sys
-    from x84.terminal import get_terminals, kill_session
+    from x84.terminal import (get_terminals, kill_session, find_tty,
+                              find_tty_by_fd)
     from x84.bbs.ini import CFG
     from x84.fail2ban import get_fail2ban_function
-
+    from x84.poller import get_poller, READ, WRITE
+    from x84.shard import get_coordinator, coordinator_recv
+    from x84.prefork import start_worker_pool
+    from x84.locks import get_lock_table
+    from x84.timers import get_timer_wheel
+    from x84.db import get_db_worker_pool
+
+    # polling time when output is pending for clients which cannot be
+    # polled for write-readiness (ssh), or for any WIN32 session.
     SELECT_POLL = 0.02  # polling time is 20ms
 
     # WIN32 has no session_fds (multiprocess queues are not polled using
-    # select), use a persistently empty set; for WIN32, sessions are always
-    # polled for data at every loop.
+    # select); for WIN32, sessions are always polled for data at every loop.
     WIN32 = sys.platform.lower().startswith('win32')
-    session_fds = set()
 
     log = logging.getLogger('x84.engine')
 
@@ -513,7 +608,37 @@ def _loop(servers):
 
     tap_events = CFG.getboolean('session', 'tap_events')
     check_ban = get_fail2ban_function()
-    locks = dict()
+    locks = get_lock_table()
+    timers = get_timer_wheel()
+
+    # fork session workers ahead of time, when enabled, before starting
+    # threads of our own.
+    start_worker_pool()
+
+    # database worker threads, whose changes are published each pass.
+    get_db_worker_pool()
+
+    # listening sockets are registered once; client sockets are registered
+    # by accept(), session pipes by register_tty(), and both unregistered
+    # by kill_session().
+    poller = get_poller()
+    listeners = dict()
+    for server in servers:
+        listeners[server.server_socket.fileno()] = server
+        poller.register(server.server_socket.fileno())
+
+    # events relayed from sessions of other shards, when sharded.
+    coordinator = get_coordinator()
+    if coordinator is not None:
+        poller.register(coordinator.fileno())
+
+    # file descriptors of clients registered for write-readiness
+    want_write = set()
+    pending = list()
+
+    # sessions whose pipes are not polled, their client's send buffer
+    # is above its high-water mark.
+    throttled = set()
 
     while True:
         # shutdown, close & delete inactive clients,
@@ -525,50 +650,79 @@ def _loop(servers):
                     kill_session(client, 'socket shutdown')
                     del server.clients[key]
             # on-connect negotiations that have completed or failed.
-            # delete their thread instance from further evaluation
-            for thread in [_thread for _thread in server.threads
-                           if _thread.stopped][:]:
-                server.threads.remove(thread)
-
-        check_r = list()
-        for server in servers:
-            check_r.append(server.server_socket.fileno())
-            check_r.extend(server.client_fds())
-        if not WIN32:
-            # WIN32's IPC is not done using sockets, so it
-            # is not possible to use select.select() on them
-            session_fds = get_session_output_fds(servers)
-            check_r.extend(session_fds)
-
-        # We'd like to use timeout 'None', but the registration of
-        # a new client in terminal.start_process surprises us with new
-        # file descriptors for the session i/o.  Unless we loop for
-        # additional `session_fds', a connecting client would block.
-        ready_r, _, _ = select.select(check_r, [], [], SELECT_POLL)
+            # delete their instance from further evaluation
+            for connect in [_connect for _connect in server.connects
+                            if _connect.stopped][:]:
+                server.connects.remove(connect)
+
+        # block until any file descriptor is ready, or until the next
+        # timer is due: idle timeouts, deadlines of on-connect
+        # negotiation, sessions waiting for a lock, and such.
+        timeout = timers.get_timeout()
+        if WIN32 or any(not client.POLL_WRITABLE for client in pending):
+            timeout = (SELECT_POLL if timeout is None
+                       else min(timeout, SELECT_POLL))
+        ready_r, _ = poller.poll(timeout)
+
+        # call timers that have expired.
+        timers.advance()
+
+        # notify sessions of changes committed to databases.
+        publish_changes(log, tap_events)
 
         for fd in ready_r:
             # see if any new tcp connections were made
-            server = find_server(servers, fd)
+            server = listeners.get(fd)
             if server is not None:
                 accept(log, server, check_ban)
 
-        # receive new data from tcp clients.
-        client_recv(servers, ready_r, log)
-        terms = get_terminals()
-
-        # receive new data from session terminals
-        if WIN32 or set(session_fds) & set(ready_r):
+        # receive events for our sessions from other shards.
+        if coordinator is not None and coordinator.fileno() in ready_r:
             try:
-                session_recv(locks, terms, log, tap_events)
-            except IOError as err:
-                # if the ipc closes while we poll, warn and continue
-                log.warn(err)
+                coordinator_recv(log)
+            except (EOFError, IOError) as err:
+                # without a coordinator there is nobody to serve locks
+                log.error('coordinator connection lost: {0}'.format(err))
+                return
 
-        # send tcp data to clients
-        client_send(terms, log)
+        # receive new data from tcp clients.
+        received = client_recv(servers, ready_r, log)
+
+        # advance on-connect negotiations of clients that have
+        # received data, or were woken.
+        connect_step(servers, received)
 
-        # send session data, poll for user-timeout and disconnect them
-        session_send(terms)
+        # receive new data from session terminals
+        if WIN32:
+            ready_ttys = [tty for _, tty in get_terminals()]
+        else:
+            ready_ttys = filter(None, map(find_tty_by_fd, ready_r))
+        try:
+            outgoing = session_recv(locks, ready_ttys, log, tap_events)
+        except IOError as err:
+            # if the ipc closes while we poll, warn and continue
+            log.warn(err)
+            outgoing = list()
+
+        # send tcp data to clients: output of sessions, replies to telnet
+        # commands, and output remaining from a previous pass.
+        outgoing = set(outgoing) | set(received) | set(pending)
+        pending = client_send(outgoing, log)
+
+        # poll for write-readiness only while output remains buffered.
+        now_write = set(client.fileno() for client in pending
+                        if client.POLL_WRITABLE and client.is_active())
+        for fd in want_write - now_write:
+            poller.modify(fd, READ)
+        for fd in now_write - want_write:
+            poller.modify(fd, READ | WRITE)
+        want_write = now_write
+
+        # hold back output of sessions whose clients can't keep up.
+        throttled = throttle(poller, pending, throttled)
+
+        # send session data of clients that received input.
+        session_send(filter(None, map(find_tty, received)))
 
 
 if __name__ == '__main__':
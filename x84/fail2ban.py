@@ -16,6 +16,9 @@ The following options are available, but not required:
 - ``initial_ban_length``: ban length (in seconds) when an IP is blacklisted.
 - ``ban_increment_length``: amount of time (in seconds) to add to a ban on
   subsequent login attempts
+
+Records of bans and of attempted logins are removed once they expire, as
+scheduled on the engine's timer wheel, see :mod:`x84.timers`.
 """
 
 # std imports
@@ -26,6 +29,24 @@ import time
 BANNED_IP_LIST, ATTEMPTED_LOGINS = dict(), dict()
 
 
+def _prune(ip, records, key=None):
+    """
+    Remove record of ``ip`` from ``records`` once it has expired, or
+    schedule to try again at its expiry, should it have been extended.
+
+    Value of each record is its time of expiry, or, given ``key``, a
+    dictionary whose ``key`` is.
+    """
+    from x84.timers import get_timer_wheel
+    if ip not in records:
+        return
+    expiry = records[ip] if key is None else records[ip][key]
+    if int(time.time()) > expiry:
+        del records[ip]
+    else:
+        get_timer_wheel().schedule_at(expiry + 1, _prune, ip, records, key)
+
+
 def get_fail2ban_function():
     """
     Return a function used to ban aggressively-connecting clients.
@@ -100,6 +121,7 @@ def get_fail2ban_function():
                     'attempts': 1,
                     'expiry': now + max_attempted_logins_window
                 }
+                _prune(ip, ATTEMPTED_LOGINS, 'expiry')
                 log.debug('Banned IP expired: {ip}'.format(ip=ip))
             else:
                 # increase the expiry and kick them out
@@ -120,6 +142,7 @@ def get_fail2ban_function():
                 # max # of attempts reached
                 del ATTEMPTED_LOGINS[ip]
                 BANNED_IP_LIST[ip] = now + initial_ban_length
+                _prune(ip, BANNED_IP_LIST)
                 log.warn('Exceeded maximum attempts; banning {ip}'
                          .format(ip=ip))
                 return False
@@ -138,6 +161,7 @@ def get_fail2ban_function():
                 'attempts': 1,
                 'expiry': now + max_attempted_logins_window,
             }
+            _prune(ip, ATTEMPTED_LOGINS, 'expiry')
         return True
 
     return wrapper
@@ -0,0 +1,138 @@
+"""
+Compact binary framing of IPC events for x/84, https://github.com/jquast/x84
+
+Events between the engine and sessions are ``(event, data)`` tuples sent
+over a ``multiprocessing.Pipe``.  ``Connection.send()`` pickles every one
+of them, though most are keyboard input and screen output: a bytestring
+or unicode text that needs no pickling at all.
+
+These hot events are written as length-prefixed binary frames using
+``send_bytes()`` instead, their first byte a tag identifying the kind of
+frame:
+
+- ``I``: 'input', raw bytes received from the client.
+- ``O``: 'output', encoding name, NUL, and text already encoded by the
+  session for the client, received as ``(bytes, encoding)``: the engine
+  need not decode nor encode it again.
+- ``D``: 'output-ring', a doorbell: a number of bytes of output, given
+  in decimal, is waiting in the session's shared-memory ring buffer, see
+  :mod:`x84.ring`.
+- ``M``: 'refresh' and 'db' events, event name, NUL, and data serialized
+  by :mod:`marshal`, when it is made only of builtin types, see
+  :func:`is_marshalable`.
+
+Any other event, or data that can't be marshaled, is pickled as before.
+Pickles always begin with the ``PROTO`` opcode, ``'\\x80'``, so that
+:func:`decode` can tell them from binary frames, and events sent by
+``Connection.send()`` are still received.
+"""
+# std imports
+import cPickle
+import marshal
+
+#: first byte of a pickle of protocol 2 or higher.
+PICKLE_PROTO = b'\x80'
+
+TAG_INPUT = b'I'
+TAG_OUTPUT = b'O'
+TAG_DOORBELL = b'D'
+TAG_MARSHAL = b'M'
+
+#: types :mod:`marshal` returns as they were given, exactly: it accepts
+#: subclasses of them, and types such as ``bytearray``, but returns them
+#: as another type, or, for ``unicode`` subclasses, corrupted.
+MARSHAL_SCALARS = frozenset((type(None), bool, int, long, float, complex,
+                             str, unicode))
+
+#: container types returned as given, when their items are too.
+MARSHAL_CONTAINERS = frozenset((tuple, list, set, frozenset, dict))
+
+
+def is_marshalable(value):
+    """
+    Whether ``value`` is returned unchanged by :mod:`marshal`: made only
+    of :data:`MARSHAL_SCALARS` and :data:`MARSHAL_CONTAINERS`, by exact
+    type, not subclass.
+    """
+    stack, seen = [value], set()
+    while stack:
+        item = stack.pop()
+        kind = type(item)
+        if kind in MARSHAL_SCALARS:
+            continue
+        if kind not in MARSHAL_CONTAINERS or id(item) in seen:
+            # a container seen twice may be recursive, left to pickle.
+            return False
+        seen.add(id(item))
+        if kind is dict:
+            stack.extend(item.iterkeys())
+            stack.extend(item.itervalues())
+        else:
+            stack.extend(item)
+    return True
+
+
+def encode(event, data):
+    """
+    Return ``(event, data)`` serialized as a bytestring frame.
+    """
+    if event == 'input' and type(data) is bytes:
+        return TAG_INPUT + data
+
+    elif event == 'output':
+        ucs, encoding = data
+        return b''.join((TAG_OUTPUT, str(encoding), b'\x00',
+                         ucs.encode(encoding, 'replace')))
+
+    elif event == 'output-ring':
+        return TAG_DOORBELL + str(int(data))
+
+    elif ((event == 'refresh' or event.startswith('db'))
+          and is_marshalable(data)):
+        return b''.join((TAG_MARSHAL, event, b'\x00',
+                         marshal.dumps(data, 2)))
+
+    return cPickle.dumps((event, data), cPickle.HIGHEST_PROTOCOL)
+
+
+def decode(frame):
+    """
+    Return ``(event, data)`` of a bytestring frame.
+
+    :raises ValueError: frame is not of any known kind.
+    """
+    tag = frame[:1]
+    if tag == TAG_INPUT:
+        return 'input', frame[1:]
+
+    elif tag == TAG_OUTPUT:
+        encoding, text = frame[1:].split(b'\x00', 1)
+        return 'output', (text, encoding)
+
+    elif tag == TAG_DOORBELL:
+        return 'output-ring', int(frame[1:])
+
+    elif tag == TAG_MARSHAL:
+        event, payload = frame[1:].split(b'\x00', 1)
+        return event, marshal.loads(payload)
+
+    elif tag == PICKLE_PROTO:
+        return cPickle.loads(frame)
+
+    raise ValueError('unknown frame tag: {0!r}'.format(tag))
+
+
+def send_event(conn, event, data):
+    """
+    Send ``(event, data)`` over ``multiprocessing.Connection`` ``conn``.
+    """
+    conn.send_bytes(encode(event, data))
+
+
+def recv_event(conn):
+    """
+    Receive ``(event, data)`` from ``multiprocessing.Connection`` ``conn``.
+
+    Events sent using ``conn.send()`` are also received.
+    """
+    return decode(conn.recv_bytes())
@@ -0,0 +1,319 @@
+"""
+Lock service for x/84, https://github.com/jquast/x84
+
+Sessions send events of the form ``('lock-<name>', (method, stale))``,
+where ``method`` is 'acquire' or 'release', see
+:meth:`x84.bbs.session.Session.acquire_lock`.  The engine, or the
+coordinator when sharded, answers 'acquire' with event ``'lock-<name>'``
+and value True when the lock is granted, or False when it is not.
+
+Without a ``timeout``, the answer is immediate.  Given a third value,
+``timeout``, the caller waits in line, first come, first served, until
+the lock is released or ``timeout`` seconds elapse.  A timeout of None
+waits indefinitely.
+
+Locks held by a session are released when it is unregistered, or found
+to have ended, granting them to the next in line.  A lock held longer
+than the ``stale`` value of a session waiting in line is released to the
+next in line, as scheduled on the engine's timer wheel, see
+:mod:`x84.timers`, or when a session asks for it giving a ``stale``
+value: it is granted to that session only when none are waiting.
+
+Numbered locks of the form ``'lock-<pool>/<number>'`` make a pool of
+nodes.  Event ``('lock-<pool>', ('allocate', first, count))`` acquires
+the lowest free node from ``first`` to ``first + count - 1`` in a single
+request, answered with the node number, or None when all are in use, see
+:meth:`x84.bbs.session.Session.acquire_node`.  Event
+``('lock-<pool>', ('map', None))`` is answered with the node map, a
+dictionary of node number to session-id holding it.
+"""
+# std imports
+import collections
+import logging
+import time
+
+#: singleton instance of :class:`LockTable`.
+LOCKS = None
+
+
+class Waiter(object):
+
+    """ A session waiting to acquire a lock. """
+    # pylint: disable=R0903
+    #         Too few public methods
+
+    def __init__(self, tty, stale):
+        self.tty = tty
+        self.stale = stale
+        #: timer answering False once timeout elapses, if any.
+        self.timer = None
+        #: set when granted or timed out.
+        self.done = False
+
+
+class LockTable(object):
+
+    """
+    Locks held by sessions, and sessions waiting for them.
+    """
+
+    def __init__(self, tap_events=False):
+        self.log = logging.getLogger(__name__)
+        self.tap_events = tap_events
+        #: index of lock name to tuple of ``(time acquired, holder sid)``.
+        self.held = dict()
+        #: index of session-id to set of lock names held.
+        self.by_sid = dict()
+        #: index of lock name to deque of :class:`Waiter` in line.
+        self.waiters = dict()
+
+    def handle(self, tty, event, data):
+        """
+        Handle locking event of (lock-key, (method, stale[, timeout])),
+        or of node pool (lock-pool, (method, first, count)).
+        """
+        method = data[0]
+        if method == 'acquire':
+            timeout = data[2] if len(data) > 2 else 0
+            self.acquire(tty, event, data[1], timeout)
+        elif method == 'release':
+            self.release(tty, event)
+        elif method == 'allocate':
+            _, first, count = data
+            self.allocate(tty, event, first, count)
+        elif method == 'map':
+            self._send(tty, event, self.node_map(event))
+        else:
+            self.log.error('[{tty.sid}] {event} unknown method: {method}'
+                           .format(tty=tty, event=event, method=method))
+
+    def holder(self, name):
+        """
+        Return session-id holding lock ``name``, None if not held.
+
+        A lock held by a session no longer active is released, granting
+        it to the next in line.
+        """
+        from x84.terminal import find_tty_by_sid
+        if name not in self.held:
+            return None
+        sid = self.held[name][1]
+        if find_tty_by_sid(sid) is None:
+            self.log.debug('{name} was held by session no longer active: '
+                           '{sid}'.format(name=name, sid=sid))
+            self._forget(name)
+            self._wake(name)
+            return self.held.get(name, (None, None))[1]
+        return sid
+
+    def acquire(self, tty, name, stale=None, timeout=0):
+        """
+        Grant lock ``name`` to session of ``tty``.
+
+        If it is held by another session, False is answered when
+        ``timeout`` is 0, otherwise the session waits in line.  A stale
+        lock is released to the first in line, if any, before the caller.
+        """
+        holder = self.holder(name)
+        if (holder not in (None, tty.sid) and stale is not None and
+                time.time() - self.held[name][0] > stale):
+            # caller has decreed that this lock may be acquired even if
+            # it already held, if it has been held longer than length of
+            # time `stale`.  This is simply to prevent a global freeze
+            # when the programmer knows the holder may fail to release.
+            self.log.warn('[{tty.sid}] {name} re-acquiring stale lock, '
+                          'previously held active session {holder} after '
+                          '{elapsed}s elapsed (stale={stale})'
+                          .format(tty=tty, name=name, holder=holder,
+                                  elapsed=time.time() - self.held[name][0],
+                                  stale=stale))
+            self._forget(name)
+            self._wake(name)
+            holder = self.holder(name)
+
+        if holder is None:
+            self._grant(tty, name)
+
+        elif holder == tty.sid:
+            # acquire the lock from ourselves!  We'll allow it
+            # (this is termed, "re-entrant locking").
+            self.log.debug('[{tty.sid}] {name} is re-acquired!'
+                           .format(tty=tty, name=name))
+            self._grant(tty, name)
+
+        elif timeout == 0:
+            # signal busy with matching event, data=False
+            self._send(tty, name, False)
+            self.log.warn('[{tty.sid}] {name} lock rejected; already held '
+                          'by active session {holder}'
+                          .format(tty=tty, name=name, holder=holder))
+
+        else:
+            from x84.timers import get_timer_wheel
+            waiter = Waiter(tty, stale)
+            self.waiters.setdefault(name, collections.deque()).append(waiter)
+            if timeout is not None:
+                waiter.timer = get_timer_wheel().schedule(
+                    timeout, self._expire, name, waiter)
+            if stale is not None:
+                self._schedule_stale(name)
+            if self.tap_events:
+                self.log.debug('[{tty.sid}] {name} waiting, held by '
+                               '{holder}'.format(tty=tty, name=name,
+                                                 holder=holder))
+
+    def allocate(self, tty, pool, first, count):
+        """
+        Grant lowest free node of ``pool`` to session of ``tty``.
+
+        A node of the pool already held by the session is answered again.
+        """
+        nodes = range(first, first + count)
+        for node, sid in self.node_map(pool).items():
+            if sid == tty.sid and node in nodes:
+                self._send(tty, pool, node)
+                return
+        for node in nodes:
+            name = '{0}/{1}'.format(pool, node)
+            if self.holder(name) is None:
+                self._grant(tty, name, answer=(pool, node))
+                return
+        self._send(tty, pool, None)
+        self.log.warn('[{tty.sid}] {pool} has no free nodes of {count}.'
+                      .format(tty=tty, pool=pool, count=count))
+
+    def node_map(self, pool):
+        """ Returns dictionary of node number to session-id of ``pool``. """
+        prefix = '{0}/'.format(pool)
+        nodes = dict()
+        for name in list(self.held):
+            if name.startswith(prefix) and name[len(prefix):].isdigit():
+                sid = self.holder(name)
+                if sid is not None:
+                    nodes[int(name[len(prefix):])] = sid
+        return nodes
+
+    def release(self, tty, name):
+        """ Release lock ``name`` held by session of ``tty``. """
+        if self.held.get(name, (None, None))[1] != tty.sid:
+            self.log.error('[{tty.sid}] {name} lock failed to release, '
+                           'not acquired.'.format(tty=tty, name=name))
+            return
+        self._forget(name)
+        if self.tap_events:
+            self.log.debug('[{tty.sid}] {name} released lock.'
+                           .format(tty=tty, name=name))
+        self._wake(name)
+
+    def release_all(self, sid):
+        """ Release all locks held by session ``sid``. """
+        for name in list(self.by_sid.get(sid, ())):
+            self.log.debug('[{sid}] {name} released, session ended.'
+                           .format(sid=sid, name=name))
+            self._forget(name)
+            self._wake(name)
+
+    def _expire(self, name, waiter):
+        """ Answer False to ``waiter`` whose timeout has elapsed. """
+        if not waiter.done:
+            waiter.done = True
+            self._answer(waiter.tty, name, False)
+
+    def _schedule_stale(self, name):
+        """
+        Schedule release of lock ``name`` once held longer than the least
+        ``stale`` value of sessions waiting for it.
+        """
+        from x84.timers import get_timer_wheel
+        stales = [waiter.stale for waiter in self.waiters.get(name, ())
+                  if not waiter.done and waiter.stale is not None]
+        if stales and name in self.held:
+            holding = self.held[name]
+            get_timer_wheel().schedule_at(holding[0] + min(stales),
+                                          self._expire_stale, name, holding)
+
+    def _expire_stale(self, name, holding):
+        """
+        Release lock ``name``, if still held as ``holding``, to the next
+        in line.
+        """
+        if self.held.get(name) is not holding:
+            # released or re-acquired since.
+            return
+        # callers have decreed that this lock may be acquired even if
+        # it already held, if it has been held longer than length of
+        # time `stale`.  This is simply to prevent a global freeze
+        # when the programmer knows the holder may fail to release.
+        self.log.warn('{name} releasing stale lock, held by session {sid} '
+                      'for {elapsed:0.1f}s'.format(
+                          name=name, sid=holding[1],
+                          elapsed=time.time() - holding[0]))
+        self._forget(name)
+        self._wake(name)
+
+    def _grant(self, tty, name, answer=None):
+        """
+        Record lock ``name`` held by session of ``tty``, and answer with
+        event ``answer``, default ``(name, True)``.
+        """
+        self.held[name] = (time.time(), tty.sid)
+        self.by_sid.setdefault(tty.sid, set()).add(name)
+        self._send(tty, *(answer or (name, True)))
+        if self.tap_events:
+            self.log.debug('[{tty.sid}] {name} granted lock.'
+                           .format(tty=tty, name=name))
+        if self.waiters.get(name):
+            self._schedule_stale(name)
+
+    def _forget(self, name):
+        """ Remove record of lock ``name``. """
+        _, sid = self.held.pop(name)
+        names = self.by_sid.get(sid, set())
+        names.discard(name)
+        if not names:
+            self.by_sid.pop(sid, None)
+
+    def _wake(self, name):
+        """ Grant lock ``name`` to the next active session in line. """
+        from x84.terminal import find_tty_by_sid
+        queue = self.waiters.get(name)
+        while queue:
+            waiter = queue.popleft()
+            if waiter.done or find_tty_by_sid(waiter.tty.sid) is None:
+                continue
+            waiter.done = True
+            if waiter.timer is not None:
+                waiter.timer.cancel()
+            self._grant(waiter.tty, name)
+            break
+        if not queue:
+            self.waiters.pop(name, None)
+
+    def _answer(self, tty, name, value):
+        """ Answer session of ``tty``, unless it is no longer active. """
+        from x84.terminal import find_tty_by_sid
+        if find_tty_by_sid(tty.sid) is not None:
+            self._send(tty, name, value)
+
+    @staticmethod
+    def _send(tty, event, data):
+        """
+        Send ``(event, data)`` to session of ``tty``.
+
+        A session whose pipe is closed is killed, releasing its locks.
+        """
+        from x84.terminal import send_tty
+        send_tty(tty, event, data)
+
+
+def get_lock_table():
+    """ Return the :class:`LockTable`, created on first use. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global LOCKS
+    if LOCKS is None:
+        from x84.bbs.ini import get_ini
+        LOCKS = LockTable(tap_events=get_ini(section='session',
+                                             key='tap_events',
+                                             getter='getboolean'))
+    return LOCKS
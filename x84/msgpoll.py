@@ -306,20 +306,24 @@ def publish_network_messages(net):
     transdb = DBProxy('{0}trans'.format(net['name']), use_session=False)
     msgdb = DBProxy(MSGDB, use_session=False)
 
+    # fetch queued messages and translations in one request each.
+    queued = sorted(queuedb.keys(), cmp=lambda x, y: cmp(int(x), int(y)))
+    msgs = msgdb.get_many(queued)
+    translations = dict(transdb.items())
+
     # publish each message
-    for msg_id in sorted(queuedb.keys(),
-                         cmp=lambda x, y: cmp(int(x), int(y))):
-        if msg_id not in msgdb:
+    for msg_id in queued:
+        if msg_id not in msgs:
             log.warn('[{net[name]}] No such message (msg_id={msg_id})'
                      .format(net=net, msg_id=msg_id))
             del queuedb[msg_id]
             continue
 
-        msg = msgdb[msg_id]
+        msg = msgs[msg_id]
 
         trans_parent = None
         if msg.parent is not None:
-            matches = [key for key, data in transdb.items()
+            matches = [key for key, data in translations.items()
                        if int(data) == msg.parent]
 
             if len(matches) > 0:
@@ -335,7 +339,7 @@ def publish_network_messages(net):
                       .format(net=net, msg_id=msg_id))
             continue
 
-        if trans_id in transdb.keys():
+        if trans_id in translations:
             log.error('[{net[name]}] trans_id={trans_id} conflicts with '
                       '(msg_id={msg_id})'
                       .format(net=net, trans_id=trans_id, msg_id=msg_id))
@@ -346,6 +350,7 @@ def publish_network_messages(net):
         # transform, and possibly duplicate(?) message ..
         with transdb, msgdb, queuedb:
             transdb[trans_id] = msg_id
+            translations[trans_id] = msg_id
             msg.body = u''.join((msg.body, format_origin_line()))
             msgdb[msg_id] = msg
             del queuedb[msg_id]
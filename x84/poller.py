@@ -0,0 +1,247 @@
+"""
+Readiness notification for the x/84 engine event loop.
+
+File descriptors (listening sockets, client sockets and session pipes) are
+registered once, as they come and go, rather than re-built into a list for
+every pass of the main loop.  The loop then blocks until one of them is
+ready, instead of waking at a fixed polling interval.
+
+epoll(7) is used where available, poll(2) otherwise, and select(2) as a
+last resort.
+"""
+# std imports
+import threading
+import logging
+import select
+import errno
+import sys
+import os
+
+#: singleton instance of :class:`Poller`, see :func:`get_poller`.
+POLLER = None
+
+#: event mask: file descriptor is ready for reading.
+READ = 0x01
+
+#: event mask: file descriptor is ready for writing.
+WRITE = 0x02
+
+
+class Poller(object):
+
+    """
+    Register file descriptors once and block until any are ready.
+
+    Registration is thread-safe: other threads, such as those of ssh
+    transports, may deactivate clients while the main thread is blocked in
+    :meth:`poll`.  A "self-pipe" is written to by :meth:`wakeup` so that
+    the blocked main loop returns to re-evaluate its state.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+        #: registered file descriptors and their event mask.
+        self._fds = dict()
+
+        #: file descriptors found ready for reading by the last poll.
+        self._readable = frozenset()
+
+        if hasattr(select, 'epoll'):
+            self.kind = 'epoll'
+            self._poll = select.epoll()
+            self._flags = {READ: select.EPOLLIN | select.EPOLLPRI,
+                           WRITE: select.EPOLLOUT}
+            self._hangup = (select.EPOLLERR | select.EPOLLHUP)
+            self._invalid = 0
+        elif hasattr(select, 'poll'):
+            self.kind = 'poll'
+            self._poll = select.poll()
+            self._flags = {READ: select.POLLIN | select.POLLPRI,
+                           WRITE: select.POLLOUT}
+            self._hangup = (select.POLLERR | select.POLLHUP)
+            self._invalid = select.POLLNVAL
+        else:
+            self.kind = 'select'
+            self._poll = None
+
+        # WIN32's IPC is not done using sockets, os.pipe() cannot be
+        # selected on, the engine loop does not block on that platform.
+        self._wake_r, self._wake_w = None, None
+        if not sys.platform.lower().startswith('win32'):
+            self._wake_r, self._wake_w = os.pipe()
+            for _fd in (self._wake_r, self._wake_w):
+                _set_nonblocking(_fd)
+            self.register(self._wake_r)
+
+    def _event_flags(self, mask):
+        """ Return epoll or poll event flags for ``mask``. """
+        flags = 0
+        for bit, value in self._flags.items():
+            if mask & bit:
+                flags |= value
+        return flags
+
+    def register(self, fd, mask=READ):
+        """
+        Register file descriptor ``fd`` for readiness events of ``mask``.
+
+        Registering an already registered file descriptor modifies its mask.
+        """
+        if fd is None or fd < 0:
+            return
+        with self._lock:
+            if self._poll is not None:
+                if fd in self._fds:
+                    self._poll.modify(fd, self._event_flags(mask))
+                else:
+                    self._poll.register(fd, self._event_flags(mask))
+            self._fds[fd] = mask
+        self.wakeup()
+
+    def modify(self, fd, mask):
+        """ Modify the event mask of a registered file descriptor ``fd``. """
+        with self._lock:
+            if fd not in self._fds or self._fds[fd] == mask:
+                return
+            if self._poll is not None:
+                self._poll.modify(fd, self._event_flags(mask))
+            self._fds[fd] = mask
+
+    def unregister(self, fd):
+        """
+        Unregister file descriptor ``fd``.
+
+        Should be called before ``fd`` is closed, a file descriptor number
+        may be re-used by the very next connection.
+        """
+        with self._lock:
+            if self._fds.pop(fd, None) is None:
+                return
+            if self._poll is not None:
+                try:
+                    self._poll.unregister(fd)
+                except (IOError, OSError, KeyError, ValueError) as err:
+                    # already closed (epoll removes closed descriptors)
+                    self.log.debug('unregister fd {0}: {1}'.format(fd, err))
+
+    def is_registered(self, fd):
+        """ Returns True if file descriptor ``fd`` is registered. """
+        return fd in self._fds
+
+    def wakeup(self):
+        """ Cause any thread blocked in :meth:`poll` to return. """
+        if self._wake_w is None:
+            return
+        try:
+            os.write(self._wake_w, b'\x00')
+        except OSError as err:
+            # EAGAIN: the pipe is already full of wakeup signals.
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def _drain_wakeup(self):
+        """ Discard all pending bytes of the wakeup pipe. """
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except OSError as err:
+            if err.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                raise
+
+    def poll(self, timeout=None):
+        """
+        Block until any registered file descriptor is ready.
+
+        :param float timeout: seconds to wait, ``None`` to block until ready.
+        :returns: tuple of lists of file descriptors ready for reading and
+                  writing, ``(ready_r, ready_w)``.
+        :rtype: tuple
+        """
+        if self.kind == 'select':
+            events = self._poll_select(timeout)
+        else:
+            events = self._poll_events(timeout)
+
+        ready_r, ready_w = list(), list()
+        for fd, mask in events:
+            if fd == self._wake_r:
+                self._drain_wakeup()
+                continue
+            if mask & READ:
+                ready_r.append(fd)
+            if mask & WRITE:
+                ready_w.append(fd)
+        self._readable = frozenset(ready_r)
+        return ready_r, ready_w
+
+    def is_readable(self, fd):
+        """
+        Returns True if ``fd`` was found ready for reading by the last poll.
+        """
+        return fd in self._readable
+
+    def _poll_events(self, timeout):
+        """ Poll using epoll or poll, returns list of ``(fd, mask)``. """
+        if self.kind == 'epoll':
+            _timeout = -1 if timeout is None else timeout
+        else:
+            # poll(2) timeout is in milliseconds
+            _timeout = None if timeout is None else int(timeout * 1000)
+        try:
+            events = self._poll.poll(_timeout)
+        except (IOError, OSError, select.error) as err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+
+        result = list()
+        for fd, flags in events:
+            if flags & self._invalid:
+                # file descriptor was closed without being unregistered;
+                # poll(2) would otherwise report it forever.
+                self.log.debug('fd {0} closed while registered'.format(fd))
+                self.unregister(fd)
+                continue
+            mask = 0
+            if flags & (self._flags[READ] | self._hangup):
+                # a hangup or error is received as EOF by recv().
+                mask |= READ
+            if flags & self._flags[WRITE]:
+                mask |= WRITE
+            result.append((fd, mask))
+        return result
+
+    def _poll_select(self, timeout):
+        """ Poll using select, returns list of ``(fd, mask)``. """
+        with self._lock:
+            check_r = [fd for fd, mask in self._fds.items() if mask & READ]
+            check_w = [fd for fd, mask in self._fds.items() if mask & WRITE]
+        try:
+            ready_r, ready_w, _ = select.select(check_r, check_w, [], timeout)
+        except (IOError, OSError, select.error) as err:
+            if err.args[0] == errno.EINTR:
+                return []
+            raise
+        result = dict((fd, READ) for fd in ready_r)
+        for fd in ready_w:
+            result[fd] = result.get(fd, 0) | WRITE
+        return result.items()
+
+
+def _set_nonblocking(fd):
+    """ Set file descriptor ``fd`` to non-blocking mode. """
+    import fcntl
+    flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+    fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+
+def get_poller():
+    """ Return the :class:`Poller` instance of the engine process. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global POLLER
+    if POLLER is None:
+        POLLER = Poller()
+    return POLLER
@@ -0,0 +1,217 @@
+"""
+Pre-forked session worker pool for x/84, https://github.com/jquast/x84
+
+To enable, add to default.ini::
+
+    [system]
+    prefork = 4
+
+Without a pool, a new ``multiprocessing.Process`` is forked for each caller
+once on-connect negotiation completes, and only then are its logging and
+bbs modules initialized.  With a pool, that many workers are forked ahead
+of time and wait, already initialized, to be handed a session.  Each worker
+handed out is replaced by the engine's main loop, one fork for each pass of
+its timer wheel, so that a sudden storm of connecting callers does not pay
+for fork and import on its connect path.
+"""
+# std imports
+import collections
+import logging
+
+#: singleton instance of :class:`WorkerPool`, None when disabled.
+POOL = None
+
+
+class Worker(object):
+
+    """
+    Engine's record of an idle, pre-forked session worker.
+    """
+    # pylint: disable=R0903
+    #         Too few public methods
+
+    def __init__(self, process, master_pipes, ring=None):
+        self.process = process
+        (self.master_write, self.master_read) = master_pipes
+        self.ring = ring
+
+    def assign(self, **kwargs):
+        """
+        Begin a session in this worker, see :func:`run_worker`.
+
+        Keyword arguments are those of :func:`x84.terminal.start_process`,
+        excluding ``CFG``, ``child_pipes`` and ``ring``.
+        """
+        self.master_write.send(('assign', kwargs))
+
+    def close(self):
+        """ Signal an idle worker to exit. """
+        for pipe in (self.master_write, self.master_read):
+            try:
+                pipe.close()
+            except (EOFError, IOError):
+                pass
+        if self.ring is not None:
+            self.ring.close()
+
+
+class WorkerPool(object):
+
+    """
+    Pool of pre-forked, pre-initialized session workers.
+    """
+
+    def __init__(self, size):
+        self.log = logging.getLogger(__name__)
+        self.size = size
+        self.idle = collections.deque()
+        self._timer = None
+
+    def fill(self):
+        """ Fork workers until the pool is full. """
+        while len(self.idle) < self.size:
+            self.idle.append(self._fork())
+
+    def schedule_fill(self):
+        """
+        Replace workers handed out, from the engine's timer wheel.
+
+        Only the engine's main thread may fork: one worker is forked for
+        each pass of the main loop, so that a storm of connecting callers
+        is not held up by forking all of their replacements at once.
+        """
+        from x84.timers import get_timer_wheel
+        if self._timer is None and len(self.idle) < self.size:
+            self._timer = get_timer_wheel().schedule(0, self._fill_one)
+
+    def _fill_one(self):
+        """ Timer callback of :meth:`schedule_fill`. """
+        self._timer = None
+        if len(self.idle) < self.size:
+            try:
+                self.idle.append(self._fork())
+            except (OSError, IOError) as err:
+                self.log.error('fork of session worker failed: {0}'
+                               .format(err))
+                return
+        self.schedule_fill()
+
+    def _fork(self):
+        """ Fork and return a new :class:`Worker`. """
+        from multiprocessing import Process, Pipe
+        from x84.terminal import get_log_levels
+        from x84.ring import make_ring
+        import x84.bbs.ini
+
+        child_read, master_write = Pipe(duplex=False)
+        master_read, child_write = Pipe(duplex=False)
+        ring = make_ring()
+        process = Process(target=run_worker, kwargs={
+            'CFG': x84.bbs.ini.CFG,
+            'child_pipes': (child_write, child_read),
+            'ring': ring,
+            'log_levels': get_log_levels(),
+        })
+        process.start()
+        return Worker(process=process,
+                      master_pipes=(master_write, master_read),
+                      ring=ring)
+
+    def acquire(self):
+        """
+        Return an idle :class:`Worker`, or None if there are none.
+        """
+        while self.idle:
+            worker = self.idle.popleft()
+            if worker.process.is_alive():
+                return worker
+            self.log.warn('idle worker {0} has exited.'
+                          .format(worker.process.pid))
+            worker.close()
+        return None
+
+    def close(self):
+        """ Signal all idle workers to exit. """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self.idle:
+            self.idle.popleft().close()
+
+
+def run_worker(CFG, child_pipes, ring=None, log_levels=None):
+    """
+    A ``multiprocessing.Process`` target: wait for and run a session.
+
+    The IPC log handler, scripting API, curses, and the package of scripts
+    are initialized before waiting to be assigned a session by
+    :meth:`Worker.assign`.  The terminal itself can not be initialized
+    until its type is known.
+    """
+    import x84.bbs.ini
+    from x84.bbs.ipc import make_root_logger
+    from x84.bbs.session import load_script_module
+    from x84.terminal import run_session
+
+    # CFG must be pickled and sent to child process on win32,
+    # see start_process()
+    x84.bbs.ini.CFG = CFG
+
+    (writer, reader) = child_pipes
+
+    # records of this worker are sent to x84.engine over IPC, see
+    # start_process().
+    make_root_logger(writer, levels=log_levels)
+    log = logging.getLogger(__name__)
+
+    # pre-initialize the scripting API, curses, terminal capabilities,
+    # and the package of scripts.
+    __import__('x84.bbs')
+    __import__('curses')
+    __import__('blessed')
+    try:
+        load_script_module(x84.bbs.ini.get_ini('system', 'scriptpath'))
+    except Exception:
+        # pylint: disable=W0703
+        #         Catching too general exception
+        # left for the session to import, and report, once assigned.
+        log.exception('pre-import of scripts failed')
+
+    while True:
+        try:
+            event, kwargs = reader.recv()
+        except (EOFError, IOError, KeyboardInterrupt):
+            # pool closed
+            return
+        if event == 'exception':
+            # engine is shutting down
+            return
+        if event == 'assign':
+            break
+        log.error('unexpected event of idle worker: {0!r}'.format(event))
+
+    # levels of loggers may have changed since this worker was forked.
+    for name, level in (kwargs.pop('log_levels', None) or {}).items():
+        logging.getLogger(name).setLevel(level)
+
+    run_session(child_pipes=child_pipes, ring=ring, **kwargs)
+
+
+def get_worker_pool():
+    """ Return the :class:`WorkerPool`, or None when disabled. """
+    return POOL
+
+
+def start_worker_pool():
+    """
+    Create and fill the worker pool, if enabled by configuration.
+    """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global POOL
+    from x84.bbs.ini import get_ini
+    size = get_ini(section='system', key='prefork', getter='getint') or 0
+    if size > 0:
+        POOL = WorkerPool(size)
+        POOL.fill()
+    return POOL
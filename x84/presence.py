@@ -0,0 +1,42 @@
+"""
+Who's online presence registry for x/84, https://github.com/jquast/x84
+
+Each session pushes its handle, activity, node and such to the engine when
+they change, see :meth:`x84.bbs.session.Session.update_presence`.  The
+engine keeps them here, so that the list of sessions online may be fetched
+by a single 'presence-req' event, instead of asking every session.
+
+Idle time is not pushed: the engine knows when each of its clients last
+sent input.  Sessions of other shards report idle time as of their last
+update.
+
+Web modules, which run in the engine process, may use
+:func:`get_presence` directly.
+"""
+
+#: index of session-id to dictionary of session attributes.
+PRESENCE = dict()
+
+
+def update_presence(sid, attrs):
+    """
+    Update attributes of session ``sid``, or remove it when None.
+    """
+    if attrs is None:
+        PRESENCE.pop(sid, None)
+    else:
+        PRESENCE.setdefault(sid, dict()).update(attrs)
+
+
+def get_presence():
+    """
+    Return dictionary of session-id to attributes of all sessions online.
+    """
+    from x84.terminal import find_tty_by_sid
+    presence = dict()
+    for sid, attrs in PRESENCE.items():
+        presence[sid] = attrs = attrs.copy()
+        client = getattr(find_tty_by_sid(sid), 'client', None)
+        if client is not None:
+            attrs['idle'] = client.idle()
+    return presence
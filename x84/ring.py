@@ -0,0 +1,129 @@
+"""
+Shared-memory output ring buffers for x/84, https://github.com/jquast/x84
+
+To enable, add to default.ini::
+
+    [session]
+    output_ring = 262144
+
+Each session is then given a ring buffer of that many bytes, in memory
+shared with the engine.  Screen output is written to it already encoded
+for the client, and the engine is woken by an 'output-ring' frame (see
+:mod:`x84.framing`) over the session's pipe, as a doorbell, giving the
+number of bytes written.  The engine copies that many bytes straight into
+the client's send queue.
+
+When output does not fit the ring, it is sent through the pipe as usual,
+and so is all following output until the engine has emptied the ring.
+As each doorbell reads only the bytes it announces, output written to the
+ring after a doorbell still waiting in the pipe is not read ahead of
+output sent through the pipe before it.
+
+Rings are created in the engine before the session process is forked.
+They are not available on win32, where sessions are not forked.
+"""
+# std imports
+import struct
+import mmap
+import sys
+
+#: header of ring: total bytes written, and total bytes read.  Native byte
+#: order and alignment, so that each counter is copied by a single aligned
+#: move.  Counters are stored by slice assignment, never ``pack_into()``,
+#: which clears the bytes before packing: the other process could observe
+#: a counter of 0.
+HEADER = struct.Struct('@QQ')
+
+#: a counter of the header.
+COUNTER = struct.Struct('@Q')
+
+#: position of counter of total bytes written,
+_WRITE = 0
+
+#: and of total bytes read.
+_READ = 8
+
+
+class OutputRing(object):
+
+    """
+    Single producer (session), single consumer (engine) ring of bytes.
+
+    The header holds two ever-increasing counters, each written by only
+    one side, so no lock is required.  Data is always written before the
+    counter that makes it visible to the other side.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.mmap = mmap.mmap(-1, HEADER.size + size)
+
+    def _counters(self):
+        """ Return tuple of total bytes ``(written, read)``. """
+        return HEADER.unpack(self.mmap[:HEADER.size])
+
+    def _store(self, position, value):
+        """ Store counter ``value`` at ``position``. """
+        self.mmap[position:position + COUNTER.size] = COUNTER.pack(value)
+
+    def empty(self):
+        """ Returns True if all bytes written have been read. """
+        written, read = self._counters()
+        return written == read
+
+    def write(self, data):
+        """
+        Write bytestring ``data``, returns False if there is no room.
+        """
+        written, read = self._counters()
+        length = len(data)
+        if length > self.size - (written - read):
+            return False
+        start = HEADER.size + written % self.size
+        end = start + length
+        if end <= len(self.mmap):
+            self.mmap[start:end] = data
+        else:
+            # wrap around
+            first = len(self.mmap) - start
+            self.mmap[start:] = data[:first]
+            self.mmap[HEADER.size:HEADER.size + length - first] = data[first:]
+        self._store(_WRITE, written + length)
+        return True
+
+    def read(self, length=None):
+        """
+        Read and return all bytes available, or at most ``length`` bytes.
+        """
+        written, read = self._counters()
+        if length is None or length > written - read:
+            length = written - read
+        if not length:
+            return b''
+        start = HEADER.size + read % self.size
+        end = start + length
+        if end <= len(self.mmap):
+            data = self.mmap[start:end]
+        else:
+            # wrap around
+            data = (self.mmap[start:] +
+                    self.mmap[HEADER.size:end - len(self.mmap) + HEADER.size])
+        self._store(_READ, read + length)
+        return data
+
+    def close(self):
+        """ Release shared memory. """
+        self.mmap.close()
+
+
+def make_ring():
+    """
+    Return a new :class:`OutputRing`, or None when disabled.
+    """
+    from x84.bbs.ini import get_ini
+    if sys.platform.lower().startswith('win32'):
+        return None
+    size = get_ini(section='session', key='output_ring', getter='getint') or 0
+    if size > 0:
+        return OutputRing(size)
+    return None
@@ -7,7 +7,6 @@ only ssh or telnet.  rlogin is a very insecure and not recommended!
 # http://www.ietf.org/rfc/rfc1282.txt
 
 import logging
-import select
 import socket
 import array
 import time
@@ -20,7 +19,6 @@ from x84.bbs.userbase import (
 )
 from x84.client import BaseClient, BaseConnect
 from x84.server import BaseServer
-from x84.terminal import spawn_client_session
 
 
 class RLoginClient(BaseClient):
@@ -37,13 +35,6 @@ class RLoginClient(BaseClient):
         # Urgent send buffer (MSG_OOB)
         self.usend_buffer = array.array('c')
 
-    def recv_ready(self):
-        """
-        Returns True if data is awaiting on the telnet socket.
-        """
-        return (self.is_active() and bool(
-            select.select([self.sock.fileno()], [], [], 0)[0]))
-
     def send(self):
         if len(self.usend_buffer) > 0:
             ready_bytes = bytes(''.join(self.usend_buffer))
@@ -82,132 +73,120 @@ class ConnectRLogin(BaseConnect):
     #: maximum time elapsed allowed for on-connect negotiation
     TIME_NEGOTIATE = 5.0
 
-    #: poll interval for on-connect negotiation
-    TIME_POLL = 0.10
+    #: on-connect data received so far, see get_connect_data().
+    _data = None
+
+    def begin(self):
+        """
+        Set tcp socket options and send banner.
+        """
+        super(ConnectRLogin, self).begin()
+        self._data = array.array('c')
 
-    def run(self):
+    def negotiate(self):
         """
         Perform rfc1282 (rlogin) connection establishment.
 
         Determine terminal type, telnet options, window size,
         and tcp socket options before spawning a new session.
         """
-        try:
-            self._set_socket_opts()
-
-            self.banner()
-
-            # Receive on-connect data-value pairs, may raise ValueError.
-            data = self.get_connect_data()
-
-            # parse into dict,
-            parsed = self.parse_connect_data(data)
-            for key, value in parsed.items():
-                if value:
-                    self.log.debug('{client.addrport}: {key}={value}'
-                                   .format(client=self.client,
-                                           key=key, value=value))
-
-            # and apply to session-local self.client.env.
-            self.apply_environment(parsed)
-
-            # The server returns a zero byte to indicate that it has received
-            # these strings and is now in data transfer mode.
-            if self.client.is_active():
-                self.client.send_str(bytes('\x00'))
-
-                # The remote server indicates to the client that it can accept
-                # window size change information by requesting a window size
-                # message (as out of band data) just after connection
-                # establishment and user identification exchange.  The client
-                # should reply to this request with the current window size.
-                #
-                # Disabled: neither SyncTERM or BSD rlogin honors this, and
-                # we haven't got any code to parse it. Its in the RFC but ..
-                self.client.send_urgent_str(bytes('\x80'))
-
-            matrix_kwargs = {}
-            username = parsed.get('server-user-name', 'new')
-            if check_new_user(username):
-                # new@ login may be allowed
-                matrix_kwargs['new'] = True
-            if check_bye_user(username):
-                # rlogin as 'bye', 'logoff', etc. not allowed
-                raise ValueError('Bye user {0!r} used by rlogin'
-                                 .format(username))
-            if check_anonymous_user(username):
-                # anonymous@ login may be allowed
-                matrix_kwargs['anonymous'] = True
-
-            if self.client.is_active():
-                return spawn_client_session(client=self.client,
-                                            matrix_kwargs=matrix_kwargs)
-        except socket.error as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        except EOFError:
-            self.log.debug('{client.addrport}: EOF from client'
-                           .format(client=self.client))
-        except Exception as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        finally:
-            self.stopped = True
-        self.client.deactivate()
+        # Receive on-connect data-value pairs, may raise ValueError.
+        data = self.get_connect_data()
+        if data is None:
+            return False
+
+        # parse into dict,
+        parsed = self.parse_connect_data(data)
+        for key, value in parsed.items():
+            if value:
+                self.log.debug('{client.addrport}: {key}={value}'
+                               .format(client=self.client,
+                                       key=key, value=value))
+
+        # and apply to session-local self.client.env.
+        self.apply_environment(parsed)
+
+        # The server returns a zero byte to indicate that it has received
+        # these strings and is now in data transfer mode.
+        if self.client.is_active():
+            self.client.send_str(bytes('\x00'))
+
+            # The remote server indicates to the client that it can accept
+            # window size change information by requesting a window size
+            # message (as out of band data) just after connection
+            # establishment and user identification exchange.  The client
+            # should reply to this request with the current window size.
+            #
+            # Disabled: neither SyncTERM or BSD rlogin honors this, and
+            # we haven't got any code to parse it. Its in the RFC but ..
+            self.client.send_urgent_str(bytes('\x80'))
+
+        self.matrix_kwargs = {}
+        username = parsed.get('server-user-name', 'new')
+        if check_new_user(username):
+            # new@ login may be allowed
+            self.matrix_kwargs['new'] = True
+        if check_bye_user(username):
+            # rlogin as 'bye', 'logoff', etc. not allowed
+            raise ValueError('Bye user {0!r} used by rlogin'
+                             .format(username))
+        if check_anonymous_user(username):
+            # anonymous@ login may be allowed
+            self.matrix_kwargs['anonymous'] = True
+        return True
 
     def get_connect_data(self):
         """
         Receive four null-terminated strings transmitted by client on-connect.
 
-        :return: bytes received, containing at least 4 NUL-terminated strings.
+        Input received by the client so far is accumulated, this method
+        is called again by :meth:`negotiate` as more is received.
+
+        :return: bytes received, containing at least 4 NUL-terminated
+                 strings, or None if not yet received.
         :rtype: str
         :raises ValueError: on-connect data timeout or bandwidth exceeded.
         """
         established_msg = ('{client.addrport}: rlogin connection established'
                            .format(client=self.client))
-        data = array.array('c')
+        data = self._data
 
         #: maximum size of negotiation string
         MAXLEN = 4096
 
         err = None
-        st_time = time.time()
-        while True:
-            # allow time to pass for more data,
-            time.sleep(self.TIME_POLL)
-
-            if self.client.recv_ready():
-                self.client.socket_recv()
-
-            if self.client.input_ready():
-                # data to be received,
-                # read in data.
-                data.fromstring(self.client.get_input())
-
-            n_nul = data.count('\x00')
-            if n_nul >= 3:
-                self.client.env['RLOGIN_CLIENT_NAME'] = {
-                    3: 'SyncTERM',
-                    4: 'BSD',
-                }.get(n_nul, 'unknown:{0})'.format(n_nul))
-                if self.client.env['RLOGIN_CLIENT_NAME'] == 'SyncTERM':
-                    self.client.env['encoding'] = 'cp437'
-
-                self.log.debug('{msg} ({env[RLOGIN_CLIENT_NAME]})'
-                               .format(msg=established_msg,
-                                       env=self.client.env))
-                return data.tostring()
-
-            elif time.time() - st_time >= self.TIME_NEGOTIATE:
-                # too much time has elapsed, give up.
-                err = 'rlogin on-connect timeout'
-
-            elif len(data) >= MAXLEN:
-                # client has sent an abusive number of bytes, disconnect.
-                err = 'rlogin bandwidth exceeded'
-
-            if err:
-                raise ValueError(err)
+        if self.client.input_ready():
+            # data to be received,
+            # read in data.
+            data.fromstring(self.client.get_input())
+
+        n_nul = data.count('\x00')
+        if n_nul >= 3:
+            self.client.env['RLOGIN_CLIENT_NAME'] = {
+                3: 'SyncTERM',
+                4: 'BSD',
+            }.get(n_nul, 'unknown:{0})'.format(n_nul))
+            if self.client.env['RLOGIN_CLIENT_NAME'] == 'SyncTERM':
+                self.client.env['encoding'] = 'cp437'
+
+            self.log.debug('{msg} ({env[RLOGIN_CLIENT_NAME]})'
+                           .format(msg=established_msg,
+                                   env=self.client.env))
+            return data.tostring()
+
+        elif time.time() - self.start_time >= self.TIME_NEGOTIATE:
+            # too much time has elapsed, give up.
+            err = 'rlogin on-connect timeout'
+
+        elif len(data) >= MAXLEN:
+            # client has sent an abusive number of bytes, disconnect.
+            err = 'rlogin bandwidth exceeded'
+
+        if err:
+            raise ValueError(err)
+
+        self.deadline = self.start_time + self.TIME_NEGOTIATE
+        return None
 
     def apply_environment(self, parsed):
         """
@@ -283,7 +262,7 @@ class RLoginServer(BaseServer):
     client_factory = RLoginClient
     connect_factory = ConnectRLogin
 
-    def __init__(self, config):
+    def __init__(self, config, reuse_port=False):
         self.log = logging.getLogger(__name__)
         self.config = config
         self.addr = config.get('rlogin', 'addr')
@@ -297,6 +276,8 @@ class RLoginServer(BaseServer):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET,
                                       socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.set_reuse_port()
         try:
             self.server_socket.bind((self.addr, self.port))
             self.server_socket.listen(self.LISTEN_BACKLOG)
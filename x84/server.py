@@ -1,3 +1,7 @@
+""" Base server class for x/84. """
+import socket
+
+
 class BaseServer(object):
 
     '''
@@ -20,13 +24,13 @@ class BaseServer(object):
     #: Dictionary of active clients, (file descriptor, Client, ...)
     clients = {}
 
-    #: Connect factory should be a class, derived from threading.Thread, that
-    #: should be instantiated on-connect to perform negotiation and launch the
-    #: bbs session upon success.
+    #: Connect factory should be a class, derived from
+    #: :class:`x84.client.BaseConnect`, that should be instantiated on-connect
+    #: to perform negotiation and launch the bbs session upon success.
     connect_factory = None
 
-    #: List of on-connect negotiating threads.
-    threads = []
+    #: List of on-connect negotiations in progress.
+    connects = []
 
     @classmethod
     def client_factory_kwargs(cls, instance):
@@ -48,6 +52,15 @@ class BaseServer(object):
         """
         return dict()
 
+    def set_reuse_port(self):
+        """
+        Allow engine shards to each bind a listener to the same address.
+
+        The kernel then distributes incoming connections among them.
+        """
+        self.server_socket.setsockopt(
+            socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
     def client_count(self):
         """
         Returns the number of active connections.
@@ -77,7 +90,9 @@ class BaseServer(object):
             return [client for client in self.clients.values()
                     if client.recv_ready()]
 
-        # given a list of ready_fds pairs, we return only clients with
-        # matching file descriptors.
-        return [client for client in self.clients.values()
-                if client.fileno() in ready_fds]
+        # given a list of ready_fds, we return only clients of this server
+        # found by their file descriptor, ssh clients by that of their
+        # channel, which paramiko's transport thread signals on receipt.
+        from x84.terminal import find_client
+        return [client for client in map(find_client, ready_fds)
+                if isinstance(client, self.client_factory)]
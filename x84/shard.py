@@ -0,0 +1,377 @@
+"""
+Multi-process engine sharding for x/84, https://github.com/jquast/x84
+
+To enable, add to default.ini::
+
+    [system]
+    shards = 4
+
+Each shard is a separate engine process running its own event loop.  Every
+shard binds the telnet, ssh and rlogin listeners with ``SO_REUSEPORT``, so
+that the kernel distributes incoming connections among them, and each owns
+the sessions it accepts.  Session input and output never leaves its shard.
+
+The main process becomes the coordinator.  It relays the events that cross
+shards: ``route`` and ``remote-disconnect`` are sent to the shard owning the
+target session, ``global``, ``publish`` and ``presence`` to every other
+shard, each shard delivering published events to its own subscribers and
+keeping who's online of all shards, and ``lock-*`` events are
+decided by the coordinator, which keeps the only lock table, releasing
+locks of sessions as they end.  Notices of database changes committed by
+threads of the coordinator, such as those of the web server and message
+polling, are published to every shard, see :func:`x84.db.notify_changed`.
+"""
+# std imports
+import threading
+import logging
+
+#: connection to the coordinator in a shard process, None when not sharded.
+COORDINATOR = None
+
+#: the :class:`Coordinator` of the main process, once shards are started.
+RELAY = None
+
+
+class CoordinatorLink(object):
+
+    """
+    Shard-side connection to the coordinator process.
+
+    Sending is serialized by a lock, so that any thread of the shard
+    may forward events to the coordinator.
+    """
+
+    def __init__(self, conn, shard_no):
+        self.conn = conn
+        self.shard_no = shard_no
+        self._lock = threading.Lock()
+
+    def fileno(self):
+        """ Return file descriptor of connection to coordinator. """
+        return self.conn.fileno()
+
+    def send(self, event, data):
+        """ Send ``(event, data)`` to coordinator. """
+        with self._lock:
+            self.conn.send((event, data))
+
+
+class RemoteTerminal(object):
+
+    """
+    Coordinator's record of a session owned by a shard.
+
+    These are stored in :data:`x84.terminal.TERMINALS` of the coordinator
+    process, so that session lookups and :class:`x84.locks.LockTable`
+    work unchanged.  Events written to ``master_write`` are delivered to
+    the session by its owning shard.
+    """
+
+    def __init__(self, sid, shard):
+        self.sid = sid
+        self.shard = shard
+        self.master_write = self
+
+    def send(self, event_data):
+        """ Deliver ``(event, data)`` to session through its shard. """
+        event, data = event_data
+        self.shard.send('deliver', (self.sid, event, data))
+
+
+class Shard(object):
+
+    """ Coordinator's record of a shard process. """
+
+    def __init__(self, shard_no, conn, process):
+        self.shard_no = shard_no
+        self.conn = conn
+        self.process = process
+        # kept, so that it is removed by it once closed.
+        self._fileno = conn.fileno()
+        #: error of connection to shard, set once it has exited.
+        self.exited = None
+
+    def fileno(self):
+        """ Return file descriptor of connection to shard. """
+        return self._fileno
+
+    def send(self, event, data):
+        """
+        Send ``(event, data)`` to shard, unless it has exited.
+
+        A failure to send marks it :attr:`exited`, to be removed by the
+        coordinator, rather than raising to the shard that sent the
+        event being relayed.
+        """
+        if self.exited is not None:
+            return
+        try:
+            self.conn.send((event, data))
+        except (EOFError, IOError) as err:
+            self.exited = err
+
+
+class Coordinator(object):
+
+    """
+    Start shard processes and relay events between them.
+    """
+
+    def __init__(self, num_shards):
+        from x84.bbs.ini import CFG
+        self.log = logging.getLogger(__name__)
+        self.num_shards = num_shards
+        self.tap_events = CFG.getboolean('session', 'tap_events')
+        self.shards = dict()
+
+    def start(self):
+        """ Start shard processes. """
+        from multiprocessing import Process, Pipe
+        import x84.bbs.ini
+
+        for shard_no in range(self.num_shards):
+            parent_conn, child_conn = Pipe(duplex=True)
+            process = Process(target=run_shard,
+                              name='shard-{0}'.format(shard_no),
+                              kwargs={'shard_no': shard_no,
+                                      'conn': child_conn,
+                                      'CFG': x84.bbs.ini.CFG})
+            process.start()
+            child_conn.close()
+            shard = Shard(shard_no, parent_conn, process)
+            self.shards[shard.fileno()] = shard
+            self.log.info('shard {0} started, pid {1}.'
+                          .format(shard_no, process.pid))
+        start_relay(self)
+
+    def run(self):
+        """
+        Relay events between shards until all shards have exited.
+        """
+        from x84.timers import get_timer_wheel
+        from x84.poller import get_poller
+        timers = get_timer_wheel()
+        poller = get_poller()
+        for fd in self.shards:
+            poller.register(fd)
+        while self.shards:
+            ready, _ = poller.poll(timers.get_timeout())
+            timers.advance()
+            self.publish_changes()
+            for fd in ready:
+                shard = self.shards.get(fd)
+                if shard is None:
+                    # removed, having failed to receive an event relayed.
+                    continue
+                try:
+                    while shard.exited is None and shard.conn.poll():
+                        event, data = shard.conn.recv()
+                        self.dispatch(shard, event, data)
+                except (EOFError, IOError) as err:
+                    shard.exited = err
+                self.remove_exited()
+
+    def remove_exited(self):
+        """ Remove shards that have exited. """
+        exited = [shard for shard in self.shards.values()
+                  if shard.exited is not None]
+        while exited:
+            for shard in exited:
+                self.log.error('shard {0} exited: {1}'
+                               .format(shard.shard_no, shard.exited))
+                self.remove_shard(shard)
+            # those failing to receive notice of sessions removed.
+            exited = [shard for shard in self.shards.values()
+                      if shard.exited is not None]
+
+    def remove_shard(self, shard):
+        """ Forget a shard and every session it owned. """
+        from x84.terminal import TERMINALS
+        from x84.presence import update_presence
+        from x84.locks import get_lock_table
+        from x84.poller import get_poller
+        del self.shards[shard.fileno()]
+        get_poller().unregister(shard.fileno())
+        for sid, tty in TERMINALS.items():
+            if tty.shard is shard:
+                del TERMINALS[sid]
+                get_lock_table().release_all(sid)
+                update_presence(sid, None)
+                for _shard in self.shards.values():
+                    _shard.send('presence', (sid, None))
+
+    def publish_changes(self):
+        """
+        Publish notices of changes committed to databases by threads of
+        the coordinator to every shard, see :func:`x84.db.notify_changed`.
+        """
+        from x84.db import pop_changes, CHANGED_TOPIC
+        for sid, schema, changes in pop_changes():
+            topic = CHANGED_TOPIC.format(schema)
+            if self.tap_events:
+                self.log.debug('[{sid}] publish {topic}: {changes!r}'
+                               .format(sid=sid, topic=topic,
+                                       changes=changes))
+            for shard in self.shards.values():
+                shard.send('publish', (sid, (topic, changes)))
+        self.remove_exited()
+
+    def dispatch(self, shard, event, data):
+        """ Handle event received from ``shard``. """
+        from x84.terminal import TERMINALS, find_tty_by_sid
+        from x84.presence import update_presence
+        from x84.locks import get_lock_table
+
+        if event == 'session-add':
+            TERMINALS[data] = RemoteTerminal(sid=data, shard=shard)
+
+        elif event == 'session-del':
+            TERMINALS.pop(data, None)
+            get_lock_table().release_all(data)
+
+        elif event == 'route':
+            if self.tap_events:
+                self.log.debug('route {0!r}'.format(data))
+            tgt_sid, send_event, send_val = data[0], data[1], data[2:]
+            tty = find_tty_by_sid(tgt_sid)
+            if tty is not None:
+                tty.master_write.send((send_event, send_val))
+
+        elif event == 'remote-disconnect':
+            tgt_sid, reason = data
+            tty = find_tty_by_sid(tgt_sid)
+            if tty is not None:
+                tty.shard.send(event, data)
+
+        elif event in ('global', 'publish', 'presence'):
+            if event == 'presence':
+                update_presence(*data)
+            for _shard in self.shards.values():
+                if _shard is not shard:
+                    _shard.send(event, data)
+
+        elif event.startswith('lock'):
+            sid, lock_data = data
+            tty = find_tty_by_sid(sid)
+            if tty is not None:
+                get_lock_table().handle(tty, event, lock_data)
+
+        else:
+            self.log.error('shard {0}: unhandled event, data: '
+                           '({1}, {2!r})'.format(shard.shard_no, event, data))
+
+    def shutdown(self, timeout=5):
+        """ Wait for shard processes to exit, terminating them otherwise. """
+        for shard in self.shards.values():
+            shard.process.join(timeout)
+            if shard.process.is_alive():
+                self.log.warn('shard {0} terminated.'.format(shard.shard_no))
+                shard.process.terminate()
+
+
+def get_coordinator():
+    """ Return connection to coordinator, or None when not sharded. """
+    return COORDINATOR
+
+
+def start_relay(coordinator):
+    """
+    Make ``coordinator`` the :data:`RELAY` of this process, once its shard
+    processes are started, so that they are not given it.
+    """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global RELAY
+    from x84.poller import get_poller
+    # created before other threads may wake it, see x84.db.notify_changed.
+    get_poller()
+    RELAY = coordinator
+
+
+def is_relay():
+    """ Returns True in the coordinator process of a sharded engine. """
+    return RELAY is not None
+
+
+def forward(event, data):
+    """
+    Forward ``(event, data)`` to the coordinator.
+
+    Returns False when the engine is not sharded.
+    """
+    if COORDINATOR is None:
+        return False
+    COORDINATOR.send(event, data)
+    return True
+
+
+def coordinator_recv(log):
+    """
+    Handle events relayed by the coordinator to sessions of this shard.
+    """
+    from x84.terminal import get_terminals, find_tty_by_sid, kill_session
+    from x84.terminal import publish, send_tty
+    from x84.presence import update_presence
+    from x84.framing import encode
+    while COORDINATOR.conn.poll():
+        event, data = COORDINATOR.conn.recv()
+
+        # a session whose pipe is closed is killed by send_tty(), so that
+        # it does not take the connection to the coordinator with it.
+        if event == 'deliver':
+            sid, send_event, send_val = data
+            tty = find_tty_by_sid(sid)
+            if tty is not None:
+                send_tty(tty, send_event, send_val)
+
+        elif event == 'global':
+            sender_sid, send_val = data
+            frame = encode(event, send_val)
+            for _sid, _tty in get_terminals():
+                if _sid != sender_sid:
+                    send_tty(_tty, event, frame=frame)
+
+        elif event == 'publish':
+            sender_sid, (topic, send_val) = data
+            publish(topic, send_val, sender=sender_sid)
+
+        elif event == 'presence':
+            update_presence(*data)
+
+        elif event == 'remote-disconnect':
+            tgt_sid, reason = data
+            tty = find_tty_by_sid(tgt_sid)
+            if tty is not None:
+                kill_session(tty.client, reason)
+
+        else:
+            log.error('unhandled coordinator event, data: ({0}, {1!r})'
+                      .format(event, data))
+
+
+def run_shard(shard_no, conn, CFG):
+    """
+    A ``multiprocessing.Process`` target: run engine event loop as a shard.
+    """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global COORDINATOR
+    import x84.bbs.ini
+    import x84.poller
+    import x84.timers
+    from x84.engine import get_servers, shutdown, _loop
+
+    x84.bbs.ini.CFG = CFG
+
+    # an epoll instance must never be shared with the parent process,
+    # nor timers of the coordinator run by a shard.
+    x84.poller.POLLER = None
+    x84.timers.TIMERS = None
+
+    COORDINATOR = CoordinatorLink(conn, shard_no)
+    servers = get_servers(CFG, reuse_port=True)
+    try:
+        _loop(servers)
+    except KeyboardInterrupt:
+        pass
+    shutdown(servers)
@@ -6,7 +6,6 @@ from __future__ import absolute_import
 import threading
 import logging
 import socket
-import array
 import errno
 import time
 import os
@@ -21,7 +20,7 @@ from x84.bbs.userbase import (
     check_user_pubkey,
 )
 
-from x84.terminal import spawn_client_session, on_naws
+from x84.terminal import on_naws
 from x84.client import BaseClient, BaseConnect
 from x84.server import BaseServer
 from x84.sftp import X84SFTPServer
@@ -53,6 +52,22 @@ class SshClient(BaseClient):
         # if such subsystem is enabled and connected.
         self.kind = 'ssh'
 
+    #: the channel's file descriptor is a pipe signaled by paramiko's
+    #: transport thread, it only ever becomes readable.
+    POLL_WRITABLE = False
+
+    def fileno(self):
+        """
+        Return file descriptor of the ssh channel, once negotiated.
+
+        The tcp socket is owned by paramiko's transport thread and must
+        never be polled by the engine; None is returned until a channel
+        is opened.
+        """
+        if self.channel is None or self.kind == 'sftp':
+            return None
+        return self.channel.fileno()
+
     def shutdown(self):
         """
         Shutdown and close socket.
@@ -103,7 +118,7 @@ class SshClient(BaseClient):
         if self.channel is None:
             # channel has not yet been negotiated
             return False
-        return self.send_buffer.__len__() and self.channel.send_ready()
+        return len(self.send_buffer) and self.channel.send_ready()
 
     def _send(self, send_bytes):
         """
@@ -133,13 +148,9 @@ class SshClient(BaseClient):
             self.log.warn('send() called on empty buffer')
             return 0
 
-        ready_bytes = bytes(''.join(self.send_buffer))
-        self.send_buffer = array.array('c')
-
-        sent = self._send(ready_bytes)
-        if sent < len(ready_bytes):
-            # re-buffer data that could not be pushed to socket;
-            self.send_buffer.fromstring(ready_bytes[sent:])
+        # paramiko requires a bytestring.
+        sent = self._send(self.send_buffer.view().tobytes())
+        self.send_buffer.consume(sent)
         return sent
 
     def recv_ready(self):
@@ -164,15 +175,18 @@ class SshClient(BaseClient):
         """
         recv = 0
         try:
-            data = self.channel.recv(self.BLOCKSIZE_RECV)
+            # paramiko channels have no recv_into(), only the size of
+            # each receive is adjusted.
+            data = self.channel.recv(self.recv_size)
             recv = len(data)
             if 0 == recv:
                 raise Disconnected('Closed by client (EOF)')
+            self._adjust_recv_size(recv)
         except socket.error as err:
             raise Disconnected('socket error: {err}'.format(err))
         self.bytes_received += recv
         self.last_input_time = time.time()
-        self.recv_buffer.fromstring(data)
+        self.recv_buffer.extend(data)
         return recv
 
 
@@ -185,9 +199,11 @@ class ConnectSsh(BaseConnect):
     and session setup.
     """
 
-    TIME_POLL = 0.05
     TIME_WAIT_STAGE = 60
 
+    #: paramiko server interface, created by :meth:`begin`.
+    ssh_session = None
+
     def __init__(self, client, server_host_key, on_naws=None):
         """
         client is a ssh.SshClient instance.
@@ -197,100 +213,109 @@ class ConnectSsh(BaseConnect):
         self.on_naws = on_naws
         super(ConnectSsh, self).__init__(client)
 
-    def run(self):
+    def begin(self):
         """
-        Accept new Ssh connect in thread.
+        Start ssh server transport.
+
+        paramiko negotiates the transport, authentication and channel in
+        a thread of its own, which wakes the engine's main loop to call
+        :meth:`negotiate` once key exchange completes, the transport
+        closes, or a shell or subsystem is requested.
         """
-        try:
-            self.client.transport = paramiko.Transport(self.client.sock)
-            self.client.transport.load_server_moduli()
-            self.client.transport.add_server_key(self.server_host_key)
-            ssh_session = SshSessionServer(client=self.client)
-            from x84.bbs import get_ini
-            if get_ini(section='sftp', key='enabled', getter='getboolean'):
-                self.client.transport.set_subsystem_handler(
-                    'sftp', paramiko.SFTPServer, X84SFTPServer,
-                    ssh_session=ssh_session)
-
-            def detected():
-                return (ssh_session.shell_requested.isSet() or
-                        ssh_session.sftp_requested.isSet())
-
-            self.client.transport.start_server(server=ssh_session)
-
-            st_time = time.time()
-            while self._timeleft(st_time):
-                self.client.channel = self.client.transport.accept(1)
-                if self.client.channel is not None:
-                    break
-                if not self.client.transport.is_active():
-                    self.log.debug('{client.addrport}: transport closed.'
-                                   .format(client=self.client))
-                    self.client.deactivate()
-                    return
-            else:
-                self.log.debug('{client.addrport}: no channel requested'
-                               .format(client=self.client))
-                self.client.deactivate()
-                return
-
-            first_log = False
-            while not detected() and self._timeleft(st_time):
-                if not first_log:
-                    self.log.debug('{client.addrport}: waiting for '
-                                   'shell or subsystem request.'
-                                   .format(client=self.client))
-                    first_log = True
-
-                if not self.client.is_active():
-                    self.log.debug('{client.addrport}: transport closed '
-                                   'while waiting for shell or subsystem '
-                                   'request.'
-                                   .format(client=self.client))
-                    self.client.deactivate()
-                    return
-                time.sleep(self.TIME_POLL)
-
-            if detected():
-                matrix_kwargs = {attr: getattr(ssh_session, attr)
-                                 for attr in ('anonymous', 'new', 'username',)}
-                return spawn_client_session(client=self.client,
-                                            matrix_kwargs=matrix_kwargs)
-
-        except (paramiko.SSHException, socket.error) as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        except EOFError:
-            self.log.debug('{client.addrport}: EOF from client'
-                           .format(client=self.client))
-        except Exception as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        else:
-            self.log.debug('{client.addrport}: shell not requested'
-                           .format(client=self.client))
-        finally:
-            self.stopped = True
-        self.client.deactivate()
+        self.client.transport = paramiko.Transport(self.client.sock)
+        self.client.transport.load_server_moduli()
+        self.client.transport.add_server_key(self.server_host_key)
+        self.ssh_session = SshSessionServer(client=self.client,
+                                            on_request=self.wake)
+        from x84.bbs import get_ini
+        if get_ini(section='sftp', key='enabled', getter='getboolean'):
+            self.client.transport.set_subsystem_handler(
+                'sftp', paramiko.SFTPServer, X84SFTPServer,
+                ssh_session=self.ssh_session)
 
-    def _timeleft(self, st_time):
+        # given an event, start_server() returns without waiting
+        # for the transport to negotiate.
+        self.client.transport.start_server(server=self.ssh_session,
+                                           event=WakeEvent(self.wake))
+
+    def negotiate(self):
         """
-        Returns True when difference of current time and st_time is below
-        TIME_WAIT_STAGE, and the ``stopped`` class attribute has not yet
-        been set (such as during server shutdown).
+        Wait for a channel, then a shell or subsystem request.
         """
-        return bool(not self.stopped and
-                    time.time() - st_time < self.TIME_WAIT_STAGE)
+        if time.time() - self.start_time >= self.TIME_WAIT_STAGE:
+            if self.client.channel is None:
+                raise ValueError('no channel requested')
+            raise ValueError('shell not requested')
+
+        if self.client.channel is None:
+            if not self.client.transport.is_active():
+                raise Disconnected('transport closed.')
+            self.client.channel = self.client.transport.accept(0)
+            if self.client.channel is not None:
+                self.log.debug('{client.addrport}: waiting for '
+                               'shell or subsystem request.'
+                               .format(client=self.client))
+
+        if self.client.channel is not None and self._detected():
+            self.matrix_kwargs = {
+                attr: getattr(self.ssh_session, attr)
+                for attr in ('anonymous', 'new', 'username',)}
+            return True
+
+        # woken by paramiko's transport thread, see begin().
+        self.deadline = self.start_time + self.TIME_WAIT_STAGE
+        return False
+
+    def _detected(self):
+        """ Returns True if a shell or sftp subsystem was requested. """
+        return (self.ssh_session.shell_requested.isSet() or
+                self.ssh_session.sftp_requested.isSet())
+
+
+class WakeEvent(object):
+
+    """
+    Event of a paramiko transport that calls ``on_set`` when set.
+
+    paramiko sets the event given to ``start_server()`` once key exchange
+    completes, and again when its transport thread exits.
+    """
+
+    def __init__(self, on_set):
+        self._event = threading.Event()
+        self.on_set = on_set
+
+    def set(self):
+        """ Set event and call ``on_set``. """
+        self._event.set()
+        self.on_set()
+
+    def clear(self):
+        """ Clear event. """
+        self._event.clear()
+
+    def is_set(self):
+        """ Return whether event is set. """
+        return self._event.isSet()
+
+    isSet = is_set
+
+    def wait(self, timeout=None):
+        """ Wait for event to be set. """
+        return self._event.wait(timeout)
 
 
 class SshSessionServer(paramiko.ServerInterface):
 
-    def __init__(self, client):
+    def __init__(self, client, on_request=None):
         self.shell_requested = threading.Event()
         self.sftp_requested = threading.Event()
         self.log = logging.getLogger(__name__)
         self.client = client
 
+        # called when a shell or sftp subsystem is requested.
+        self.on_request = on_request or (lambda: None)
+
         # to be checked by caller
         self.new = False
         self.anonymous = False
@@ -373,6 +398,7 @@ class SshSessionServer(paramiko.ServerInterface):
     def check_channel_shell_request(self, channel):
         self.log.debug('ssh channel granted.')
         self.shell_requested.set()
+        self.on_request()
         return True
 
     def check_channel_subsystem_request(self, channel, name):
@@ -384,8 +410,11 @@ class SshSessionServer(paramiko.ServerInterface):
                 self.sftp = True
                 # XXX not returning True ?!
 
-        return (super(SshSessionServer, self)
-                .check_channel_subsystem_request(channel, name))
+        result = (super(SshSessionServer, self)
+                  .check_channel_subsystem_request(channel, name))
+        if self.sftp:
+            self.on_request()
+        return result
 
     def check_channel_pty_request(self, channel, term, width, height, *_):
         self.client.env['TERM'] = term
@@ -423,7 +452,7 @@ class SshServer(BaseServer):
     # Dictionary of active clients, (file descriptor, SshClient,)
     clients = {}
 
-    def __init__(self, config):
+    def __init__(self, config, reuse_port=False):
         """
         Create a new Ssh Server.
         """
@@ -449,6 +478,8 @@ class SshServer(BaseServer):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(
             socket.SOL_SOCKET, socket.SO_REUSEADDR, True)
+        if reuse_port:
+            self.set_reuse_port()
         try:
             self.server_socket.bind((self.address, self.port))
             self.server_socket.listen(self.LISTEN_BACKLOG)
@@ -486,12 +517,3 @@ class SshServer(BaseServer):
         """
         return [_client.channel.fileno() for _client in self.clients.values()
                 if _client.channel is not None]
-
-    def clients_ready(self, ready_fds=None):
-        """
-        Return a list of clients with data ready to be receive.
-
-        The ``ready_fds`` parameter is ignored by the SSH Server.
-        """
-        return [client for client in self.clients.values()
-                if client.recv_ready()]
@@ -40,11 +40,11 @@ Changes from miniboa:
 from __future__ import absolute_import
 
 # std
+import collections
 import socket
 import array
 import time
 import logging
-import select
 import errno
 from telnetlib import LINEMODE, NAWS, NEW_ENVIRON, ENCRYPT, AUTHENTICATION
 from telnetlib import BINARY, SGA, ECHO, STATUS, TTYPE, TSPEED, LFLOW
@@ -53,7 +53,7 @@ from telnetlib import IP, AO, AYT, EC, EL, GA, SB
 
 # local
 from x84.bbs.exception import Disconnected
-from .terminal import spawn_client_session, on_naws
+from .terminal import on_naws
 from .client import BaseClient, BaseConnect
 from .server import BaseServer
 
@@ -188,6 +188,7 @@ class TelnetClient(BaseClient):
 
         self.ENV_REQUESTED = False
         self.ENV_REPLIED = False
+        self.NAWS_REPLIED = False
 
     def request_will_sga(self):
         """
@@ -268,13 +269,6 @@ class TelnetClient(BaseClient):
         self.send_str(bytes(''.join((
             IAC, SB, TTYPE, SEND, IAC, SE))))
 
-    def recv_ready(self):
-        """
-        Returns True if data is awaiting on the telnet socket.
-        """
-        return (self.is_active() and bool(
-            select.select([self.sock.fileno()], [], [], 0)[0]))
-
     def socket_recv(self):
         """
         Called by TelnetServer.poll() when recv data is ready.  Read any
@@ -284,30 +278,55 @@ class TelnetClient(BaseClient):
         raised.
         """
         try:
-            data = self.sock.recv(self.BLOCKSIZE_RECV)
-            recv = len(data)
-            if recv == 0:
-                raise Disconnected('Closed by client (EOF)')
-
+            data = self._recv().tobytes()
         except socket.error as err:
             if err.errno == errno.EWOULDBLOCK:
                 return 0
             raise Disconnected('socket_recv error: {0}'.format(err))
 
+        recv = len(data)
         self.bytes_received += recv
         self.last_input_time = time.time()
 
         # Test for telnet commands, non-telnet bytes
         # are pushed to self.recv_buffer (side-effect),
-        for byte in data:
-            self._iac_sniffer(byte)
+        self._iac_scan(data)
         return recv
 
+    def _iac_scan(self, data):
+        """
+        Process bytestring ``data`` received from DE.
+
+        Runs of bytes up to the next IAC are buffered whole, either as
+        input or as sub-negotiation.  Only bytes of IAC sequences are
+        passed one at a time to _iac_sniffer().
+        """
+        idx, length = 0, len(data)
+        while idx < length:
+            if not self.telnet_got_iac:
+                end = data.find(IAC, idx)
+                if end == -1:
+                    end = length
+                if end > idx:
+                    if self.telnet_got_sb is True:
+                        self.telnet_sb_buffer.fromstring(data[idx:end])
+                        # Sanity check on length
+                        if len(self.telnet_sb_buffer) >= self.SB_MAXLEN:
+                            raise Disconnected('sub-negotiation buffer '
+                                               'filled')
+                    else:
+                        # Just normal NVT characters
+                        self._recv_byte(data[idx:end])
+                    idx = end
+                    continue
+            self._iac_sniffer(data[idx])
+            idx += 1
+
     def _recv_byte(self, byte):
         """
         Buffer non-telnet commands bytestrings into recv_buffer.
         """
-        self.recv_buffer.fromstring(byte)
+        self.recv_buffer.extend(byte)
 
     def _iac_sniffer(self, byte):
         """
@@ -370,13 +389,13 @@ class TelnetClient(BaseClient):
                           .format(self=self))
         elif cmd == AO:
             flushed = len(self.recv_buffer)
-            self.recv_buffer = array.array('c')
+            del self.recv_buffer[:]
             self.log.debug('Abort Output (AO); %s bytes discarded.', flushed)
         elif cmd == AYT:
             self.send_str(bytes('\b'))
             self.log.debug('Are You There (AYT); "\\b" sent.')
         elif cmd == EC:
-            self.recv_buffer.fromstring('\b')
+            self.recv_buffer.extend('\b')
             self.log.debug('Erase Character (EC); "\\b" queued.')
         elif cmd == EL:
             self.log.warn('Erase Line (EC) received; ignored.')
@@ -729,6 +748,7 @@ class TelnetClient(BaseClient):
                            .format(self=self, buflen=len(charbuf)))
             return
 
+        self.NAWS_REPLIED = True
         columns = (256 * ord(charbuf[1])) + ord(charbuf[2])
         rows = (256 * ord(charbuf[3])) + ord(charbuf[4])
         old_rows = self.env.get('LINES', None)
@@ -826,17 +846,137 @@ class TelnetClient(BaseClient):
         self.send_str(bytes(''.join((IAC, WONT, option))))
 
 
+class NegotiationHistory(object):
+
+    """
+    Reply latency of telnet option probes, learned per client fingerprint.
+
+    A client's fingerprint is its terminal type, usually the first reply
+    received.  Once known, the time to wait for the remaining replies is
+    derived from how quickly clients of the same fingerprint have answered
+    before, and probes that they have never answered are not waited for.
+
+    Clients are only known by what is learned here: no table of well-known
+    client banners is kept, so the first :attr:`MIN_SAMPLES` negotiations
+    of each kind of client wait out the default timeouts.
+    """
+
+    #: number of most recent outcomes kept for each probe.
+    SAMPLES = 16
+
+    #: minimum number of outcomes before a fingerprint's history is used.
+    MIN_SAMPLES = 3
+
+    #: learned timeout is the slowest reply observed, by this factor,
+    TIME_FACTOR = 1.5
+
+    #: and this margin, in seconds.
+    TIME_MARGIN = 0.25
+
+    def __init__(self):
+        #: ``{fingerprint: {probe: deque of latency or None}}``, where
+        #: None records a probe that went unanswered.
+        self.outcomes = dict()
+
+        #: ``{fingerprint: [count, total seconds]}`` of negotiations.
+        self.durations = dict()
+
+    def record(self, fingerprint, latencies, duration):
+        """
+        Record the outcome of a negotiation.
+
+        :param str fingerprint: client fingerprint.
+        :param dict latencies: seconds until each probe was answered,
+            or None if it was not.
+        :param float duration: seconds taken by negotiation.
+        """
+        probes = self.outcomes.setdefault(fingerprint, dict())
+        for probe, latency in latencies.items():
+            if probe not in probes:
+                probes[probe] = collections.deque(maxlen=self.SAMPLES)
+            probes[probe].append(latency)
+        count_total = self.durations.setdefault(fingerprint, [0, 0.0])
+        count_total[0] += 1
+        count_total[1] += duration
+
+    def timeout(self, fingerprint, probe, default):
+        """
+        Return seconds to wait for ``probe`` of client ``fingerprint``.
+
+        ``default`` is returned when there is too little history.
+        """
+        outcomes = self.outcomes.get(fingerprint, dict()).get(probe, ())
+        if len(outcomes) < self.MIN_SAMPLES:
+            return default
+        answered = [latency for latency in outcomes if latency is not None]
+        if not answered:
+            # this kind of client never answers, don't wait for it.
+            return 0
+        return min(default,
+                   max(answered) * self.TIME_FACTOR + self.TIME_MARGIN)
+
+    def stats(self):
+        """
+        Return learned negotiation statistics.
+
+        :rtype: dict
+        :returns: ``{fingerprint: {'count': int, 'duration': float,
+            'probes': {probe: {'answered': int, 'samples': int,
+            'timeout': float}}}}``, where ``duration`` is the average
+            seconds taken, and ``timeout`` is the learned timeout of
+            each probe.
+        """
+        result = dict()
+        for fingerprint, probes in self.outcomes.items():
+            count, total = self.durations.get(fingerprint, (0, 0.0))
+            result[fingerprint] = {
+                'count': count,
+                'duration': total / count if count else 0.0,
+                'probes': dict(
+                    (probe, {
+                        'answered': len([_latency for _latency in outcomes
+                                         if _latency is not None]),
+                        'samples': len(outcomes),
+                        'timeout': self.timeout(
+                            fingerprint, probe,
+                            ConnectTelnet.TIME_WAIT_STAGE),
+                    }) for probe, outcomes in probes.items())
+            }
+        return result
+
+
+#: singleton instance of :class:`NegotiationHistory`.
+NEGOTIATION_HISTORY = NegotiationHistory()
+
+
+def get_negotiation_stats():
+    """
+    Return learned telnet negotiation statistics of this engine process.
+
+    See :meth:`NegotiationHistory.stats`.
+    """
+    return NEGOTIATION_HISTORY.stats()
+
+
 class ConnectTelnet(BaseConnect):
 
     """
     Accept new Telnet Connection and negotiate options.
+
+    Terminal type, environment and window size are requested at once
+    by :meth:`banner`, negotiation completes as soon as each is answered
+    or refused by the client.
     """
     #: maximum time elapsed allowed to begin on-connect negotiation
     TIME_NEGOTIATE = 2.50
     #: wait upto 3500ms for all stages of negotiation to complete
     TIME_WAIT_STAGE = 3.50
-    #: polling duration during negotiation
-    TIME_POLL = 0.10
+
+    #: option probes sent by :meth:`banner`.
+    PROBES = ('ttype', 'env', 'naws')
+
+    #: seconds until each probe was answered, see negotiate().
+    _answered = None
 
     def banner(self):
         """
@@ -863,57 +1003,57 @@ class ConnectTelnet(BaseConnect):
         self.client.request_do_env()
         self.client.send()  # push
 
-    def run(self):
+    def begin(self):
         """
-        Negotiate and inquire about terminal type, telnet options, window size,
-        and tcp socket options before spawning a new session.
+        Set tcp socket options and send banner.
         """
-        from x84.bbs.exception import Disconnected
-        try:
-            self._set_socket_opts()
-            mrk_bytes = self.client.bytes_received
+        self._set_socket_opts()
+        self._answered = dict()
+        self.banner()
+        self.log.debug('{client.addrport}: pausing for negotiation'
+                       .format(client=self.client))
 
-            self.banner()
+    def negotiate(self):
+        """
+        Check replies to option probes, returns True when done.
+
+        Negotiation completes once every probe is answered or refused, or
+        when the remaining probes have timed out.  Timeouts are learned by
+        :data:`NEGOTIATION_HISTORY` for the client's fingerprint, the
+        default of each is :attr:`TIME_WAIT_STAGE`.  A client that has
+        not spoken at all by :attr:`TIME_NEGOTIATE` is not waited for.
+        """
+        if self.client.send_ready():
+            self.client.send()
+
+        now = time.time()
+        elapsed = now - self.start_time
+        for probe in self.PROBES:
+            if probe not in self._answered and self._check_probe(probe):
+                self._answered[probe] = elapsed
+                self._log_probe(probe)
+
+        pending = [probe for probe in self.PROBES
+                   if probe not in self._answered]
+        if pending and self.client.bytes_received:
+            fingerprint = self._fingerprint()
+            deadlines = [self.start_time + (
+                self.TIME_WAIT_STAGE if fingerprint is None else
+                NEGOTIATION_HISTORY.timeout(
+                    fingerprint, probe, self.TIME_WAIT_STAGE))
+                for probe in pending]
+            if now < max(deadlines):
+                self.deadline = max(deadlines)
+                return False
+        elif pending and elapsed < self.TIME_NEGOTIATE:
+            self.deadline = self.start_time + self.TIME_NEGOTIATE
+            return False
 
-            # wait at least {TIME_NEGOTIATE} for the client to speak.
-            # If it doesn't, we try only TTYPE.
-            # If it fails to report that, we forget the rest.
-            self.log.debug('{client.addrport}: pausing for negotiation'
-                           .format(client=self.client))
-            st_time = time.time()
-            while ((0 == self.client.bytes_received
-                    or mrk_bytes == self.client.bytes_received)
-                   and time.time() - st_time < self.TIME_NEGOTIATE):
-                if not self.client.is_active():
-                    return
-                if self.client.send_ready():
-                    self.client.send()
-                time.sleep(self.TIME_POLL)
-
-            if self._check_ttype(start_time=st_time):
-                # if client is able to negotiate terminal type,
-                # try NAWS or ENV negotiation.
-                if self.client.is_active():
-                    self._check_env(start_time=st_time)
-                if self.client.is_active():
-                    self._check_naws(start_time=st_time)
-
-            self.set_encoding()
-
-            if self.client.is_active():
-                return spawn_client_session(client=self.client)
-        except (Disconnected, socket.error) as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        except EOFError:
-            self.log.debug('{client.addrport}: EOF from client'
-                           .format(client=self.client))
-        except Exception as err:
-            self.log.debug('{client.addrport}: connection closed: {err}'
-                           .format(client=self.client, err=err))
-        finally:
-            self.stopped = True
-        self.client.deactivate()
+        for probe in pending:
+            self._log_probe(probe)
+        self._record(elapsed)
+        self.set_encoding()
+        return True
 
     def set_encoding(self):
         # set encoding to utf8 for clients negotiating BINARY mode and
@@ -937,79 +1077,70 @@ class ConnectTelnet(BaseConnect):
         if (local(BINARY) and remote(BINARY) and not term.startswith('ansi')):
             self.client.env['encoding'] = 'utf8'
 
-    def _timeleft(self, st_time):
+    def _check_probe(self, probe):
         """
-        Returns True when difference of current time and st_time is below
-        TIME_WAIT_STAGE.
+        Returns True if the client has answered or refused ``probe``.
         """
-        return bool(time.time() - st_time < self.TIME_WAIT_STAGE)
+        if probe == 'ttype':
+            return (self.client.env['TERM'] != self.client.TTYPE_UNDETECTED
+                    or self.client.check_remote_option(TTYPE) is False)
+        elif probe == 'env':
+            return (self.client.ENV_REPLIED or
+                    self.client.check_remote_option(NEW_ENVIRON) is False)
+        elif probe == 'naws':
+            # LINES and COLUMNS are seeded with defaults, they may not be
+            # taken as an answer.
+            return (self.client.NAWS_REPLIED or
+                    self.client.check_remote_option(NAWS) is False)
+        raise ValueError(probe)
 
-    def _check_env(self, start_time):
+    def _fingerprint(self):
         """
-        Check for NEW_ENVIRON negotiation.
+        Returns client fingerprint, or None if not yet known.
         """
-        def detected():
-            return (self.client.check_remote_option(NEW_ENVIRON) is not UNKNOWN
-                    or self.client.ENV_REPLIED)
+        if self.client.env['TERM'] != self.client.TTYPE_UNDETECTED:
+            return self.client.env['TERM']
+        return None
 
-        while not detected() and self._timeleft(start_time):
-            if not self.client.is_active():
-                return
-            if self.client.send_ready():
-                self.client.send()
-            time.sleep(self.TIME_POLL)
-
-        if detected():
-            self.log.debug('{client.addrport}: ENV={client.env!r}.'
-                           .format(client=self.client))
-        else:
-            self.log.debug('{client.addrport}: request-do-new_environ failed.'
-                           .format(client=self.client))
-
-    def _check_naws(self, start_time):
+    def _record(self, elapsed):
         """
-        Check for NAWS negotiation.
+        Record reply latencies of this negotiation by client fingerprint.
         """
-        def detected():
-            return (self.client.env.get('LINES', None) is not None
-                    and self.client.env.get('COLUMNS', None) is not None)
-
-        while not detected() and self._timeleft(start_time):
-            if not self.client.is_active():
-                return
-            if self.client.send_ready():
-                self.client.send()
-            time.sleep(self.TIME_POLL)
-
-        if detected():
-            self.log.debug('{client.addrport}: COLUMNS={client.env[COLUMNS]}, '
-                           'LINES={client.env[LINES]}.'
-                           .format(client=self.client))
-        else:
-            self.log.debug('{client.addrport}: request-do-naws failed.'
-                           .format(client=self.client))
-
-    def _check_ttype(self, start_time):
-        """
-        Check for TTYPE negotiation.
-        """
-        def detected():
-            return self.client.env['TERM'] != self.client.TTYPE_UNDETECTED
-
-        while not detected() and self._timeleft(start_time):
-            if not self.client.is_active():
-                return False
-            if self.client.send_ready():
-                self.client.send()
-            time.sleep(self.TIME_POLL)
-
-        if detected():
+        fingerprint = self._fingerprint()
+        if fingerprint is None:
+            return
+        NEGOTIATION_HISTORY.record(
+            fingerprint=fingerprint,
+            latencies=dict((probe, self._answered.get(probe, None))
+                           for probe in self.PROBES),
+            duration=elapsed)
+        self.log.debug('{client.addrport}: negotiation completed in '
+                       '{elapsed:0.3f}s ({fingerprint}).'
+                       .format(client=self.client, elapsed=elapsed,
+                               fingerprint=fingerprint))
+
+    def _log_probe(self, probe):
+        """
+        Log result of negotiation ``probe``.
+        """
+        if probe not in self._answered:
+            self.log.debug('{client.addrport}: {failed} failed.'.format(
+                client=self.client, failed={
+                    'ttype': 'request-terminal-type',
+                    'env': 'request-do-new_environ',
+                    'naws': 'request-do-naws'}[probe]))
+        elif probe == 'ttype':
             self.log.debug('{client.addrport}: TERM={client.env[TERM]}.'
                            .format(client=self.client))
-            return True
-        self.log.debug('{client.addrport}: request-terminal-type failed.'
-                       .format(client=self.client))
-        return False
+        elif probe == 'env':
+            self.log.debug('{client.addrport}: ENV={client.env!r}.'
+                           .format(client=self.client))
+        elif probe == 'naws':
+            self.log.debug('{client.addrport}: COLUMNS={columns}, '
+                           'LINES={lines}.'
+                           .format(client=self.client,
+                                   columns=self.client.env.get('COLUMNS'),
+                                   lines=self.client.env.get('LINES')))
 
 
 class TelnetServer(BaseServer):
@@ -1025,13 +1156,15 @@ class TelnetServer(BaseServer):
     # Dictionary of active clients, (file descriptor, TelnetClient,)
     clients = {}
 
-    def __init__(self, config):
+    def __init__(self, config, reuse_port=False):
         """
         Create a new Telnet Server.
 
         :param ConfigParser.ConfigParser config: configuration section
                                          ``[telnet]``, with options ``'addr'``,
                                          ``'port'``
+        :param bool reuse_port: whether other engine shards may bind the
+                                same address, see :mod:`x84.shard`.
         """
         self.log = logging.getLogger(__name__)
         self.address = config.get('telnet', 'addr')
@@ -1041,6 +1174,8 @@ class TelnetServer(BaseServer):
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(
             socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            self.set_reuse_port()
         try:
             self.server_socket.bind((self.address, self.port))
             self.server_socket.listen(self.LISTEN_BACKLOG)
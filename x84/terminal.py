@@ -7,8 +7,21 @@ import codecs
 import sys
 from blessed import Terminal as BlessedTerminal
 
+#: index of session-id to registered TerminalProcess.
 TERMINALS = dict()
 
+#: index of session output pipe file descriptor to TerminalProcess.
+TTY_FDS = dict()
+
+#: index of client instance to TerminalProcess.
+CLIENT_TTYS = dict()
+
+#: index of polled client file descriptor to client instance.
+CLIENT_FDS = dict()
+
+#: index of topic name to set of subscribed session-ids.
+TOPICS = dict()
+
 
 class Terminal(BlessedTerminal):
     _session = None
@@ -124,7 +137,7 @@ def determine_encoding(env):
     return env.get('encoding', fallback_encoding)
 
 
-def init_term(writer, env):
+def init_term(writer, env, ring=None):
     """
     Determine the final TERM and encoding and return a Terminal.
 
@@ -133,6 +146,8 @@ def init_term(writer, env):
     terminal-type is of 'ansi' or 'ansi-bbs', then the cp437 encoding
     is assumed; otherwise 'utf8'.
 
+    Output is written to shared-memory ``ring``, when given.
+
     A blessed-abstracted curses terminal is returned.
     """
     from x84.bbs.ipc import IPCStream
@@ -140,8 +155,11 @@ def init_term(writer, env):
     log = logging.getLogger(__name__)
     env['TERM'] = translate_ttype(env.get('TERM', 'unknown'))
     env['encoding'] = determine_encoding(env)
+    buffer_size = get_ini(section='session', key='output_buffer',
+                          getter='getint') or 0
     term = Terminal(kind=env['TERM'],
-                    stream=IPCStream(writer=writer),
+                    stream=IPCStream(writer=writer, buffer_size=buffer_size,
+                                     ring=ring),
                     rows=int(env.get('LINES', '24')),
                     columns=int(env.get('COLUMNS', '80')))
 
@@ -152,7 +170,9 @@ def init_term(writer, env):
         log.debug('terminal-type {0} failed, using {1} instead.'
                   .format(env['TERM'], termcap_unknown))
         term = Terminal(kind=termcap_unknown,
-                        stream=IPCStream(writer=writer),
+                        stream=IPCStream(writer=writer,
+                                         buffer_size=buffer_size,
+                                         ring=ring),
                         rows=int(env.get('LINES', '24')),
                         columns=int(env.get('COLUMNS', '80')))
 
@@ -168,12 +188,72 @@ class TerminalProcess(object):
     and unregister_tty(), and retrieved using terminals().
     """
 
-    def __init__(self, client, sid, master_pipes):
+    def __init__(self, client, sid, master_pipes, ring=None):
         from x84.bbs import get_ini
         self.client = client
         self.sid = sid
         (self.master_write, self.master_read) = master_pipes
-        self.timeout = get_ini('system', 'timeout') or 0
+        #: shared-memory output ring buffer, if any, see x84.ring.
+        self.ring = ring
+        #: topics subscribed to, see :func:`subscribe`.
+        self.topics = set()
+        #: file descriptor of master_read, set by register_tty()
+        self.fd = None
+        self.timeout = get_ini('system', 'timeout', getter='getint') or 0
+        #: timer of idle timeout, see :meth:`set_timeout`.
+        self.idle_timer = None
+        #: index of event name to timers started by the session.
+        self.timers = dict()
+
+    def set_timeout(self, timeout):
+        """
+        Set idle timeout, in seconds, 0 for none.
+
+        The session is killed once its client has been idle ``timeout``
+        seconds, as scheduled on the engine's timer wheel.
+        """
+        from x84.timers import get_timer_wheel
+        self.timeout = timeout
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        if self.timeout:
+            self.idle_timer = get_timer_wheel().schedule(
+                self.timeout - self.client.idle(), self._check_idle)
+
+    def _check_idle(self):
+        """ Kill session once idle timeout is reached, else re-schedule. """
+        self.idle_timer = None
+        if find_tty_by_sid(self.sid) is not self:
+            return
+        if self.client.idle() >= self.timeout:
+            kill_session(self.client, 'timeout')
+        else:
+            # client has since received input.
+            self.set_timeout(self.timeout)
+
+    def start_timer(self, event, delay, data):
+        """
+        Send event ``(event, data)`` to session in ``delay`` seconds.
+
+        A timer of the same ``event`` already started is replaced.
+        """
+        from x84.timers import get_timer_wheel
+        self.stop_timer(event)
+        self.timers[event] = get_timer_wheel().schedule(
+            delay, self._fire_timer, event, data)
+
+    def stop_timer(self, event):
+        """ Cancel timer of ``event`` started by :meth:`start_timer`. """
+        timer = self.timers.pop(event, None)
+        if timer is not None:
+            timer.cancel()
+
+    def _fire_timer(self, event, data):
+        """ Send event of timer to session, if it is still active. """
+        self.timers.pop(event, None)
+        if find_tty_by_sid(self.sid) is self:
+            send_tty(self, event, data)
 
 
 def flush_queue(queue):
@@ -181,23 +261,70 @@ def flush_queue(queue):
     Seeks any remaining events in queue, used before closing
     to prevent zombie processes with IPC waiting to be picked up.
     """
+    from x84.framing import recv_event
     log = logging.getLogger(__name__)
     try:
         while queue.poll():
-            event, data = queue.recv()
+            event, data = recv_event(queue)
             if event == 'logger':
-                log.handle(data)
+                for record in data:
+                    log.handle(record)
     except (EOFError, IOError) as err:
         log.debug(err)
 
 
+def register_client(client):
+    """
+    Register client for polling by file descriptor.
+
+    Called on accept, and again by :func:`register_tty` for transports
+    (ssh) whose file descriptor is not known until negotiation completes.
+    """
+    from x84.poller import get_poller
+    fd = client.fileno()
+    if fd is not None and CLIENT_FDS.get(fd) is not client:
+        CLIENT_FDS[fd] = client
+        get_poller().register(fd)
+
+
+def unregister_client(client):
+    """
+    Unregister client from polling, must be called before it is closed.
+    """
+    from x84.poller import get_poller
+    fd = client.fileno()
+    if fd is None or CLIENT_FDS.get(fd) is not client:
+        # socket already closed, find by hand.
+        fd = next((_fd for _fd, _client in CLIENT_FDS.items()
+                   if _client is client), None)
+    if fd is not None:
+        del CLIENT_FDS[fd]
+        get_poller().unregister(fd)
+
+
 def register_tty(tty):
     """
     Register a global instance of TerminalProcess
     """
+    from x84.poller import get_poller
+    from x84.shard import forward
     log = logging.getLogger(__name__)
     log.debug('[{tty.sid}] registered tty'.format(tty=tty))
+    tty.fd = tty.master_read.fileno()
     TERMINALS[tty.sid] = tty
+    TTY_FDS[tty.fd] = tty
+    CLIENT_TTYS[tty.client] = tty
+
+    # poll for session output and, for transports such as ssh whose
+    # file descriptor is not known until negotiation completes, input.
+    get_poller().register(tty.fd)
+    register_client(tty.client)
+
+    # schedule idle timeout.
+    tty.set_timeout(tty.timeout)
+
+    # make session known to other shards, when sharded.
+    forward('session-add', tty.sid)
 
 
 def unregister_tty(tty):
@@ -205,16 +332,75 @@ def unregister_tty(tty):
     Unregister a Terminal, described by its Client,
     input and output Queues, and Lock.
     """
+    from x84.poller import get_poller
+    from x84.presence import update_presence
+    from x84.locks import get_lock_table
+    from x84.shard import forward
+    from x84.db import abort_transactions
+    log = logging.getLogger(__name__)
+
+    # file descriptors must be unregistered before they are closed.
+    get_poller().unregister(tty.fd)
+    TTY_FDS.pop(tty.fd, None)
+    CLIENT_TTYS.pop(tty.client, None)
+    TERMINALS.pop(tty.sid, None)
+    tty.set_timeout(0)
+    for event in list(tty.timers):
+        tty.stop_timer(event)
+    for topic in list(tty.topics):
+        unsubscribe(tty, topic)
+    update_presence(tty.sid, None)
+    forward('presence', (tty.sid, None))
+    # release locks held, decided by the coordinator when sharded.
+    if not forward('session-del', tty.sid):
+        get_lock_table().release_all(tty.sid)
+    abort_transactions(tty.sid)
     try:
         flush_queue(tty.master_read)
         tty.master_read.close()
         tty.master_write.close()
     except (EOFError, IOError) as err:
         log.exception(err)
+    if tty.ring is not None:
+        tty.ring.close()
     if tty.client.active:
         # signal tcp socket to close
         tty.client.deactivate()
-    del TERMINALS[tty.sid]
+
+
+def subscribe(tty, topic):
+    """
+    Subscribe session of ``tty`` to events published for ``topic``.
+    """
+    tty.topics.add(topic)
+    TOPICS.setdefault(topic, set()).add(tty.sid)
+
+
+def unsubscribe(tty, topic):
+    """
+    Unsubscribe session of ``tty`` from events published for ``topic``.
+    """
+    tty.topics.discard(topic)
+    subscribers = TOPICS.get(topic, set())
+    subscribers.discard(tty.sid)
+    if not subscribers:
+        TOPICS.pop(topic, None)
+
+
+def publish(topic, data, sender=None):
+    """
+    Send event ``(topic, data)`` to every session subscribed to ``topic``.
+
+    The event is serialized once for all subscribers.  The session-id
+    ``sender``, if subscribed, is not sent its own event.  A subscriber
+    whose pipe is closed is killed, see :func:`send_tty`.
+    """
+    from x84.framing import encode
+    frame = None
+    for sid in list(TOPICS.get(topic, ())):
+        if sid != sender and sid in TERMINALS:
+            frame = frame or encode(topic, data)
+            send_tty(TERMINALS[sid], topic, frame=frame)
 
 
 def get_terminals():
@@ -228,10 +414,29 @@ def find_tty(client):
     """
     Given a client, return a matching tty, or None if not registered.
     """
-    try:
-        return next(tty for _, tty in get_terminals() if client == tty.client)
-    except StopIteration:
-        pass
+    return CLIENT_TTYS.get(client)
+
+
+def find_tty_by_sid(sid):
+    """
+    Given a session-id, return a matching tty, or None if not registered.
+    """
+    return TERMINALS.get(sid)
+
+
+def find_tty_by_fd(fd):
+    """
+    Given a file descriptor of a session output pipe, return a matching
+    tty, or None if not registered.
+    """
+    return TTY_FDS.get(fd)
+
+
+def find_client(fd):
+    """
+    Given a polled file descriptor, return a matching client, or None.
+    """
+    return CLIENT_FDS.get(fd)
 
 
 def kill_session(client, reason='killed'):
@@ -239,7 +444,9 @@ def kill_session(client, reason='killed'):
     Given a client, shutdown its socket and signal subprocess exit.
     """
     from x84.bbs.exception import Disconnected
-    from x84.terminal import unregister_tty
+
+    # file descriptors must be unregistered before they are closed.
+    unregister_client(client)
     client.shutdown()
 
     log = logging.getLogger(__name__)
@@ -254,8 +461,31 @@ def kill_session(client, reason='killed'):
         unregister_tty(tty)
 
 
+def send_tty(tty, event, data=None, frame=None):
+    """
+    Send ``(event, data)`` to session of ``tty``, or ``frame``, an event
+    already encoded by :func:`x84.framing.encode`.
+
+    A session whose pipe is closed, such as one killed by a signal, is
+    killed, and False is returned.
+    """
+    try:
+        if frame is None:
+            tty.master_write.send((event, data))
+        else:
+            tty.master_write.send_bytes(frame)
+    except (EOFError, IOError) as err:
+        log = logging.getLogger(__name__)
+        log.warn('[{tty.sid}] {event} not sent, session pipe: {err}'
+                 .format(tty=tty, event=event, err=err))
+        kill_session(tty.client, 'session pipe closed')
+        return False
+    return True
+
+
 def start_process(sid, env, CFG, child_pipes, kind, addrport,
-                  matrix_args=None, matrix_kwargs=None):
+                  matrix_args=None, matrix_kwargs=None, ring=None,
+                  log_levels=None):
     """
     A ``multiprocessing.Process`` target.
 
@@ -271,10 +501,11 @@ def start_process(sid, env, CFG, child_pipes, kind, addrport,
                               script.
     :param dict matrix_kwargs: optional keyward arguments to pass to matrix
                                script.
+    :param x84.ring.OutputRing ring: optional shared-memory output buffer.
+    :param dict log_levels: levels of loggers, see :func:`get_log_levels`.
     """
     import x84.bbs.ini
     from x84.bbs.ipc import make_root_logger
-    from x84.bbs.session import Session
 
     # CFG must be pickled and sent to child process; on windows systems,
     # fork() does not duplicate that it has been initialized, and requires
@@ -285,12 +516,29 @@ def start_process(sid, env, CFG, child_pipes, kind, addrport,
 
     # remove any existing log handlers in child process and replace
     # with a new root log handler that sends to x84.bbs.engine over IPC.
-    make_root_logger(writer)
+    make_root_logger(writer, levels=log_levels)
+
+    run_session(sid=sid, env=env, child_pipes=child_pipes, kind=kind,
+                addrport=addrport, matrix_args=matrix_args,
+                matrix_kwargs=matrix_kwargs, ring=ring)
+
+
+def run_session(sid, env, child_pipes, kind, addrport,
+                matrix_args=None, matrix_kwargs=None, ring=None):
+    """
+    Run session in a process whose configuration and logging are set up,
+    by :func:`start_process`, or :func:`x84.prefork.run_worker`.
+
+    Arguments are those of :func:`start_process`.
+    """
+    from x84.bbs.session import Session
+
+    (writer, reader) = child_pipes
 
     # instantiate and create a new terminal instance given the value
     # of env[TERM], negotiated by protocol. May modify the value of
     # env[TERM] by function translate_ttype
-    terminal = init_term(writer=writer, env=env)
+    terminal = init_term(writer=writer, env=env, ring=ring)
 
     try:
         # instantiate and run session
@@ -306,8 +554,11 @@ def start_process(sid, env, CFG, child_pipes, kind, addrport,
         }
         Session(**kwargs).run()
     finally:
-        # signal exit to engine
+        # send any remaining output, and signal exit to engine
         try:
+            terminal.stream.flush()
+            for handler in logging.getLogger().handlers:
+                handler.flush()
             writer.send(('exit', None))
         except IOError as err:
             # ignore [Errno 232] The pipe is being closed,
@@ -316,34 +567,80 @@ def start_process(sid, env, CFG, child_pipes, kind, addrport,
                 raise
 
 
+def get_log_levels():
+    """
+    Return dictionary of logger name to level for sessions.
+
+    Records of sessions are handled by the engine's handlers, which discard
+    those below their own level: loggers of sessions are given no lower a
+    level than the least of them, so that such records are never created.
+    """
+    log = logging.getLogger('x84.engine')
+    handlers = list()
+    while log is not None:
+        handlers.extend(log.handlers)
+        log = log.parent if log.propagate else None
+    least = min([handler.level for handler in handlers] or [logging.NOTSET])
+    root = logging.getLogger()
+    levels = {'': max(root.level, least)}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and logger.level:
+            levels[name] = max(logger.level, least)
+    return levels
+
+
 def spawn_client_session(client, matrix_kwargs=None):
     """ Spawn sub-process for connecting client.
 
-    Optional
+    When a pre-forked worker is available (:mod:`x84.prefork`), it is
+    handed the session instead, and replaced once the session is
+    registered.
     """
     from multiprocessing import Process, Pipe
+    from x84.prefork import get_worker_pool
+    from x84.ring import make_ring
     import x84.bbs.ini
 
-    child_read, master_write = Pipe(duplex=False)
-    master_read, child_write = Pipe(duplex=False)
     session_id = '{client.kind}-{client.addrport}'.format(client=client)
-
-    # start sub-process, which will initialize the terminal and
-    # begins the 'session' for the connecting client.
-    Process(target=start_process, kwargs={
+    kwargs = {
         'sid': session_id,
         'env': client.env,
-        'CFG': x84.bbs.ini.CFG,
-        'child_pipes': (child_write, child_read),
         'kind': client.kind,
         'addrport': client.addrport,
         'matrix_kwargs': matrix_kwargs,
-    }).start()
+        'log_levels': get_log_levels(),
+    }
+
+    pool = get_worker_pool()
+    worker = pool.acquire() if pool is not None else None
+    if worker is not None:
+        # hand the session to an idle, pre-forked worker.
+        worker.assign(**kwargs)
+        master_pipes = (worker.master_write, worker.master_read)
+        ring = worker.ring
+    else:
+        child_read, master_write = Pipe(duplex=False)
+        master_read, child_write = Pipe(duplex=False)
+        master_pipes = (master_write, master_read)
+        ring = make_ring()
+        kwargs.update({'CFG': x84.bbs.ini.CFG,
+                       'child_pipes': (child_write, child_read),
+                       'ring': ring})
+
+        # start sub-process, which will initialize the terminal and
+        # begins the 'session' for the connecting client.
+        Process(target=start_process, kwargs=kwargs).start()
 
     # and register its tty and master-side pipes for polling by x84.engine
     register_tty(TerminalProcess(client=client,
                                  sid=session_id,
-                                 master_pipes=(master_write, master_read)))
+                                 master_pipes=master_pipes,
+                                 ring=ring))
+
+    # replace the worker handed out, once this pass of the engine's main
+    # loop is done.
+    if pool is not None:
+        pool.schedule_fill()
 
 
 def on_naws(client):
@@ -355,10 +652,10 @@ def on_naws(client):
     that a new window size is read in interfaces where they may be changed
     accordingly.
     """
-    for _sid, tty in get_terminals():
-        if client == tty.client:
-            columns = int(client.env['COLUMNS'])
-            rows = int(client.env['LINES'])
-            tty.master_write.send(('refresh', ('resize', (columns, rows),)))
-            break
+    from x84.framing import send_event
+    tty = find_tty(client)
+    if tty is not None:
+        columns = int(client.env['COLUMNS'])
+        rows = int(client.env['LINES'])
+        send_event(tty.master_write, 'refresh', ('resize', (columns, rows),))
     return True
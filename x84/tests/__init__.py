@@ -0,0 +1 @@
+""" Tests of x/84 engine modules, run by ``tox -e py27``. """
@@ -0,0 +1,112 @@
+""" Tests of client send buffers of :mod:`x84.client`. """
+# std imports
+import errno
+import socket
+
+# local
+from x84.client import SendBuffer, BaseClient
+
+
+class Sock(object):
+
+    """ Socket accepting at most ``limits`` bytes for each send(). """
+
+    def __init__(self, *limits):
+        self.limits = list(limits)
+        self.sent = list()
+
+    def send(self, data):
+        """ Send upto the next limit of bytes, then would block. """
+        if not self.limits:
+            raise socket.error(errno.EAGAIN, 'would block')
+        data = data[:self.limits.pop(0)]
+        self.sent.append(data.tobytes())
+        return len(data)
+
+    def fileno(self):
+        """ File descriptor. """
+        return -1
+
+
+def make_buffer(*chunks):
+    """ Return :class:`SendBuffer` of ``chunks``. """
+    buf = SendBuffer()
+    for chunk in chunks:
+        buf.append(chunk)
+    return buf
+
+
+def test_coalesce_small():
+    """ small chunks are joined into a single view. """
+    buf = make_buffer('abc', 'def', '', 'g')
+    assert len(buf) == 7
+    assert buf.view().tobytes() == 'abcdefg'
+
+
+def test_coalesce_bounded():
+    """ chunks are joined no further than COALESCE bytes. """
+    size = SendBuffer.COALESCE // 4
+    buf = make_buffer(*['x' * size] * 6)
+    assert len(buf.view()) == size * 4
+    buf.consume(size * 4)
+    assert len(buf) == size * 2
+    assert len(buf.view()) == size * 2
+
+
+def test_large_chunk_memoryview():
+    """ a large chunk is sent from a view of it, without copy. """
+    data = bytearray('x' * SendBuffer.COALESCE + 'y')
+    buf = make_buffer(data, 'z')
+    buf.consume(1)
+    view = buf.view()
+    assert len(view) == SendBuffer.COALESCE
+    # a view of the chunk itself shares its memory.
+    data[1] = 'w'
+    assert view[0] == 'w'
+    buf.consume(SendBuffer.COALESCE)
+    assert buf.view().tobytes() == 'z'
+
+
+def test_partial_consume():
+    """ a partial send advances an offset into the first chunk. """
+    buf = make_buffer('abcdef', 'ghi')
+    buf.consume(4)
+    assert len(buf) == 5
+    assert buf.view().tobytes() == 'efghi'
+    buf.consume(3)
+    assert len(buf) == 2
+    assert buf.view().tobytes() == 'hi'
+    buf.consume(2)
+    assert len(buf) == 0
+
+
+def test_clear():
+    """ clear() discards buffered bytes, and the partial offset. """
+    buf = make_buffer('abcdef')
+    buf.consume(2)
+    buf.clear()
+    assert len(buf) == 0
+    buf.append('xyz')
+    assert buf.view().tobytes() == 'xyz'
+
+
+def test_client_send_partial():
+    """ send() stops at a partial send, the remainder stays buffered. """
+    sock = Sock(3, 100)
+    client = BaseClient(sock, ('127.0.0.1', 23))
+    client.send_buffer.append('abcde')
+    client.send_buffer.append('fgh')
+    assert client.send() == 3
+    assert sock.sent == ['abc']
+    assert len(client.send_buffer) == 5
+    assert client.send() == 5
+    assert sock.sent == ['abc', 'defgh']
+    assert not client.send_ready()
+
+
+def test_client_send_would_block():
+    """ send() of a socket that would block sends nothing. """
+    client = BaseClient(Sock(), ('127.0.0.1', 23))
+    client.send_buffer.append('abc')
+    assert client.send() == 0
+    assert len(client.send_buffer) == 3
@@ -0,0 +1,404 @@
+""" Tests of :mod:`x84.db`. """
+# std imports
+import threading
+import time
+
+# 3rd party
+import pytest
+
+# local, x84.bbs first, as the engine does: x84.bbs.dbproxy and x84.db
+# import from each other.
+import x84.bbs  # NOQA
+from x84.db import DBWorkerPool
+import x84.bbs.ini
+
+
+@pytest.fixture(autouse=True)
+def cfg(monkeypatch):
+    """ Configuration of bbs system defaults. """
+    monkeypatch.setattr(x84.bbs.ini, 'CFG', x84.bbs.ini.init_bbs_ini())
+
+
+class Handler(object):
+
+    """ Stands in for :class:`x84.db.DBHandler`, noting when it is run. """
+
+    def __init__(self, schema, name, ran, delay=0, wait_for=None):
+        self.sid, self.schema, self.cmd = 'sid', schema, 'get'
+        self.name, self.ran, self.delay = name, ran, delay
+        self.wait_for = wait_for
+        self.done = threading.Event()
+        self.queued = None
+
+    def run(self):
+        """ Note this handler was run. """
+        if self.wait_for is not None:
+            self.wait_for.wait(5)
+        time.sleep(self.delay)
+        self.ran.append(self.name)
+        self.done.set()
+
+
+def test_schema_order():
+    """ requests of a schema run in the order received, by any thread. """
+    pool = DBWorkerPool(size=4)
+    pool.start()
+    ran = list()
+    handlers = [Handler('a', idx, ran, delay=0.001 * (idx % 3))
+                for idx in range(20)]
+    for handler in handlers:
+        pool.put(handler)
+    assert handlers[-1].done.wait(5)
+    assert ran == range(20)
+    assert pool.metrics()['a']['requests'] == 20
+
+
+def test_schemas_concurrent():
+    """ a schema waiting does not hold requests of another schema. """
+    pool = DBWorkerPool(size=2)
+    pool.start()
+    ran = list()
+    other = Handler('b', 'b', ran)
+    slow = Handler('a', 'a', ran, wait_for=other.done)
+    pool.put(slow)
+    pool.put(other)
+    assert slow.done.wait(5)
+    assert ran == ['b', 'a']
+
+
+def test_single_thread_turns():
+    """ with one thread, schemas take turns, each in order. """
+    pool = DBWorkerPool(size=1)
+    ran = list()
+    handlers = [Handler(schema, (schema, idx), ran)
+                for idx in range(3) for schema in 'ab']
+    for handler in handlers:
+        pool.put(handler)
+    pool.start()
+    assert handlers[-1].done.wait(5)
+    assert [name for name in ran if name[0] == 'a'] == [
+        ('a', 0), ('a', 1), ('a', 2)]
+    assert [name for name in ran if name[0] == 'b'] == [
+        ('b', 0), ('b', 1), ('b', 2)]
+    assert ran[:2] == [('a', 0), ('b', 0)]
+
+
+class Shard(object):
+
+    """ Stands in for :class:`x84.shard.Shard`, keeping events sent. """
+
+    exited = None
+
+    def __init__(self):
+        self.events = list()
+
+    def send(self, event, data):
+        """ Keep ``(event, data)``. """
+        self.events.append((event, data))
+
+
+def test_notify_changed_discarded(monkeypatch):
+    """ without an engine or coordinator, notices are discarded. """
+    import x84.db
+    import x84.shard
+    monkeypatch.setattr(x84.db, 'WORKERS', None)
+    monkeypatch.setattr(x84.shard, 'RELAY', None)
+    monkeypatch.setattr(x84.db, 'CHANGES', x84.db.collections.deque())
+    x84.db.notify_changed(None, 'userbase', {'users': set(['x'])})
+    assert not x84.db.CHANGES
+
+
+def test_notify_changed_relayed(monkeypatch):
+    """ notices of threads of the coordinator are sent to every shard. """
+    import x84.db
+    import x84.shard
+    import x84.poller
+    coordinator = x84.shard.Coordinator(num_shards=2)
+    coordinator.shards = {1: Shard(), 2: Shard()}
+    monkeypatch.setattr(x84.db, 'WORKERS', None)
+    monkeypatch.setattr(x84.db, 'CHANGES', x84.db.collections.deque())
+    monkeypatch.setattr(x84.poller, 'POLLER', None)
+    monkeypatch.setattr(x84.shard, 'RELAY', None)
+    x84.shard.start_relay(coordinator)
+    x84.db.notify_changed(None, 'userbase', {'users': set(['x'])})
+    coordinator.publish_changes()
+    expected = [('publish', (None, ('db-changed-userbase',
+                                    {'users': set(['x'])})))]
+    for shard in coordinator.shards.values():
+        assert shard.events == expected
+    assert not x84.db.CHANGES
+
+
+def test_pool_shared(tmpdir):
+    """ a database is opened once, and shared by its callers. """
+    from x84.db import DatabasePool
+    pool = DatabasePool(idle_timeout=300)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    first = pool.acquire(filepath, 'x')
+    second = pool.acquire(filepath, 'x')
+    other = pool.acquire(filepath, 'y')
+    assert first is second
+    assert other is not first
+    assert pool.in_use[(filepath, 'x')] == 2
+    first['k'] = 'v'
+    assert second['k'] == 'v'
+    pool.release(filepath, 'x')
+    pool.release(filepath, 'x')
+    pool.release(filepath, 'y')
+    # kept open until idle_timeout.
+    assert pool.acquire(filepath, 'x') is first
+    pool.close()
+    assert pool.databases == {}
+
+
+def test_pool_no_idle_timeout(tmpdir):
+    """ an idle_timeout of 0 closes a database once unused. """
+    from x84.db import DatabasePool
+    pool = DatabasePool(idle_timeout=0)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    dictdb = pool.acquire(filepath, 'x')
+    pool.acquire(filepath, 'x')
+    pool.release(filepath, 'x')
+    assert pool.databases == {(filepath, 'x'): dictdb}
+    pool.release(filepath, 'x')
+    assert pool.databases == {}
+    assert dictdb.conn is None or not dictdb.conn.is_alive()
+
+
+def test_pool_evict_idle(tmpdir, monkeypatch):
+    """ databases unused for idle_timeout seconds are closed. """
+    from x84.db import DatabasePool
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    pool = DatabasePool(idle_timeout=10)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    idle = pool.acquire(filepath, 'x')
+    pool.acquire(filepath, 'y')
+    pool.release(filepath, 'x')
+    now[0] += 11
+    busy = pool.acquire(filepath, 'z')
+    assert set(pool.databases) == set([(filepath, 'y'), (filepath, 'z')])
+    assert idle.conn is None
+    assert busy.conn.is_alive()
+    pool.close()
+
+
+def test_pool_reopen_removed(tmpdir):
+    """ a database whose file was removed is re-opened. """
+    from x84.db import DatabasePool
+    pool = DatabasePool(idle_timeout=300)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    dictdb = pool.acquire(filepath, 'x')
+    pool.release(filepath, 'x')
+    tmpdir.join('a.sqlite3').remove()
+    reopened = pool.acquire(filepath, 'x')
+    assert reopened is not dictdb
+    reopened['k'] = 'v'
+    assert reopened['k'] == 'v'
+    pool.close()
+
+
+def test_pool_forked(tmpdir, monkeypatch):
+    """ databases of the parent process are not used once forked. """
+    import os
+    from x84.db import DatabasePool
+    pool = DatabasePool(idle_timeout=300)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    dictdb = pool.acquire(filepath, 'x')
+    monkeypatch.setattr(os, 'getpid', lambda: -1)
+    child = pool.acquire(filepath, 'x')
+    assert child is not dictdb
+    assert pool.in_use == {(filepath, 'x'): 1}
+    child.close()
+    dictdb.close()
+
+
+def test_batch_methods(tmpdir):
+    """ operations of many keys, in chunks, of text and unicode keys. """
+    from x84.db import transaction, Transaction
+    filepath = str(tmpdir.join('a.sqlite3'))
+    keys = [u'key-{0}-\u2603'.format(idx) if idx % 2 else 'key-{0}'.format(idx)
+            for idx in range(Transaction.CHUNK * 2 + 3)]
+    with transaction(filepath, 'x') as trans:
+        trans.set_many(dict((key, [idx]) for idx, key in enumerate(keys)))
+    with transaction(filepath, 'x', write=False) as trans:
+        assert len(trans) == len(keys)
+        found = trans.get_many(keys + ['missing'])
+        assert found == dict((key, [idx]) for idx, key in enumerate(keys))
+        assert trans.contains_many(keys[:3] + ['missing']) == set(keys[:3])
+    with transaction(filepath, 'x') as trans:
+        trans.delete_many(keys[1:] + ['missing'])
+    with transaction(filepath, 'x', write=False) as trans:
+        assert trans.keys() == [keys[0]]
+        assert trans[keys[0]] == [0]
+
+
+def test_batch_of_pooled_database(tmpdir):
+    """ batch methods of a pooled database run in a transaction. """
+    from x84.db import DatabasePool, get_db_func, wait_written
+    pool = DatabasePool(idle_timeout=300)
+    filepath = str(tmpdir.join('a.sqlite3'))
+    dictdb = pool.acquire(filepath, 'x')
+    dictdb['a'] = 1
+    # as DBHandler does, before another connection may see it.
+    wait_written(dictdb)
+    get_db_func(dictdb, 'set_many')({'b': 2, 'c': 3})
+    assert get_db_func(dictdb, 'get_many')(['a', 'b', 'z']) == {
+        'a': 1, 'b': 2}
+    assert dictdb['c'] == 3
+    pool.close()
+
+
+def test_transaction_rollback(tmpdir):
+    """ an error of the block rolls back its changes. """
+    from x84.db import transaction
+    filepath = str(tmpdir.join('a.sqlite3'))
+    with pytest.raises(KeyError):
+        with transaction(filepath, 'x') as trans:
+            trans['a'] = 1
+            raise KeyError('a')
+    with transaction(filepath, 'x', write=False) as trans:
+        assert 'a' not in trans
+
+
+def test_transaction_commit_failed(tmpdir, monkeypatch):
+    """ a commit that fails is rolled back, the connection is reusable. """
+    import sqlite3
+    import x84.db
+    from x84.db import transaction, connect
+    monkeypatch.setattr(x84.db, 'BUSY_TIMEOUT', 0.05)
+    monkeypatch.setattr(x84.db, 'CONNECTIONS', threading.local())
+    filepath = str(tmpdir.join('a.sqlite3'))
+    with transaction(filepath, 'x') as trans:
+        trans['a'] = 1
+    # a reader holds a shared lock, the writer can't commit.
+    reader = connect(filepath)
+    reader.execute('BEGIN')
+    reader.execute('SELECT * FROM x').fetchall()
+    with pytest.raises(sqlite3.OperationalError):
+        with transaction(filepath, 'x') as trans:
+            trans['a'] = 2
+    reader.execute('ROLLBACK')
+    reader.close()
+    with transaction(filepath, 'x') as trans:
+        assert trans['a'] == 1
+        trans['a'] = 3
+    with transaction(filepath, 'x', write=False) as trans:
+        assert trans['a'] == 3
+
+
+def test_db_workers_option(monkeypatch):
+    """ db_workers of 0 is refused, only a missing option is defaulted. """
+    import x84.db
+    monkeypatch.setattr(x84.db, 'WORKERS', None)
+    x84.bbs.ini.CFG.set('system', 'db_workers', '0')
+    with pytest.raises(ValueError):
+        x84.db.get_db_worker_pool()
+    x84.bbs.ini.CFG.remove_option('system', 'db_workers')
+    assert x84.db.get_db_worker_pool().size == 4
+
+
+class Caller(object):
+
+    """ Stands in for the session ``sid``, calling schema ``a`` by pool. """
+
+    def __init__(self, pool, sid):
+        import Queue
+        self.pool, self.sid = pool, sid
+        self.replies = Queue.Queue()
+
+    def send_bytes(self, data):
+        """ Keep reply of :func:`x84.framing.send_event`. """
+        from x84.framing import decode
+        self.replies.put(decode(data))
+
+    def send(self, event):
+        """ Keep exception sent by :meth:`x84.db.DBHandler.fail`. """
+        self.replies.put(event)
+
+    def put(self, cmd, *args, **kwargs):
+        """ Queue request of ``cmd`` of table ``x``. """
+        from x84.db import DBHandler
+        event = 'db-{0}'.format(kwargs.get('schema', 'a'))
+        self.pool.put(DBHandler(self, event, ('x', cmd, args), sid=self.sid))
+
+    def reply(self, timeout=5):
+        """ Return data of the next reply, raising Queue.Empty on timeout. """
+        event, data = self.replies.get(timeout=timeout)
+        if event == 'exception':
+            raise data
+        return data
+
+    def call(self, cmd, *args, **kwargs):
+        """ Queue request of ``cmd`` and return its reply. """
+        self.put(cmd, *args, **kwargs)
+        return self.reply()
+
+
+@pytest.fixture
+def datapath(tmpdir, monkeypatch):
+    """ Databases of schemas in ``tmpdir``, of a pool of their own. """
+    import x84.db
+    x84.bbs.ini.CFG.set('system', 'datapath', str(tmpdir))
+    monkeypatch.setattr(x84.db, 'WORKERS', None)
+    monkeypatch.setattr(x84.db, 'POOL', None)
+    yield tmpdir
+    x84.db.get_database_pool().close()
+
+
+def test_read_passes_transaction(datapath):
+    """ reads of others see data committed, writes wait for commit. """
+    import Queue
+    pool = DBWorkerPool(size=2)
+    pool.start()
+    one, two = Caller(pool, 'one'), Caller(pool, 'two')
+    two.call('__setitem__', 'k', 1)
+    assert one.call('begin') is True
+    one.call('__setitem__', 'k', 2)
+    assert two.call('__getitem__', 'k') == 1
+    two.put('__setitem__', 'k', 3)
+    with pytest.raises(Queue.Empty):
+        two.reply(timeout=0.2)
+    assert one.call('__getitem__', 'k') == 2
+    assert one.call('commit') is True
+    two.reply()
+    assert two.call('__getitem__', 'k') == 3
+
+
+def test_transaction_expired(datapath):
+    """ a transaction left idle is rolled back, releasing its schema. """
+    import sqlite3
+    pool = DBWorkerPool(size=1)
+    pool.TRANSACTION_TIMEOUT = 0.1
+    pool.start()
+    one, two = Caller(pool, 'one'), Caller(pool, 'two')
+    assert one.call('begin') is True
+    one.call('__setitem__', 'k', 1)
+    two.call('__setitem__', 'k', 2)
+    assert two.call('__getitem__', 'k') == 2
+    with pytest.raises(sqlite3.OperationalError):
+        one.call('commit')
+    assert not pool.transactions
+
+
+def test_begin_busy_retried(datapath):
+    """ a begin is tried again while locked, without holding a thread. """
+    from x84.db import connect, get_db_filepath
+    pool = DBWorkerPool(size=1)
+    pool.start()
+    one, two = Caller(pool, 'one'), Caller(pool, 'two')
+    two.call('__setitem__', 'k', 1)
+    # the write lock is held by another process.
+    other = connect(get_db_filepath('a'))
+    other.execute('BEGIN IMMEDIATE')
+    one.put('begin')
+    # other schemas are run meanwhile, and reads of this one.
+    assert two.call('__setitem__', 'k', 2, schema='b') is None
+    assert two.call('__getitem__', 'k') == 1
+    assert one.replies.empty()
+    other.execute('ROLLBACK')
+    other.close()
+    assert one.reply() is True
+    one.call('__setitem__', 'k', 3)
+    assert one.call('commit') is True
+    assert two.call('__getitem__', 'k') == 3
@@ -0,0 +1,126 @@
+""" Tests of :mod:`x84.bbs.dbproxy`. """
+# local
+from x84.bbs.dbproxy import DBCache
+
+
+def test_get_put():
+    """ records are cached, as are keys not found. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    assert cache.enabled
+    assert cache.get('userbase', 'users', 'x') is None
+    cache.put('userbase', 'users', 'x', True, {'a': 1})
+    cache.put('userbase', 'users', 'y', False)
+    assert cache.get('userbase', 'users', 'x') == (True, {'a': 1})
+    assert cache.get('userbase', 'users', 'y') == (False, None)
+    assert cache.get('userbase', 'other', 'x') is None
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_copies():
+    """ each read returns a copy of the record. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.put('s', 't', 'x', True, [1])
+    cache.get('s', 't', 'x')[1].append(2)
+    assert cache.get('s', 't', 'x') == (True, [1])
+
+
+def test_evict_entries():
+    """ the least recently used entry is evicted first. """
+    cache = DBCache(max_entries=2, max_bytes=1024)
+    cache.put('s', 't', 'a', True, 1)
+    cache.put('s', 't', 'b', True, 2)
+    cache.get('s', 't', 'a')
+    cache.put('s', 't', 'c', True, 3)
+    assert cache.get('s', 't', 'b') is None
+    assert cache.get('s', 't', 'a') == (True, 1)
+    assert cache.get('s', 't', 'c') == (True, 3)
+
+
+def test_evict_bytes():
+    """ entries are evicted to keep within ``max_bytes``. """
+    cache = DBCache(max_entries=100, max_bytes=100)
+    cache.put('s', 't', 'a', True, 'x' * 40)
+    cache.put('s', 't', 'b', True, 'x' * 40)
+    cache.put('s', 't', 'c', True, 'x' * 40)
+    assert cache.size <= 100
+    assert cache.get('s', 't', 'a') is None
+    assert cache.get('s', 't', 'c') == (True, 'x' * 40)
+    # a record larger than the cache is not kept at all.
+    cache.put('s', 't', 'd', True, 'x' * 200)
+    assert cache.get('s', 't', 'd') is None
+    assert cache.get('s', 't', 'c') is not None
+
+
+def test_replace():
+    """ a record cached again replaces the one before. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.put('s', 't', 'a', True, 'x' * 40)
+    size = cache.size
+    cache.put('s', 't', 'a', True, 'y' * 40)
+    assert cache.size == size
+    assert cache.get('s', 't', 'a') == (True, 'y' * 40)
+
+
+def test_discard_keys():
+    """ records of keys changed are discarded. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.put('s', 't', 'a', True, 1)
+    cache.put('s', 't', 'b', False)
+    cache.put('s', 'u', 'a', True, 2)
+    cache.put('r', 't', 'a', True, 3)
+    cache.discard('s', {'t': set(['a', 'b', 'c'])})
+    assert cache.get('s', 't', 'a') is None
+    assert cache.get('s', 't', 'b') is None
+    assert cache.get('s', 'u', 'a') == (True, 2)
+    assert cache.get('r', 't', 'a') == (True, 3)
+
+
+def test_discard_table():
+    """ all records of a table are discarded when any may have changed. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.put('s', 't', 'a', True, 1)
+    cache.put('s', 't', 'b', True, 2)
+    cache.put('s', 'u', 'a', True, 3)
+    cache.discard('s', {'t': None})
+    assert cache.get('s', 't', 'a') is None
+    assert cache.get('s', 't', 'b') is None
+    assert cache.get('s', 'u', 'a') == (True, 3)
+    assert cache.size == len(cache.entries.values()[0])
+
+
+def test_changed_while_requested():
+    """ a record changed while requested is not cached from its reply. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.request('s', 't', ['a', 'b', 'c'])
+    cache.request('s', 'u', ['a'])
+    # notices arrive before the reply.
+    cache.discard('s', {'t': set(['a'])})
+    cache.discard('s', {'u': None})
+    for table, key in (('t', 'a'), ('t', 'b'), ('t', 'c'), ('u', 'a')):
+        cache.put('s', table, key, True, 1)
+    cache.cancel('s', 't', ['a', 'b', 'c'])
+    cache.cancel('s', 'u', ['a'])
+    assert cache.get('s', 't', 'a') is None
+    assert cache.get('s', 't', 'b') == (True, 1)
+    assert cache.get('s', 'u', 'a') is None
+    assert not cache.pending
+    # requested again, it is cached.
+    cache.request('s', 't', ['a'])
+    cache.put('s', 't', 'a', True, 2)
+    cache.cancel('s', 't', ['a'])
+    assert cache.get('s', 't', 'a') == (True, 2)
+
+
+def test_unicode_keys():
+    """ unicode and bytestring keys of the same text are one entry. """
+    cache = DBCache(max_entries=8, max_bytes=1024)
+    cache.put('s', 't', u'a', True, 1)
+    assert cache.get('s', 't', 'a') == (True, 1)
+    cache.discard('s', {'t': ['a']})
+    assert cache.get('s', 't', u'a') is None
+
+
+def test_disabled():
+    """ a cache of 0 entries or bytes is disabled. """
+    assert not DBCache(max_entries=0, max_bytes=1024).enabled
+    assert not DBCache(max_entries=8, max_bytes=0).enabled
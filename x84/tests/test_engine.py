@@ -0,0 +1,97 @@
+""" Tests of output throttling of :mod:`x84.engine`. """
+# 3rd party
+import pytest
+
+# local
+import x84.terminal
+from x84.client import SendBuffer
+from x84.engine import throttle
+
+
+class Poller(object):
+
+    """ Records registered file descriptors. """
+
+    def __init__(self, fds):
+        self.fds = set(fds)
+
+    def register(self, fd):
+        """ Register ``fd``. """
+        assert fd not in self.fds
+        self.fds.add(fd)
+
+    def unregister(self, fd):
+        """ Unregister ``fd``. """
+        self.fds.remove(fd)
+
+
+class Client(object):
+
+    """ Client of a session, with only a send buffer. """
+
+    SEND_HIGH_WATER = 100
+    SEND_LOW_WATER = 20
+
+    def __init__(self):
+        self.send_buffer = SendBuffer()
+
+
+class TTY(object):
+
+    """ Session of a client. """
+
+    def __init__(self, sid, fd, client):
+        self.sid, self.fd, self.client = sid, fd, client
+
+
+@pytest.fixture
+def tty(monkeypatch):
+    """ A registered session. """
+    _tty = TTY('telnet-1', 7, Client())
+    monkeypatch.setattr(x84.terminal, 'TERMINALS', {_tty.sid: _tty})
+    monkeypatch.setattr(x84.terminal, 'CLIENT_TTYS', {_tty.client: _tty})
+    return _tty
+
+
+def test_throttle_hysteresis(tty):
+    """ pipes are not polled from high-water until drained to low-water. """
+    poller = Poller([tty.fd])
+    client = tty.client
+    client.send_buffer.append('x' * 99)
+    throttled = throttle(poller, [client], set())
+    assert throttled == set()
+    client.send_buffer.append('x')
+    throttled = throttle(poller, [client], throttled)
+    assert throttled == set([tty])
+    assert tty.fd not in poller.fds
+    # still above low-water,
+    client.send_buffer.consume(79)
+    throttled = throttle(poller, [client], throttled)
+    assert throttled == set([tty])
+    assert tty.fd not in poller.fds
+    # and drained.
+    client.send_buffer.consume(1)
+    throttled = throttle(poller, [client], throttled)
+    assert throttled == set()
+    assert tty.fd in poller.fds
+
+
+def test_throttle_sent(tty):
+    """ pipes are polled again once their client has no output pending. """
+    poller = Poller([tty.fd])
+    tty.client.send_buffer.append('x' * 100)
+    throttled = throttle(poller, [tty.client], set())
+    tty.client.send_buffer.clear()
+    assert throttle(poller, [], throttled) == set()
+    assert tty.fd in poller.fds
+
+
+def test_throttle_killed(tty, monkeypatch):
+    """ pipes of sessions killed while throttled are not polled again. """
+    poller = Poller([tty.fd])
+    tty.client.send_buffer.append('x' * 100)
+    throttled = throttle(poller, [tty.client], set())
+    monkeypatch.setattr(x84.terminal, 'TERMINALS', dict())
+    monkeypatch.setattr(x84.terminal, 'CLIENT_TTYS', dict())
+    assert throttle(poller, [], throttled) == set()
+    assert tty.fd not in poller.fds
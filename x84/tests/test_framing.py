@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+""" Tests of :mod:`x84.framing`. """
+# std imports
+import array
+
+# 3rd party
+import pytest
+
+# local
+from x84.framing import encode, decode, TAG_MARSHAL, PICKLE_PROTO
+
+
+class Text(unicode):
+
+    """ A unicode subclass, such as blessed's FormattingString. """
+
+
+def roundtrip(event, data):
+    """ Return ``(event, data)`` encoded and decoded. """
+    return decode(encode(event, data))
+
+
+def test_input_frame():
+    """ 'input' bytes are framed as given. """
+    assert roundtrip('input', b'\x1b[A') == ('input', b'\x1b[A')
+
+
+def test_output_frame_is_encoded():
+    """ 'output' text is received encoded, with its encoding. """
+    assert roundtrip('output', (u'☃', 'utf8')) == (
+        'output', (u'☃'.encode('utf8'), 'utf8'))
+
+
+def test_doorbell_frame():
+    """ 'output-ring' doorbell carries its byte count. """
+    assert roundtrip('output-ring', 12) == ('output-ring', 12)
+
+
+def test_db_builtin_types_marshaled():
+    """ 'db' events of builtin types are marshaled, and unchanged. """
+    data = ('attrs', 'get_many', ([u'bj\xf6rk', 'x', 1, 2L, 1.5, None],
+                                  {'k': set([1, 2]), u'u': frozenset()},
+                                  True))
+    frame = encode('db-userbase', data)
+    assert frame[:1] == TAG_MARSHAL
+    assert decode(frame) == ('db-userbase', data)
+
+
+def test_db_unicode_subclass_pickled():
+    """ subclasses of builtin types are pickled, not corrupted. """
+    value = Text(u'bj\xf6rk')
+    frame = encode('db-userbase', ('attrs', '__setitem__', ('k', value)))
+    assert frame[:1] == PICKLE_PROTO
+    event, data = decode(frame)
+    assert event == 'db-userbase'
+    assert data[2][1] == value
+    assert type(data[2][1]) is Text
+
+
+def test_db_bytearray_and_array_keep_type():
+    """ types marshal returns as str are pickled. """
+    for value in (bytearray(b'abc'), array.array('B', b'abc')):
+        _, data = roundtrip('db-x', ('t', '__setitem__', ('k', value)))
+        assert type(data[2][1]) is type(value)
+        assert data[2][1] == value
+
+
+def test_db_nested_subclass_pickled():
+    """ a subclass nested in containers is found. """
+    data = {'k': [(1, Text(u'x'))]}
+    frame = encode('db-x', data)
+    assert frame[:1] == PICKLE_PROTO
+    assert type(decode(frame)[1]['k'][0][1]) is Text
+
+
+def test_recursive_container_pickled():
+    """ a recursive list is pickled, rather than walked forever. """
+    data = [1]
+    data.append(data)
+    event, value = roundtrip('db-x', data)
+    assert event == 'db-x'
+    assert value[1] is value
+
+
+def test_exception_pickled():
+    """ other events and values are pickled. """
+    event, value = roundtrip('exception', KeyError('k'))
+    assert event == 'exception'
+    assert isinstance(value, KeyError)
+
+
+def test_unknown_frame():
+    """ frames of an unknown tag raise ValueError. """
+    with pytest.raises(ValueError):
+        decode(b'Zdata')
+    with pytest.raises(ValueError):
+        decode(b'')
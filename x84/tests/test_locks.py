@@ -0,0 +1,200 @@
+""" Tests of :mod:`x84.locks`. """
+# std imports
+import time
+
+# 3rd party
+import pytest
+
+# local
+import x84.terminal
+import x84.timers
+from x84.locks import LockTable
+
+
+class Pipe(object):
+
+    """ Stands in for the session's pipe, keeping events sent. """
+
+    def __init__(self):
+        self.events = list()
+
+    def send(self, event):
+        """ Keep ``event``. """
+        self.events.append(event)
+
+
+class TTY(object):
+
+    """ Stands in for :class:`x84.terminal.TerminalProcess`. """
+    # pylint: disable=R0903
+    #         Too few public methods
+
+    def __init__(self, sid):
+        self.sid = sid
+        self.master_write = Pipe()
+
+    def answers(self):
+        """ Return and clear events sent. """
+        events, self.master_write.events = self.master_write.events, list()
+        return events
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Time, as a list of one value, advanced by the test. """
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    monkeypatch.setattr(x84.timers, 'TIMERS', x84.timers.TimerWheel())
+    return now
+
+
+@pytest.fixture
+def ttys(monkeypatch):
+    """ Sessions a, b and c, registered. """
+    terminals = dict((sid, TTY(sid)) for sid in 'abc')
+    monkeypatch.setattr(x84.terminal, 'TERMINALS', dict(terminals))
+    return terminals
+
+
+def test_fifo(clock, ttys):
+    """ waiting sessions are granted the lock in turn. """
+    locks = LockTable()
+    a, b, c = ttys['a'], ttys['b'], ttys['c']
+    locks.acquire(a, 'lock-x')
+    locks.acquire(b, 'lock-x', timeout=None)
+    locks.acquire(c, 'lock-x', timeout=None)
+    assert a.answers() == [('lock-x', True)]
+    assert b.answers() == c.answers() == []
+    locks.release(a, 'lock-x')
+    assert b.answers() == [('lock-x', True)]
+    assert c.answers() == []
+    locks.release(b, 'lock-x')
+    assert c.answers() == [('lock-x', True)]
+    assert locks.holder('lock-x') == 'c'
+
+
+def test_busy(clock, ttys):
+    """ without a timeout, a held lock is answered False. """
+    locks = LockTable()
+    locks.acquire(ttys['a'], 'lock-x')
+    locks.acquire(ttys['b'], 'lock-x')
+    assert ttys['b'].answers() == [('lock-x', False)]
+    locks.acquire(ttys['a'], 'lock-x')
+    assert ttys['a'].answers() == [('lock-x', True), ('lock-x', True)]
+
+
+def test_timeout(clock, ttys):
+    """ a session waiting longer than its timeout is answered False. """
+    locks = LockTable()
+    a, b = ttys['a'], ttys['b']
+    locks.acquire(a, 'lock-x')
+    locks.acquire(b, 'lock-x', timeout=1)
+    clock[0] += 0.5
+    x84.timers.TIMERS.advance()
+    assert b.answers() == []
+    clock[0] += 0.6
+    x84.timers.TIMERS.advance()
+    assert b.answers() == [('lock-x', False)]
+    locks.release(a, 'lock-x')
+    assert b.answers() == []
+    assert locks.holder('lock-x') is None
+
+
+def test_stale_granted_in_turn(clock, ttys):
+    """ a stale lock goes to the session waiting, before the caller. """
+    locks = LockTable()
+    a, b, c = ttys['a'], ttys['b'], ttys['c']
+    locks.acquire(a, 'lock-x')
+    locks.acquire(b, 'lock-x', timeout=None)
+    clock[0] += 10
+    locks.acquire(c, 'lock-x', stale=5)
+    assert b.answers() == [('lock-x', True)]
+    assert c.answers() == [('lock-x', False)]
+    assert locks.holder('lock-x') == 'b'
+
+
+def test_stale_takeover(clock, ttys):
+    """ a stale lock with none waiting goes to the caller. """
+    locks = LockTable()
+    locks.acquire(ttys['a'], 'lock-x')
+    clock[0] += 10
+    locks.acquire(ttys['c'], 'lock-x', stale=5)
+    assert ttys['c'].answers() == [('lock-x', True)]
+    assert locks.holder('lock-x') == 'c'
+
+
+def test_stale_expired_by_timer(clock, ttys):
+    """ a lock held past the stale value of a waiter is released to it. """
+    locks = LockTable()
+    locks.acquire(ttys['a'], 'lock-x')
+    locks.acquire(ttys['b'], 'lock-x', stale=2, timeout=None)
+    clock[0] += 2.1
+    x84.timers.TIMERS.advance()
+    assert ttys['b'].answers() == [('lock-x', True)]
+
+
+def test_ended_holder_granted_in_turn(clock, ttys):
+    """ a lock of a session ended goes to the session waiting. """
+    locks = LockTable()
+    locks.acquire(ttys['a'], 'lock-x')
+    locks.acquire(ttys['b'], 'lock-x', timeout=None)
+    del x84.terminal.TERMINALS['a']
+    locks.acquire(ttys['c'], 'lock-x')
+    assert ttys['b'].answers() == [('lock-x', True)]
+    assert ttys['c'].answers() == [('lock-x', False)]
+
+
+def test_release_all(clock, ttys):
+    """ locks of a session ended are granted to those waiting. """
+    locks = LockTable()
+    locks.acquire(ttys['a'], 'lock-x')
+    locks.acquire(ttys['a'], 'lock-y')
+    locks.acquire(ttys['b'], 'lock-y', timeout=None)
+    locks.release_all('a')
+    assert ttys['b'].answers() == [('lock-y', True)]
+    assert locks.holder('lock-x') is None
+
+
+def test_allocate(clock, ttys):
+    """ the lowest free node of a pool is allocated. """
+    locks = LockTable()
+    a, b, c = ttys['a'], ttys['b'], ttys['c']
+    locks.allocate(a, 'lock-node', 1, 2)
+    locks.allocate(b, 'lock-node', 1, 2)
+    locks.allocate(a, 'lock-node', 1, 2)
+    locks.allocate(c, 'lock-node', 1, 2)
+    assert a.answers() == [('lock-node', 1), ('lock-node', 1)]
+    assert b.answers() == [('lock-node', 2)]
+    assert c.answers() == [('lock-node', None)]
+    assert locks.node_map('lock-node') == {1: 'a', 2: 'b'}
+    locks.release(a, 'lock-node/1')
+    locks.allocate(c, 'lock-node', 1, 2)
+    assert c.answers() == [('lock-node', 1)]
+    del x84.terminal.TERMINALS['b']
+    assert locks.node_map('lock-node') == {1: 'c'}
+
+
+def test_closed_pipe_granted_in_turn(clock, ttys, monkeypatch):
+    """ a session whose pipe is closed is killed, its lock goes on. """
+    locks = LockTable()
+    a, b, c = ttys['a'], ttys['b'], ttys['c']
+    killed = list()
+
+    def kill_session(client, reason='killed'):
+        killed.append(client)
+        del x84.terminal.TERMINALS[client]
+        locks.release_all(client)
+
+    def send(event):
+        raise IOError('pipe closed')
+
+    monkeypatch.setattr(x84.terminal, 'kill_session', kill_session)
+    b.client = 'b'
+    locks.acquire(a, 'lock-x')
+    locks.acquire(b, 'lock-x', timeout=None)
+    locks.acquire(c, 'lock-x', timeout=None)
+    b.master_write.send = send
+    locks.release(a, 'lock-x')
+    assert killed == ['b']
+    assert c.answers() == [('lock-x', True)]
+    assert locks.holder('lock-x') == 'c'
@@ -0,0 +1,105 @@
+""" Tests of :mod:`x84.poller`. """
+# std imports
+import threading
+import select
+import time
+import os
+
+# 3rd party
+import pytest
+
+# local
+from x84.poller import Poller, READ, WRITE
+
+
+@pytest.fixture(params=['epoll', 'poll', 'select'])
+def poller(request, monkeypatch):
+    """ A :class:`Poller` of each kind, as where the others are missing. """
+    kinds = ['epoll', 'poll', 'select']
+    for kind in kinds[:kinds.index(request.param)]:
+        monkeypatch.delattr(select, kind, raising=False)
+    if request.param != 'select' and not hasattr(select, request.param):
+        pytest.skip('{0} not available'.format(request.param))
+    _poller = Poller()
+    assert _poller.kind == request.param
+    return _poller
+
+
+@pytest.fixture
+def pipe(request):
+    """ An os.pipe(), ``(read_fd, write_fd)``, closed after. """
+    fds = os.pipe()
+
+    def close():
+        """ Close both ends, if still open. """
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+    request.addfinalizer(close)
+    return fds
+
+
+def test_readable(poller, pipe):
+    """ a registered file descriptor is returned once ready for reading. """
+    read_fd, write_fd = pipe
+    poller.register(read_fd)
+    assert poller.is_registered(read_fd)
+    assert poller.poll(0) == ([], [])
+    os.write(write_fd, b'x')
+    assert poller.poll(1) == ([read_fd], [])
+    assert poller.is_readable(read_fd)
+    os.read(read_fd, 1)
+    assert poller.poll(0) == ([], [])
+    assert not poller.is_readable(read_fd)
+
+
+def test_writable(poller, pipe):
+    """ the event mask of a file descriptor may be modified. """
+    _, write_fd = pipe
+    poller.register(write_fd, WRITE)
+    assert poller.poll(1) == ([], [write_fd])
+    poller.modify(write_fd, READ)
+    assert poller.poll(0) == ([], [])
+
+
+def test_unregister(poller, pipe):
+    """ an unregistered file descriptor is no longer returned. """
+    read_fd, write_fd = pipe
+    poller.register(read_fd)
+    os.write(write_fd, b'x')
+    poller.unregister(read_fd)
+    assert not poller.is_registered(read_fd)
+    assert poller.poll(0) == ([], [])
+    # unregistering again is harmless.
+    poller.unregister(read_fd)
+
+
+def test_hangup_is_readable(poller, pipe):
+    """ a pipe whose other end is closed is ready, recv() finds EOF. """
+    read_fd, write_fd = pipe
+    poller.register(read_fd)
+    os.close(write_fd)
+    assert poller.poll(1) == ([read_fd], [])
+
+
+def test_wakeup(poller):
+    """ wakeup() returns a poll blocked in another thread. """
+    result = list()
+    thread = threading.Thread(target=lambda: result.append(poller.poll()))
+    thread.daemon = True
+    thread.start()
+    time.sleep(0.05)
+    poller.wakeup()
+    thread.join(2)
+    assert result == [([], [])]
+    # the self-pipe is drained: the next poll does not return at once.
+    assert poller.poll(0) == ([], [])
+
+
+def test_wakeup_pipe_full(poller):
+    """ wakeup() does not block once its pipe is full. """
+    for _ in range(100000):
+        poller.wakeup()
+    assert poller.poll(0) == ([], [])
@@ -0,0 +1,85 @@
+""" Tests of :mod:`x84.ring`, and ring output of session streams. """
+# local
+from x84.ring import OutputRing
+from x84.framing import decode
+
+
+class Writer(object):
+
+    """ Stands in for the session's pipe, keeping frames sent. """
+
+    def __init__(self):
+        self.frames = list()
+
+    def send_bytes(self, frame):
+        """ Keep ``frame``. """
+        self.frames.append(frame)
+
+
+def test_write_read():
+    """ bytes written are read once. """
+    ring = OutputRing(8)
+    assert ring.empty()
+    assert ring.write(b'abc')
+    assert not ring.empty()
+    assert ring.read() == b'abc'
+    assert ring.empty()
+    assert ring.read() == b''
+
+
+def test_read_length():
+    """ read(length) reads at most that many bytes. """
+    ring = OutputRing(8)
+    ring.write(b'abc')
+    ring.write(b'de')
+    assert ring.read(3) == b'abc'
+    assert ring.read(10) == b'de'
+
+
+def test_wrap():
+    """ writes and reads wrap around the end of the ring. """
+    ring = OutputRing(8)
+    for _ in range(5):
+        assert ring.write(b'abcde')
+        assert ring.read(2) == b'ab'
+        assert ring.read() == b'cde'
+    assert ring.empty()
+
+
+def test_overflow():
+    """ a write with no room fails, and writes nothing. """
+    ring = OutputRing(8)
+    assert ring.write(b'abcdef')
+    assert not ring.write(b'ghi')
+    assert ring.read() == b'abcdef'
+    assert ring.write(b'ghijklmn')
+    assert not ring.write(b'o')
+    assert ring.read() == b'ghijklmn'
+
+
+def test_stream_keeps_order():
+    """ output sent by pipe is not overtaken by later output of the ring. """
+    from x84.bbs.ipc import IPCStream
+    ring = OutputRing(8)
+    writer = Writer()
+    stream = IPCStream(writer, ring=ring)
+    received = list()
+
+    def engine_recv():
+        """ Handle the first frame waiting, as the engine would. """
+        event, data = decode(writer.frames.pop(0))
+        if event == 'output-ring':
+            received.append(ring.read(data))
+        else:
+            received.append(data[0])
+
+    for text in (u'AAA', u'BBB', u'CCCC'):
+        stream.write(text)
+        stream.flush()
+    engine_recv()
+    stream.write(u'DD')
+    stream.flush()
+    while writer.frames:
+        engine_recv()
+    assert b''.join(received) == b'AAABBBCCCCDD'
+    assert ring.empty()
@@ -0,0 +1,148 @@
+""" Tests of the coordinator of :mod:`x84.shard`. """
+# 3rd party
+import pytest
+
+# local
+import x84.bbs.ini
+import x84.poller
+import x84.timers
+import x84.locks
+import x84.presence
+import x84.terminal
+from x84.shard import Coordinator, RemoteTerminal
+
+
+class Shard(object):
+
+    """ Stands in for :class:`x84.shard.Shard`, keeping events sent. """
+
+    exited = None
+
+    def __init__(self, shard_no):
+        self.shard_no = shard_no
+        self.events = list()
+
+    def fileno(self):
+        """ Shard number, standing in for its file descriptor. """
+        return self.shard_no
+
+    def send(self, event, data):
+        """ Keep ``(event, data)``. """
+        self.events.append((event, data))
+
+    def sent(self):
+        """ Return and clear events sent. """
+        events, self.events = self.events, list()
+        return events
+
+
+@pytest.fixture
+def coordinator(monkeypatch):
+    """ A :class:`Coordinator` of three shards, 0 to 2. """
+    monkeypatch.setattr(x84.bbs.ini, 'CFG', x84.bbs.ini.init_bbs_ini())
+    monkeypatch.setattr(x84.terminal, 'TERMINALS', dict())
+    monkeypatch.setattr(x84.presence, 'PRESENCE', dict())
+    monkeypatch.setattr(x84.poller, 'POLLER', x84.poller.Poller())
+    monkeypatch.setattr(x84.timers, 'TIMERS', x84.timers.TimerWheel())
+    monkeypatch.setattr(x84.locks, 'LOCKS', None)
+    _coordinator = Coordinator(num_shards=3)
+    _coordinator.shards = dict((shard_no, Shard(shard_no))
+                               for shard_no in range(3))
+    for sid, shard_no in (('a', 0), ('b', 1), ('c', 1)):
+        _coordinator.dispatch(_coordinator.shards[shard_no],
+                              'session-add', sid)
+    return _coordinator
+
+
+def test_session_add(coordinator):
+    """ sessions of shards are recorded as :class:`RemoteTerminal`. """
+    tty = x84.terminal.find_tty_by_sid('b')
+    assert isinstance(tty, RemoteTerminal)
+    assert tty.shard is coordinator.shards[1]
+
+
+def test_route(coordinator):
+    """ 'route' is delivered by the shard owning the target session. """
+    shards = coordinator.shards
+    coordinator.dispatch(shards[0], 'route', ('b', 'page', 'a', 'hi'))
+    coordinator.dispatch(shards[0], 'route', ('z', 'page', 'a', 'hi'))
+    assert shards[1].sent() == [('deliver', ('b', 'page', ('a', 'hi')))]
+    assert shards[0].sent() == shards[2].sent() == []
+
+
+def test_remote_disconnect(coordinator):
+    """ 'remote-disconnect' is sent to the shard owning the session. """
+    shards = coordinator.shards
+    coordinator.dispatch(shards[0], 'remote-disconnect', ('c', 'bye'))
+    assert shards[1].sent() == [('remote-disconnect', ('c', 'bye'))]
+    assert shards[0].sent() == shards[2].sent() == []
+
+
+def test_relay_to_others(coordinator):
+    """ 'global', 'publish' and 'presence' are sent to every other shard. """
+    shards = coordinator.shards
+    coordinator.dispatch(shards[1], 'global', ('b', 'AYT'))
+    coordinator.dispatch(shards[1], 'presence', ('b', {'handle': 'x'}))
+    for shard_no in (0, 2):
+        assert shards[shard_no].sent() == [
+            ('global', ('b', 'AYT')), ('presence', ('b', {'handle': 'x'}))]
+    assert shards[1].sent() == []
+    assert x84.presence.PRESENCE['b'] == {'handle': 'x'}
+
+
+def test_locks(coordinator):
+    """ 'lock-*' events are decided by the coordinator's lock table. """
+    shards = coordinator.shards
+    coordinator.dispatch(shards[0], 'lock-x', ('a', ('acquire', None)))
+    coordinator.dispatch(shards[1], 'lock-x', ('b', ('acquire', None, None)))
+    assert shards[0].sent() == [('deliver', ('a', 'lock-x', True))]
+    assert shards[1].sent() == []
+    coordinator.dispatch(shards[0], 'lock-x', ('a', ('release', None)))
+    assert shards[1].sent() == [('deliver', ('b', 'lock-x', True))]
+
+
+def test_session_del(coordinator):
+    """ locks of a session ended are granted to the next in line. """
+    shards = coordinator.shards
+    coordinator.dispatch(shards[0], 'lock-x', ('a', ('acquire', None)))
+    coordinator.dispatch(shards[1], 'lock-x', ('b', ('acquire', None, None)))
+    shards[0].sent()
+    coordinator.dispatch(shards[0], 'session-del', 'a')
+    assert x84.terminal.find_tty_by_sid('a') is None
+    assert shards[1].sent() == [('deliver', ('b', 'lock-x', True))]
+
+
+def test_remove_shard(coordinator):
+    """ a shard removed releases locks and presence of its sessions. """
+    shards = coordinator.shards
+    shard = shards[1]
+    coordinator.dispatch(shard, 'presence', ('b', {'handle': 'x'}))
+    coordinator.dispatch(shard, 'lock-x', ('b', ('acquire', None)))
+    coordinator.dispatch(shards[0], 'lock-x', ('a', ('acquire', None, None)))
+    for _shard in shards.values():
+        _shard.sent()
+    shard.exited = IOError('gone')
+    coordinator.remove_exited()
+    assert 1 not in coordinator.shards
+    assert x84.terminal.find_tty_by_sid('b') is None
+    assert x84.terminal.find_tty_by_sid('c') is None
+    assert 'b' not in x84.presence.PRESENCE
+    assert x84.locks.get_lock_table().holder('lock-x') == 'a'
+    events = dict((shard_no, shards[shard_no].sent()) for shard_no in (0, 2))
+    for shard_no in (0, 2):
+        assert ('presence', ('b', None)) in events[shard_no]
+        assert ('presence', ('c', None)) in events[shard_no]
+    assert ('deliver', ('a', 'lock-x', True)) in events[0]
+
+
+def test_remove_shard_cascade(coordinator):
+    """ a shard failing to receive notice of removal is removed too. """
+    shards = coordinator.shards
+
+    def fail(event, data):
+        """ Fail as a shard whose pipe is closed. """
+        shards[2].exited = IOError('gone too')
+    shards[2].send = fail
+    shards[1].exited = IOError('gone')
+    coordinator.remove_exited()
+    assert sorted(coordinator.shards) == [0]
@@ -0,0 +1,238 @@
+""" Tests of telnet negotiation in :mod:`x84.telnet`. """
+# std imports
+import random
+import time
+
+# 3rd party
+import pytest
+
+# local
+import x84.bbs  # NOQA
+import x84.telnet
+from x84.telnet import (
+    NegotiationHistory,
+    ConnectTelnet,
+    TelnetClient,
+    get_negotiation_stats,
+    IAC, SB, SE, NOP, DO, DONT, WILL, WONT,
+    BINARY, SGA, NAWS,
+)
+
+
+@pytest.fixture
+def history(monkeypatch):
+    """ A new, empty history of negotiations. """
+    _history = NegotiationHistory()
+    monkeypatch.setattr(x84.telnet, 'NEGOTIATION_HISTORY', _history)
+    return _history
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Time, as a list of one value, advanced by the test. """
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+class Client(object):
+
+    """ Telnet client replying only to those probes set by the test. """
+
+    TTYPE_UNDETECTED = 'unknown'
+    ENV_REPLIED = False
+    NAWS_REPLIED = False
+    addrport = '127.0.0.1:23'
+
+    def __init__(self):
+        self.env = {'TERM': self.TTYPE_UNDETECTED}
+        self.bytes_received = 0
+        self.refused = set()
+
+    def send_ready(self):
+        return False
+
+    def check_remote_option(self, option):
+        return False if option in self.refused else None
+
+    def check_local_option(self, option):
+        return None
+
+
+def make_connect(client, clock):
+    """ Return negotiation of ``client``, begun at the current time. """
+    connect = ConnectTelnet(client)
+    connect._answered = dict()
+    connect.start_time = clock[0]
+    connect.set_encoding = lambda: None
+    return connect
+
+
+def test_default_timeout(history):
+    """ the default is used until there are enough samples. """
+    for _ in range(history.MIN_SAMPLES - 1):
+        history.record('xterm', {'ttype': 0.1, 'naws': 0.2}, 0.2)
+    assert history.timeout('xterm', 'naws', 3.5) == 3.5
+    assert history.timeout('vt100', 'naws', 3.5) == 3.5
+
+
+def test_learned_timeout(history):
+    """ the learned timeout is the slowest reply, with margin. """
+    for latency in (0.1, 0.4, 0.2):
+        history.record('xterm', {'naws': latency}, latency)
+    expected = 0.4 * history.TIME_FACTOR + history.TIME_MARGIN
+    assert history.timeout('xterm', 'naws', 3.5) == pytest.approx(expected)
+    # but never more than the default.
+    assert history.timeout('xterm', 'naws', 0.5) == 0.5
+
+
+def test_unanswered_timeout(history):
+    """ probes never answered by a kind of client are not waited for. """
+    for _ in range(history.MIN_SAMPLES):
+        history.record('ansi-bbs', {'ttype': 0.1, 'env': None}, 0.1)
+    assert history.timeout('ansi-bbs', 'env', 3.5) == 0
+    assert history.timeout('ansi-bbs', 'ttype', 3.5) > 0
+
+
+def test_samples_bounded(history):
+    """ only the most recent outcomes of each probe are kept. """
+    for _ in range(history.SAMPLES):
+        history.record('xterm', {'env': 2.0}, 2.0)
+    for _ in range(history.SAMPLES):
+        history.record('xterm', {'env': None}, 0.1)
+    assert history.timeout('xterm', 'env', 3.5) == 0
+
+
+def test_stats(history):
+    """ get_negotiation_stats() returns what has been learned. """
+    history.record('xterm', {'ttype': 0.1, 'env': None}, 0.5)
+    history.record('xterm', {'ttype': 0.3, 'env': None}, 1.5)
+    history.record('xterm', {'ttype': 0.2, 'env': None}, 1.0)
+    stats = get_negotiation_stats()
+    assert stats.keys() == ['xterm']
+    assert stats['xterm']['count'] == 3
+    assert stats['xterm']['duration'] == pytest.approx(1.0)
+    assert stats['xterm']['probes']['ttype']['answered'] == 3
+    assert stats['xterm']['probes']['ttype']['samples'] == 3
+    assert stats['xterm']['probes']['ttype']['timeout'] == pytest.approx(
+        0.3 * history.TIME_FACTOR + history.TIME_MARGIN)
+    assert stats['xterm']['probes']['env'] == {
+        'answered': 0, 'samples': 3, 'timeout': 0}
+
+
+def test_negotiate_silent_client(history, clock):
+    """ a client that never speaks is not waited on past TIME_NEGOTIATE. """
+    connect = make_connect(Client(), clock)
+    assert connect.negotiate() is False
+    assert connect.deadline == clock[0] + connect.TIME_NEGOTIATE
+    clock[0] = connect.deadline
+    assert connect.negotiate() is True
+    # nothing is learned of a client without fingerprint.
+    assert get_negotiation_stats() == {}
+
+
+def test_negotiate_early_finish(history, clock):
+    """ negotiation completes as soon as every probe is answered. """
+    client = Client()
+    connect = make_connect(client, clock)
+    client.bytes_received = 10
+    client.env['TERM'] = 'xterm'
+    clock[0] += 0.1
+    assert connect.negotiate() is False
+    assert connect.deadline == connect.start_time + connect.TIME_WAIT_STAGE
+    client.ENV_REPLIED = True
+    client.refused.add(NAWS)
+    clock[0] += 0.1
+    assert connect.negotiate() is True
+    probes = get_negotiation_stats()['xterm']['probes']
+    assert probes['ttype']['answered'] == 1
+    assert probes['env']['answered'] == 1
+    assert probes['naws']['answered'] == 1
+
+
+def test_negotiate_learned(history, clock):
+    """ probes a kind of client never answers are no longer waited for. """
+    for _ in range(history.MIN_SAMPLES):
+        history.record('ansi-bbs', {'ttype': 0.1, 'env': None,
+                                    'naws': 0.2}, 3.5)
+    client = Client()
+    client.bytes_received = 10
+    client.env['TERM'] = 'ansi-bbs'
+    connect = make_connect(client, clock)
+    clock[0] += 0.1
+    # naws is waited for, upto its learned timeout,
+    assert connect.negotiate() is False
+    assert connect.deadline == pytest.approx(
+        connect.start_time + 0.2 * history.TIME_FACTOR + history.TIME_MARGIN)
+    # but env is not, once naws is answered.
+    client.NAWS_REPLIED = True
+    clock[0] += 0.1
+    assert connect.negotiate() is True
+
+
+class ScanClient(TelnetClient):
+
+    """ Telnet client recording the sub-negotiations it receives. """
+
+    def __init__(self):
+        TelnetClient.__init__(self, sock=None, address_pair=('127.0.0.1', 23))
+        self.sub_negotiations = list()
+
+    def _sb_decoder(self):
+        self.sub_negotiations.append(self.telnet_sb_buffer.tostring())
+
+
+def buffered(client):
+    """ Return bytes buffered for sending to ``client``. """
+    if not len(client.send_buffer):
+        return ''
+    return client.send_buffer.view().tobytes()
+
+
+def random_stream(rand, size):
+    """ Return ``size`` random parts of plain data and IAC sequences. """
+    plain = [chr(_byte) for _byte in range(255)]
+    parts = list()
+    for _ in range(size):
+        kind = rand.choice(('plain', 'escape', 'command', 'option', 'sb'))
+        if kind == 'plain':
+            parts.append(''.join(rand.choice(plain)
+                                 for _ in range(rand.randint(1, 40))))
+        elif kind == 'escape':
+            parts.append(IAC + IAC)
+        elif kind == 'command':
+            parts.append(IAC + NOP)
+        elif kind == 'option':
+            parts.append(IAC + rand.choice((DO, DONT, WILL, WONT)) +
+                         rand.choice((BINARY, SGA)))
+        else:
+            # sub-negotiation of an unsupported option, possibly empty,
+            # with escaped IAC bytes.
+            payload = ''.join(rand.choice(plain + [IAC + IAC])
+                              for _ in range(rand.randint(0, 20)))
+            parts.append(IAC + SB + payload + IAC + SE)
+    return ''.join(parts)
+
+
+def test_iac_scan_matches_sniffer():
+    """ _iac_scan() of random splits equals _iac_sniffer() of each byte. """
+    rand = random.Random(1984)
+    for _ in range(200):
+        data = random_stream(rand, rand.randint(1, 30))
+        expected = ScanClient()
+        for byte in data:
+            expected._iac_sniffer(byte)
+
+        # the same data, received in buffers split at random.
+        given = ScanClient()
+        idx = 0
+        while idx < len(data):
+            end = idx + rand.randint(1, 16)
+            given._iac_scan(data[idx:end])
+            idx = end
+
+        assert given.recv_buffer == expected.recv_buffer
+        assert given.sub_negotiations == expected.sub_negotiations
+        assert buffered(given) == buffered(expected)
+        assert (given.telnet_got_iac, given.telnet_got_sb,
+                given.telnet_got_cmd) == (False, False, None)
@@ -0,0 +1,145 @@
+""" Tests of session registry indices of :mod:`x84.terminal`. """
+# std imports
+import multiprocessing
+import socket
+
+# 3rd party
+import pytest
+
+# local
+import x84.bbs.ini
+import x84.poller
+import x84.timers
+import x84.locks
+import x84.terminal
+from x84.terminal import (TerminalProcess, register_tty, unregister_tty,
+                          kill_session, find_tty, find_tty_by_sid,
+                          find_tty_by_fd, find_client, subscribe)
+
+
+class Client(object):
+
+    """ Stands in for :class:`x84.client.BaseClient` of a socket. """
+
+    def __init__(self):
+        self.sock, self.peer = socket.socketpair()
+        self.active = True
+
+    def fileno(self):
+        """ Return file descriptor, None once closed. """
+        return None if not self.active else self.sock.fileno()
+
+    def idle(self):
+        """ Seconds idle. """
+        return 0
+
+    def shutdown(self):
+        """ Close socket. """
+        self.active = False
+        self.sock.close()
+
+    def deactivate(self):
+        """ Mark inactive. """
+        self.active = False
+
+
+@pytest.fixture(autouse=True)
+def engine(monkeypatch):
+    """ Empty indices, and a poller, timer wheel and lock table of them. """
+    monkeypatch.setattr(x84.bbs.ini, 'CFG', x84.bbs.ini.init_bbs_ini())
+    for name in ('TERMINALS', 'TTY_FDS', 'CLIENT_TTYS', 'CLIENT_FDS',
+                 'TOPICS'):
+        monkeypatch.setattr(x84.terminal, name, dict())
+    monkeypatch.setattr(x84.poller, 'POLLER', x84.poller.Poller())
+    monkeypatch.setattr(x84.timers, 'TIMERS', x84.timers.TimerWheel())
+    monkeypatch.setattr(x84.locks, 'LOCKS', None)
+
+
+def make_tty(sid):
+    """ Return new :class:`TerminalProcess` of session ``sid``. """
+    master_read, child_write = multiprocessing.Pipe(duplex=False)
+    child_read, master_write = multiprocessing.Pipe(duplex=False)
+    tty = TerminalProcess(Client(), sid, (master_write, master_read))
+    tty.child = (child_read, child_write)
+    return tty
+
+
+def assert_consistent():
+    """ Every index refers to the same registered sessions. """
+    terminals = x84.terminal.TERMINALS
+    poller = x84.poller.POLLER
+    assert set(x84.terminal.CLIENT_TTYS.values()) == set(terminals.values())
+    assert set(x84.terminal.TTY_FDS.values()) == set(terminals.values())
+    for sid, tty in terminals.items():
+        assert tty.sid == sid
+        assert find_tty(tty.client) is tty
+        assert find_tty_by_fd(tty.fd) is tty
+        assert find_client(tty.client.fileno()) is tty.client
+        assert poller.is_registered(tty.fd)
+        assert poller.is_registered(tty.client.fileno())
+    # clients of sessions unregistered are polled until the engine finds
+    # them inactive, and kills them.
+    assert set(client for client in x84.terminal.CLIENT_FDS.values()
+               if client.active) == set(tty.client
+                                        for tty in terminals.values())
+
+
+def test_register():
+    """ a session is found by session-id, client and file descriptors. """
+    ttys = [make_tty(sid) for sid in ('a', 'b', 'c')]
+    for tty in ttys:
+        register_tty(tty)
+    assert find_tty_by_sid('b') is ttys[1]
+    assert_consistent()
+
+
+def test_unregister():
+    """ a session unregistered is removed from every index. """
+    ttys = [make_tty(sid) for sid in ('a', 'b')]
+    for tty in ttys:
+        register_tty(tty)
+    subscribe(ttys[0], 'oneliner')
+    fd, client_fd = ttys[0].fd, ttys[0].client.fileno()
+    unregister_tty(ttys[0])
+    assert find_tty_by_sid('a') is None
+    assert find_tty_by_fd(fd) is None
+    assert not x84.poller.POLLER.is_registered(fd)
+    assert 'oneliner' not in x84.terminal.TOPICS
+    assert not ttys[0].client.active
+    assert_consistent()
+    kill_session(ttys[0].client, 'socket shutdown')
+    assert find_client(client_fd) is None
+    assert_consistent()
+
+
+def test_kill_session():
+    """ a session killed is removed from every index, its socket too. """
+    ttys = [make_tty(sid) for sid in ('a', 'b')]
+    for tty in ttys:
+        register_tty(tty)
+    client_fd = ttys[1].client.fileno()
+    x84.locks.get_lock_table().acquire(ttys[1], 'lock-x')
+    kill_session(ttys[1].client, 'test')
+    assert find_tty(ttys[1].client) is None
+    assert find_client(client_fd) is None
+    assert not x84.poller.POLLER.is_registered(client_fd)
+    assert x84.locks.get_lock_table().holder('lock-x') is None
+    assert_consistent()
+    # the session is sent Disconnected, after the lock it was granted.
+    child_read = ttys[1].child[0]
+    events = list()
+    try:
+        while child_read.poll():
+            events.append(child_read.recv()[0])
+    except EOFError:
+        pass
+    assert events == ['lock-x', 'exception']
+
+
+def test_kill_unregistered():
+    """ killing a client of no session closes only its socket. """
+    client = Client()
+    x84.terminal.register_client(client)
+    kill_session(client, 'test')
+    assert not x84.terminal.CLIENT_FDS
+    assert_consistent()
@@ -0,0 +1,105 @@
+""" Tests of :mod:`x84.timers`. """
+# std imports
+import time
+
+# 3rd party
+import pytest
+
+# local
+from x84.timers import TimerWheel
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """ Time, as a list of one value, advanced by the test. """
+    now = [1000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    return now
+
+
+def run_until(wheel, clock, seconds):
+    """ Advance ``wheel`` tick by tick for ``seconds``. """
+    start = clock[0]
+    for tick in range(1, int(round(seconds / wheel.TICK)) + 1):
+        # just after each tick begins, despite rounding.
+        clock[0] = start + tick * wheel.TICK + 1e-9
+        wheel.advance()
+
+
+def test_expires_at_deadline(clock):
+    """ a timer is called at the first tick on or after its deadline. """
+    wheel = TimerWheel()
+    fired = list()
+    wheel.schedule(0.12, fired.append, 'x')
+    run_until(wheel, clock, 0.1)
+    assert fired == []
+    run_until(wheel, clock, 0.05)
+    assert fired == ['x']
+    assert wheel.count == 0
+    assert wheel.get_timeout() is None
+
+
+def test_cascade(clock):
+    """ timers of outer wheels are emptied inward, and called in order. """
+    wheel = TimerWheel()
+    fired = list()
+    start = clock[0]
+    inner = wheel.TICK * wheel.SLOTS
+    delays = (0.5, inner - 0.01, inner + 0.3, inner * 5.5,
+              inner * wheel.SLOTS + 1, inner * wheel.SLOTS * 2.2)
+    for delay in reversed(delays):
+        wheel.schedule(delay, lambda d=delay: fired.append(
+            (d, time.time() - start)))
+    run_until(wheel, clock, delays[-1] + 1)
+    assert [delay for delay, _ in fired] == list(delays)
+    for delay, elapsed in fired:
+        # never early, and no later than the tick it falls within.
+        assert delay <= elapsed + 1e-6 < delay + wheel.TICK + 1e-6
+    assert wheel.count == 0
+
+
+def test_beyond_outermost(clock):
+    """ a timer beyond the outermost wheel is kept until near. """
+    wheel = TimerWheel()
+    wheel.wheels = [[list() for _ in range(wheel.SLOTS)]
+                    for _ in range(2)]
+    wheel.LEVELS = 2
+    fired = list()
+    span = wheel.TICK * wheel.SLOTS ** 2
+    wheel.schedule(span * 3 + 0.5, fired.append, 'x')
+    run_until(wheel, clock, span * 3)
+    assert fired == []
+    run_until(wheel, clock, 0.6)
+    assert fired == ['x']
+
+
+def test_cancel(clock):
+    """ a cancelled timer is not called. """
+    wheel = TimerWheel()
+    fired = list()
+    wheel.schedule(0.1, fired.append, 'a').cancel()
+    wheel.schedule(10, fired.append, 'b').cancel()
+    wheel.schedule(0.2, fired.append, 'c')
+    run_until(wheel, clock, 11)
+    assert fired == ['c']
+    assert wheel.count == 0
+
+
+def test_get_timeout(clock):
+    """ the poll timeout reaches the next timer, or the wheel's turn. """
+    wheel = TimerWheel()
+    assert wheel.get_timeout() is None
+    wheel.schedule(0.2, lambda: None)
+    assert 0 < wheel.get_timeout() <= 0.2 + wheel.TICK
+    wheel.schedule(0.01, lambda: None)
+    assert wheel.get_timeout() <= 0.01 + wheel.TICK
+
+
+def test_callback_error(clock):
+    """ an exception of one callback does not prevent others. """
+    wheel = TimerWheel()
+    fired = list()
+    wheel.schedule(0.1, lambda: 1 / 0)
+    wheel.schedule(0.1, fired.append, 'x')
+    run_until(wheel, clock, 0.2)
+    assert fired == ['x']
@@ -0,0 +1,178 @@
+"""
+Engine timer wheel for x/84, https://github.com/jquast/x84
+
+Timed work of the engine, such as kicking idle sessions, deadlines of
+on-connect negotiation, waiting for locks, expiring fail2ban records and
+timers of scripts (see :meth:`x84.bbs.session.Session.start_timer`), is
+scheduled on a hierarchical timer wheel.  The engine's main loop polls no
+longer than :meth:`TimerWheel.get_timeout` and then calls
+:meth:`TimerWheel.advance`, so that each pass costs in proportion to the
+number of timers expiring, not to the number of sessions.
+
+The innermost wheel has :attr:`TimerWheel.SLOTS` slots of
+:attr:`TimerWheel.TICK` seconds.  Each outer wheel has as many slots, each
+spanning a full turn of the wheel within it: when a wheel turns, the next
+slot of the wheel outside of it is emptied into it.  Timers expire at the
+first tick on or after their deadline, never early.
+"""
+# std imports
+import logging
+import time
+
+#: singleton instance of :class:`TimerWheel`.
+TIMERS = None
+
+
+class Timer(object):
+
+    """ A callback scheduled by :meth:`TimerWheel.schedule`. """
+    # pylint: disable=R0903
+    #         Too few public methods
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """ Do not call this timer's callback. """
+        self.cancelled = True
+
+
+class TimerWheel(object):
+
+    """
+    Hierarchical timer wheel.
+    """
+
+    #: seconds of each slot of the innermost wheel.
+    TICK = 0.05
+
+    #: slots of each wheel.
+    SLOTS = 64
+
+    #: number of wheels, spanning TICK * SLOTS ** LEVELS seconds.  Timers
+    #: beyond are kept in the last slot of the outermost wheel until near.
+    LEVELS = 4
+
+    def __init__(self):
+        self.log = logging.getLogger(__name__)
+        self.wheels = [[list() for _ in range(self.SLOTS)]
+                       for _ in range(self.LEVELS)]
+        #: number of the next tick to expire.
+        self.tick = self._now_tick()
+        #: number of timers scheduled, including those cancelled.
+        self.count = 0
+
+    def _now_tick(self):
+        """ Return number of the last tick that has begun. """
+        return int(time.time() // self.TICK)
+
+    def _tick_of(self, deadline):
+        """ Return number of the first tick beginning on or after deadline. """
+        return -int(-deadline // self.TICK)
+
+    def schedule(self, delay, callback, *args):
+        """
+        Call ``callback(*args)`` in ``delay`` seconds, returns :class:`Timer`.
+        """
+        return self.schedule_at(time.time() + delay, callback, *args)
+
+    def schedule_at(self, deadline, callback, *args):
+        """
+        Call ``callback(*args)`` at time ``deadline``, returns :class:`Timer`.
+        """
+        if not self.count:
+            # nothing is scheduled, skip the ticks that have passed.
+            self.tick = self._now_tick()
+        timer = Timer(deadline, callback, args)
+        self._insert(timer)
+        self.count += 1
+        return timer
+
+    def _insert(self, timer):
+        """ Place ``timer`` in the slot of the wheel spanning its deadline. """
+        target = max(self._tick_of(timer.deadline), self.tick)
+        ticks = target - self.tick
+        span = 1
+        for level in range(self.LEVELS):
+            if ticks < span * self.SLOTS:
+                self.wheels[level][(target // span) % self.SLOTS].append(timer)
+                return
+            span *= self.SLOTS
+        # beyond the outermost wheel: kept in its slot emptied next.
+        span //= self.SLOTS
+        self.wheels[-1][(self.tick // span + 1) % self.SLOTS].append(timer)
+
+    def advance(self):
+        """
+        Call callbacks of all timers whose deadline has been reached.
+        """
+        now_tick = self._now_tick()
+        while self.count and self.tick <= now_tick:
+            self._cascade()
+            slot = self.wheels[0][self.tick % self.SLOTS]
+            self.wheels[0][self.tick % self.SLOTS] = list()
+            self.tick += 1
+            for timer in slot:
+                self.count -= 1
+                if timer.cancelled:
+                    continue
+                try:
+                    timer.callback(*timer.args)
+                # pylint: disable=W0703
+                #         Catching too general exception
+                except Exception as err:
+                    self.log.exception(err)
+        if not self.count:
+            self.tick = now_tick + 1
+
+    def _cascade(self):
+        """
+        At each turn of a wheel, empty the next slot of the wheel outside
+        of it into it.
+        """
+        span = 1
+        for level in range(1, self.LEVELS):
+            span *= self.SLOTS
+            if self.tick % span:
+                return
+            index = (self.tick // span) % self.SLOTS
+            timers = self.wheels[level][index]
+            self.wheels[level][index] = list()
+            for timer in timers:
+                if not timer.cancelled:
+                    self._insert(timer)
+                else:
+                    self.count -= 1
+
+    def get_timeout(self):
+        """
+        Returns seconds until the next tick that may expire a timer.
+
+        None is returned if no timers are scheduled.
+        """
+        if not self.count:
+            return None
+        inner = self.wheels[0]
+        remaining = self.SLOTS - self.tick % self.SLOTS
+        for offset in range(remaining):
+            # wake at the turn of the innermost wheel, when timers of
+            # outer wheels are emptied into it.
+            if inner[(self.tick + offset) % self.SLOTS] or not (
+                    self.tick + offset) % self.SLOTS:
+                break
+        else:
+            offset = remaining
+        return max(0, (self.tick + offset) * self.TICK - time.time())
+
+
+def get_timer_wheel():
+    """ Return the :class:`TimerWheel`, created on first use. """
+    # pylint: disable=W0603
+    #         Using the global statement
+    global TIMERS
+    if TIMERS is None:
+        TIMERS = TimerWheel()
+    return TIMERS